@@ -0,0 +1,100 @@
+"""
+On-disk cache for translation results.
+
+Entries are JSON files named after the hash of everything that went into
+producing them. The store is bounded in size; when it grows beyond
+max_bytes the least recently used entries are removed.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+
+def file_hash(fileName):
+    """
+    Hash the contents of a file.
+    """
+    digest = hashlib.sha256()
+    with open(fileName, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CacheStore:
+    def __init__(self, directory, max_bytes=64*1024*1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        """
+        Hash the given JSON serialisable parts into a cache key.
+        """
+        data = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, '%s.json' % key)
+
+    def get(self, key):
+        fileName = self.path(key)
+        try:
+            with open(fileName, 'r') as file:
+                value = json.load(file)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        # the modification time records the last use for eviction
+        try:
+            os.utime(fileName)
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        # write to a temporary file first so readers never see partial entries
+        fd, tmpName = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(value, file)
+            os.replace(tmpName, self.path(key))
+        except BaseException:
+            if os.path.exists(tmpName):
+                os.remove(tmpName)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            fileName = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(fileName)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fileName))
+            total += stat.st_size
+        entries.sort()
+        for mtime, size, fileName in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(fileName)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                os.remove(os.path.join(self.directory, name))
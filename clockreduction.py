@@ -0,0 +1,117 @@
+"""
+Clock reduction for the generated network.
+
+Every component instance has an exec_time clock and every timer port a
+clock of its own. Components whose handlers carry no timing annotation never
+read exec_time, so the clock and its resets are dropped. Where exec_time is
+read, it is reset on the edges that leave a timed user operation, where it
+becomes dead.
+
+timer.jinja starts every periodic timer at time zero and fires it at every
+multiple of its period until a handler starts, stops or changes it. Timers
+that no handler touches and that have no phase of their own therefore fire
+together when their periods are equal, and are driven by a single clock. A
+timer with a non-zero 'phase' in its port data is never merged.
+"""
+
+import copy
+import re
+
+EXEC_CLOCK = 'exec_time'
+EXEC_RESET = '%s = 0' % EXEC_CLOCK
+# timer calls that change when a timer fires
+TIMER_OPS = ['activate', 'deactivate', 'launch', 'cancel', 'terminate', 'setDelay']
+
+_clockRead = re.compile(r'\b%s\b' % EXEC_CLOCK)
+
+
+def split_assign(assign):
+    """
+    Split an assignment list at its top level commas.
+    """
+    parts = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(assign):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(assign[start:i].strip())
+            start = i + 1
+    parts.append(assign[start:].strip())
+    return [part for part in parts if part]
+
+
+def reduce_component(codeMetadata):
+    """
+    Copy of a component's code_metadata with its exec_time clock reduced.
+    exec_clock is False in the copy when the clock was dropped.
+    """
+    reduced = copy.deepcopy(codeMetadata)
+    reading = set(loc['id'] for loc in reduced['locations'] if _clockRead.search(loc.get('inv', '')))
+    guarded = any(_clockRead.search(edge.get('guard', '')) for edge in reduced['edges'])
+    if not reading and not guarded:
+        reduced['exec_clock'] = False
+        for edge in reduced['edges']:
+            if 'assign' in edge:
+                parts = [part for part in split_assign(edge['assign']) if part.replace(' ', '') != EXEC_RESET.replace(' ', '')]
+                if parts:
+                    edge['assign'] = ', '.join(parts)
+                else:
+                    del edge['assign']
+        return reduced
+    reduced['exec_clock'] = True
+    for edge in reduced['edges']:
+        if edge['source'] in reading and edge['target'] not in reading:
+            parts = split_assign(edge.get('assign', ''))
+            if not any(part.replace(' ', '') == EXEC_RESET.replace(' ', '') for part in parts):
+                edge['assign'] = ', '.join(parts + [EXEC_RESET])
+    return reduced
+
+
+def deployed_instances(modelData, actorMap):
+    for actorName, actorObj in actorMap.items():
+        for compVal in actorObj['comps']:
+            for host in actorObj.get('target', []):
+                if compVal['type'] in modelData:
+                    yield host, actorName, compVal['inst'], compVal['type']
+
+
+def timer_groups(modelData, actorMap, codeMetadata):
+    """
+    Groups of two or more deployed periodic timers with the same period that
+    no handler ever touches and that start at time zero, as a list of
+    (period, timer names).
+    """
+    byPeriod = {}
+    for host, actorName, inst, compType in deployed_instances(modelData, actorMap):
+        if compType not in codeMetadata:
+            continue
+        touched = set(call['name'] for call in codeMetadata[compType].get('port_calls', []) if call['kind'] in TIMER_OPS)
+        for portName, portAttr in modelData[compType]['ports'].items():
+            if portAttr['type'] != 'tim' or portAttr.get('timertype') != 'periodic' or portAttr.get('period', 0) <= 0:
+                continue
+            # the templates have no phase, so an offset timer keeps its own clock
+            if portName not in touched and not portAttr.get('phase'):
+                byPeriod.setdefault(portAttr['period'], []).append('%s_%s_%s_%s' % (host, actorName, inst, portName))
+    return [(period, timers) for period, timers in sorted(byPeriod.items()) if len(timers) > 1]
+
+
+def clock_report(modelData, actorMap, codeMetadata, reducedMetadata, groups):
+    """
+    Clocks of the network before and after the reduction. global_time is
+    counted in both, it is only there for queries.
+    """
+    execBefore = execAfter = timers = 0
+    for host, actorName, inst, compType in deployed_instances(modelData, actorMap):
+        if compType in codeMetadata:
+            execBefore += 1
+            execAfter += reducedMetadata[compType].get('exec_clock', True)
+        timers += sum(1 for portAttr in modelData[compType]['ports'].values() if portAttr['type'] == 'tim')
+    merged = sum(len(group) - 1 for period, group in groups)
+    return {'before' : 1 + execBefore + timers,
+            'after' : 1 + execAfter + timers - merged,
+            'exec_time' : execBefore - execAfter,
+            'timers' : merged}
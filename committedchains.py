@@ -0,0 +1,94 @@
+"""
+Compression of committed location chains in component templates.
+
+add_riaps_ports gives every port call and every handler a committed
+location of its own, so a handler is a chain of committed locations that
+the verifier steps through one edge at a time. A committed location with a
+single incoming and a single outgoing edge is removed and its two edges are
+fused into one, as long as the fused edge does the same thing: at most one
+of the two synchronises, and no guard or synchronisation moves in front of
+an assignment it could observe.
+"""
+
+import copy
+
+EDGE_KEYS = set(['source', 'target', 'guard', 'sync', 'assign'])
+
+
+def merge_edges(first, second):
+    """
+    The edge that takes first and then second in one step, or None when
+    they cannot be fused.
+    """
+    if set(first) - EDGE_KEYS or set(second) - EDGE_KEYS:
+        return None
+    if not all(isinstance(edge.get(key, ''), str) for edge in (first, second) for key in ('guard', 'sync', 'assign')):
+        return None
+    if first.get('sync') and second.get('sync'):
+        return None
+    # the guard and the receivers of the second edge would see the state
+    # before the first edge's assignment and synchronisation
+    if second.get('guard') and (first.get('assign') or first.get('sync')):
+        return None
+    if second.get('sync') and first.get('assign'):
+        return None
+    merged = {'source': first['source'], 'target': second['target']}
+    guards = [edge['guard'] for edge in (first, second) if edge.get('guard')]
+    if len(guards) == 1:
+        merged['guard'] = guards[0]
+    elif guards:
+        merged['guard'] = ' && '.join('(%s)' % guard for guard in guards)
+    sync = first.get('sync') or second.get('sync')
+    if sync:
+        merged['sync'] = sync
+    assigns = [edge['assign'] for edge in (first, second) if edge.get('assign')]
+    if assigns:
+        merged['assign'] = ', '.join(assigns)
+    return merged
+
+
+def compress_committed(codeMetadata):
+    """
+    Copy of a component's code_metadata with its committed chains
+    compressed, and the number of locations removed.
+    """
+    reduced = copy.deepcopy(codeMetadata)
+    edges = reduced['edges']
+    incoming = {}
+    outgoing = {}
+    for idx, edge in enumerate(edges):
+        outgoing.setdefault(edge['source'], set()).add(idx)
+        incoming.setdefault(edge['target'], set()).add(idx)
+    initial = set(loc['id'] for loc in reduced['locations'] if loc.get('init'))
+    committed = set(reduced['committed'])
+    removed = set()
+    work = list(reversed(reduced['committed']))
+    while work:
+        loc = work.pop()
+        if loc in removed or loc in initial:
+            continue
+        if len(incoming.get(loc, ())) != 1 or len(outgoing.get(loc, ())) != 1:
+            continue
+        first = next(iter(incoming[loc]))
+        second = next(iter(outgoing[loc]))
+        if first == second or edges[first]['source'] == loc:
+            continue
+        merged = merge_edges(edges[first], edges[second])
+        if merged is None:
+            continue
+        source, target = merged['source'], merged['target']
+        edges[first] = merged
+        edges[second] = None
+        incoming[target].discard(second)
+        incoming[target].add(first)
+        del incoming[loc]
+        del outgoing[loc]
+        removed.add(loc)
+        # the neighbours have new edges and may compress further
+        for neighbour in (source, target):
+            if neighbour in committed and neighbour not in removed:
+                work.append(neighbour)
+    reduced['edges'] = [edge for edge in edges if edge is not None]
+    reduced['locations'] = [loc for loc in reduced['locations'] if loc['id'] not in removed]
+    reduced['committed'] = [loc for loc in reduced['committed'] if loc not in removed]
+    return reduced, len(removed)
@@ -0,0 +1,171 @@
+"""
+Elimination of unconnected ports.
+
+Ports talk through one channel per message type and scope. A message port
+is connected when another deployed port listens on a channel it sends on,
+or sends on a channel it listens on, whatever the port types: a subscriber
+also hears the requests of a request port on its message type. A sporadic
+timer that no handler but its own ever launches never fires. Ports that are
+unconnected in every deployed instance of their component are dropped from
+the network together with their queues and handler branches, as long as no
+handler that can still run uses them.
+"""
+
+import copy
+import re
+from pythoncfg import port_arguments, BatchSchedulerModel
+from queuebounds import channel, LISTEN, SEND
+
+# port types the network has a port process or a handler for
+PRUNED_TYPES = ['pub', 'sub', 'req', 'rep', 'qry', 'ans', 'tim']
+# sends of a port type, by index into msgtype
+SENDS = {'pub': 0, 'req': 0, 'qry': 0}
+TIMER_STARTS = ['launch', 'activate']
+
+
+def port_channels(host, portAttr):
+    """
+    The channels a deployed port sends on and listens on.
+    """
+    sends = [channel(host, portAttr, SEND[portAttr['type']])] if portAttr['type'] in SEND else []
+    listens = [channel(host, portAttr, LISTEN[portAttr['type']])] if portAttr['type'] in LISTEN else []
+    return sends, listens
+
+
+def message_index(modelData, actorMap):
+    """
+    The deployed message ports by channel, as lists of (host, actor,
+    instance, port) under 'send' and 'listen'.
+    """
+    index = {}
+    for actorName, actorObj in actorMap.items():
+        for compVal in actorObj['comps']:
+            for host in actorObj.get('target', []):
+                for portName, portAttr in modelData.get(compVal['type'], {}).get('ports', {}).items():
+                    sends, listens = port_channels(host, portAttr)
+                    for key, channels in [('send', sends), ('listen', listens)]:
+                        for name in channels:
+                            index.setdefault(name, {'send': [], 'listen': []})[key].append((host, actorName, compVal['inst'], portName))
+    return index
+
+
+def launched_timers(codeMetadata):
+    """
+    Timers of a component that a handler other than their own launches.
+    """
+    started = set()
+    for call in codeMetadata.get('port_calls', []):
+        if call['kind'] in TIMER_STARTS and call['function'] != 'on_%s' % call['name']:
+            started.add(call['name'])
+    return started
+
+
+def unconnected_ports(modelData, actorMap, index, codeMetadata):
+    """
+    Every deployed port that no other port sends to or listens to, as (host,
+    actor, instance, port, reason) in deployment order.
+    """
+    result = []
+    for actorName, actorObj in actorMap.items():
+        for compVal in actorObj['comps']:
+            compType = compVal['type']
+            started = launched_timers(codeMetadata[compType]) if compType in codeMetadata else None
+            for host in actorObj.get('target', []):
+                for portName, portAttr in modelData.get(compType, {}).get('ports', {}).items():
+                    port = (host, actorName, compVal['inst'], portName)
+                    sends, listens = port_channels(host, portAttr)
+                    if sends or listens:
+                        deaf = [name for name in sends if not [other for other in index.get(name, {}).get('listen', []) if other != port]]
+                        mute = [name for name in listens if not [other for other in index.get(name, {}).get('send', []) if other != port]]
+                        if len(deaf) == len(sends) and len(mute) == len(listens):
+                            reasons = ['nothing listens on %s' % name for name in deaf] + ['nothing sends on %s' % name for name in mute]
+                            result.append(port + (', '.join(reasons),))
+                    elif portAttr['type'] == 'tim' and portAttr.get('timertype') != 'periodic' and started is not None and portName not in started:
+                        result.append((host, actorName, compVal['inst'], portName, 'sporadic timer never launched'))
+    return result
+
+
+def dead_ports(modelData, actorMap, unconnected):
+    """
+    Ports that are unconnected in every deployed instance of their
+    component, by component type.
+    """
+    instances = {}
+    for actorName, actorObj in actorMap.items():
+        for compVal in actorObj['comps']:
+            for host in actorObj.get('target', []):
+                instances.setdefault(compVal['type'], set()).add((host, actorName, compVal['inst']))
+    missing = {}
+    for host, actorName, inst, portName, reason in unconnected:
+        for compVal in actorMap[actorName]['comps']:
+            if compVal['inst'] == inst:
+                missing.setdefault((compVal['type'], portName), set()).add((host, actorName, inst))
+    dead = {}
+    for (compType, portName), where in missing.items():
+        if where == instances[compType] and modelData[compType]['ports'][portName]['type'] in PRUNED_TYPES:
+            dead.setdefault(compType, []).append(portName)
+    return dead
+
+
+def reachable(edges, init):
+    seen = set(init)
+    work = list(init)
+    following = {}
+    for edge in edges:
+        following.setdefault(edge['source'], []).append(edge['target'])
+    while work:
+        for target in following.get(work.pop(), []):
+            if target not in seen:
+                seen.add(target)
+                work.append(target)
+    return seen
+
+
+def prune_component(codeMetadata, ports, deadPorts):
+    """
+    Copy of a component's code_metadata without the handlers of deadPorts
+    and its sends on their channels, or None when a handler that can still
+    run uses one of them.
+    """
+    reduced = copy.deepcopy(codeMetadata)
+    template = reduced['template']
+    livePorts = {portName: portAttr for portName, portAttr in ports.items() if portName not in deadPorts}
+    dispatch = set('socket == %s_%s_q.id' % (template, portName) for portName in deadPorts)
+    edges = [edge for edge in reduced['edges'] if edge.get('guard') not in dispatch]
+    init = [loc['id'] for loc in reduced['locations'] if loc.get('init')]
+    alive = reachable(edges, init)
+    edges = [edge for edge in edges if edge['source'] in alive]
+    # a broadcast send nobody listens to only takes the edge
+    portArgs = port_arguments(template, livePorts)
+    silent = set()
+    for portName in deadPorts:
+        portAttr = ports[portName]
+        if portAttr['type'] in SENDS:
+            name = '%s_channel' % portAttr['msgtype'][SENDS[portAttr['type']]]
+            if not re.search(r'\b%s\b' % name, portArgs):
+                silent.add('%s!' % name)
+    for edge in edges:
+        if edge.get('sync') in silent:
+            del edge['sync']
+    used = re.compile(r'\b(%s)\b' % '|'.join([r'%s_%s_\w+' % (template, portName) for portName in deadPorts] +
+                                             [re.escape(sync[:-1]) for sync in silent]))
+    for edge in edges:
+        if any(used.search(str(edge.get(key, ''))) for key in ('guard', 'sync', 'assign')):
+            return None
+    for loc in reduced['locations']:
+        if loc['id'] in alive and used.search(str(loc.get('inv', ''))):
+            return None
+    reduced['edges'] = edges
+    reduced['locations'] = [loc for loc in reduced['locations'] if loc['id'] in alive]
+    reduced['committed'] = [loc for loc in reduced['committed'] if loc in alive]
+    reduced['port_args'] = portArgs
+    if 'port_calls' in reduced:
+        handlers = ['on_%s' % portName for portName in deadPorts]
+        reduced['port_calls'] = [call for call in reduced['port_calls'] if call['function'] not in handlers]
+    return reduced
+
+
+def prune_scheduler(compType, ports, deadPorts):
+    sched = BatchSchedulerModel(compType, {'ports': {portName: portAttr for portName, portAttr in ports.items() if portName not in deadPorts}})
+    sched.gen_cfg()
+    return sched.scheduler_metadata
@@ -0,0 +1,60 @@
+"""
+Decomposition of a deployment into independent sub-networks.
+
+Deployed actors only interact through the message channels of their ports,
+one per message type and scope: two actors are linked when a port of one
+sends on a channel a port of the other listens on, or both use it. Every
+connected component of this interaction graph is a deployment of its own
+whose network can be verified without the others.
+
+This holds because nothing else in the network is shared between actors.
+Each component instance has its own executehandler and handlerexit channels
+with its own scheduler, so a scheduler can never hand the socket to another
+instance. The go channel is only sent on by the TransitionHelper, which has
+no state and is always ready, so a helper per group file behaves like the
+one of the whole network. The identity variable is written and read within
+a single query/answer broadcast, and global_time is only read by queries.
+"""
+
+from deadports import message_index
+
+
+def interaction_groups(modelData, actorMap, index=None):
+    """
+    The deployed actors by connected component of the interaction graph, as
+    lists of (host, actor) in deployment order.
+    """
+    if index is None:
+        index = message_index(modelData, actorMap)
+    parent = {}
+    for actorName, actorObj in actorMap.items():
+        for host in actorObj.get('target', []):
+            parent.setdefault((host, actorName), (host, actorName))
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for ports in index.values():
+        nodes = [(host, actorName) for host, actorName, inst, portName in ports['send'] + ports['listen']]
+        for node in nodes[1:]:
+            parent[find(node)] = find(nodes[0])
+    groups = {}
+    for node in list(parent):
+        groups.setdefault(find(node), []).append(node)
+    return list(groups.values())
+
+
+def group_actor_map(actorMap, group):
+    """
+    The actorMap of the deployment made of the actors in group. The other
+    actors are kept without hosts, like actors a deployment leaves out.
+    """
+    members = set(group)
+    result = {}
+    for actorName, actorObj in actorMap.items():
+        hosts = [host for host in actorObj.get('target', []) if (host, actorName) in members]
+        result[actorName] = dict(actorObj, target=hosts)
+    return result
@@ -0,0 +1,315 @@
+"""
+Size statistics of a generated .xta network.
+
+ModelStats reads the network as it is written and counts, per template, its
+locations, committed locations, edges, clocks, channels and variables with
+their ranges, and per instance how many processes of the system it stands
+for and the queues it is given. The state vector is estimated the way the
+verifier stores a state: a 32 bit slot for the location of every process and
+for every int, bool and scalar, counting the fields of structs and the
+elements of arrays, and a zone of (clocks + 1)^2 32 bit clock bounds.
+"""
+
+import json
+import re
+
+SLOT_BYTES = 4
+# the range of an int without one
+INT_RANGE = (-32768, 32767)
+SECTIONS = ['state', 'commit', 'urgent', 'init', 'trans']
+
+_process = re.compile(r'^process\s+(\w+)\s*\((.*)\)\s*\{$')
+_function = re.compile(r'^\w[\w\s&]*\s\w+\s*\([^;]*\)\s*(\{.*)?$')
+_typedefStruct = re.compile(r'^typedef\s+struct\s*\{(.*)\}\s*(\w+)\s*;$')
+_typedefScalar = re.compile(r'^typedef\s+scalar\[(\w+)\]\s*(\w+)\s*;$')
+_chan = re.compile(r'^(?:(?:urgent|broadcast)\s+)*chan\s+(.+);$')
+_clock = re.compile(r'^clock\s+(.+);$')
+_variable = re.compile(r'^(const\s+)?(int\s*\[[^\]]*\]|\w+)\s+(\w+)\s*((?:\[[^\]]+\])*)\s*(?:=\s*(.*))?;$')
+_field = re.compile(r'^(int\s*\[[^\]]*\]|\w+)\s+(\w+)\s*((?:\[[^\]]+\])*)$')
+_instance = re.compile(r'^(\w+)\s*(?:\(\s*const\s+(\w+)\s+\w+\s*\))?\s*=\s*(\w+)\s*\((.*)\)\s*;$')
+_system = re.compile(r'^system\s+(.+);$')
+_range = re.compile(r'^int\s*\[\s*(-?\w+)\s*,\s*(-?\w+)\s*\]$')
+_dims = re.compile(r'\[([^\]]+)\]')
+
+
+def declared_names(declaration):
+    """
+    The names of a comma separated declaration with their array dimensions.
+    """
+    result = []
+    for part in declaration.split(','):
+        match = re.match(r'\s*(\w+)\s*((?:\[[^\]]+\])*)', part)
+        if match:
+            result.append((match.group(1), _dims.findall(match.group(2))))
+    return result
+
+
+def first_element(init):
+    """
+    The initializer of the first element of an array initializer, or init
+    itself when it does not initialize an array of structs.
+    """
+    inner = init.strip()[1:].lstrip()
+    if not init.strip().startswith('{') or not inner.startswith('{'):
+        return init
+    depth = 0
+    for pos, char in enumerate(inner):
+        depth += {'{': 1, '}': -1}.get(char, 0)
+        if depth == 0:
+            return inner[:pos + 1]
+    return init
+
+
+class ModelStats:
+    """
+    A sink for the text of a network, see XtaWriter. report() gives the
+    statistics of what has been written so far.
+    """
+    def __init__(self):
+        self.pending = ''
+        self.template = None
+        self.section = None
+        # brace depth inside a function body, None outside of one
+        self.depth = None
+        self.structs = {}
+        self.scalars = {}
+        self.constants = {}
+        self.arrays = {}
+        self.templates = {}
+        self.instances = {}
+        self.system = []
+        self.globals = self.scope()
+
+    def scope(self):
+        return {'locations': 0, 'committed': 0, 'edges': 0, 'clocks': 0, 'channels': 0, 'variables': {}, 'queues': {}}
+
+    def write(self, text):
+        lines = (self.pending + text).split('\n')
+        self.pending = lines.pop()
+        for line in lines:
+            self.parse_line(line.strip())
+
+    def size(self, dimension):
+        dimension = dimension.strip()
+        if dimension.isdigit():
+            return int(dimension)
+        if dimension in self.scalars:
+            return self.scalars[dimension]
+        return self.constants.get(dimension) or 1
+
+    def value(self, token):
+        token = token.strip()
+        if re.match(r'^-?\d+$', token):
+            return int(token)
+        return self.constants.get(token)
+
+    def variable(self, typeName, dims):
+        """
+        The type, number of 32 bit slots and range of a variable.
+        """
+        count = 1
+        for dimension in dims:
+            count *= self.size(dimension)
+        match = _range.match(typeName)
+        if match:
+            typeName, bounds = 'int', (self.value(match.group(1)), self.value(match.group(2)))
+        elif typeName == 'int':
+            bounds = INT_RANGE
+        elif typeName == 'bool':
+            bounds = (0, 1)
+        elif typeName in self.scalars:
+            bounds = (0, self.scalars[typeName] - 1)
+        else:
+            bounds = None
+        slots = sum(field['slots'] for field in self.structs[typeName].values()) if typeName in self.structs else 1
+        return {'type': typeName, 'count': count, 'slots': count*slots, 'range': list(bounds) if bounds else None}
+
+    def parse_line(self, line):
+        if self.depth is not None:
+            self.depth += line.count('{') - line.count('}')
+            if self.depth <= 0 and '}' in line:
+                self.depth = None
+            return
+        if self.template is not None and line.startswith('}'):
+            self.template = None
+            self.section = None
+            line = line[1:].strip()
+        if not line or line.startswith('//'):
+            return
+        match = _process.match(line)
+        if match:
+            self.start_template(match.group(1), match.group(2))
+            return
+        scope = self.globals if self.template is None else self.templates[self.template]
+        if self.template is not None and line in SECTIONS:
+            self.section = line
+        elif self.section is not None:
+            self.section_line(scope, line)
+        elif _function.match(line):
+            self.depth = line.count('{') - line.count('}')
+            if self.depth <= 0 and '}' in line:
+                self.depth = None
+        else:
+            self.declaration(scope, line)
+
+    def start_template(self, name, params):
+        scope = self.scope()
+        scope['parameters'] = 0
+        for param in params.split(','):
+            param = param.strip()
+            if not param:
+                continue
+            scope['parameters'] += 1
+            # value parameters are variables of every process of the template
+            if '&' not in param and not param.startswith('const') and not re.search(r'\bchan\b', param):
+                typeName, paramName = param.rsplit(None, 1)
+                scope['variables'][paramName] = self.variable(typeName, [])
+        self.templates[name] = scope
+        self.template = name
+        self.section = None
+
+    def section_line(self, scope, line):
+        if self.section == 'trans':
+            scope['edges'] += line.count('->')
+        elif self.section in ['state', 'commit']:
+            text = re.sub(r'\{[^}]*\}', '', line).rstrip(';')
+            count = len([name for name in text.split(',') if name.strip()])
+            scope['locations' if self.section == 'state' else 'committed'] += count
+
+    def declaration(self, scope, line):
+        match = _typedefStruct.match(line)
+        if match:
+            fields = {}
+            for field in match.group(1).split(';'):
+                fieldMatch = _field.match(field.strip())
+                if fieldMatch:
+                    fields[fieldMatch.group(2)] = self.variable(fieldMatch.group(1), _dims.findall(fieldMatch.group(3)))
+            self.structs[match.group(2)] = fields
+            return
+        match = _typedefScalar.match(line)
+        if match:
+            self.scalars[match.group(2)] = self.size(match.group(1))
+            return
+        for pattern, key in [(_chan, 'channels'), (_clock, 'clocks')]:
+            match = pattern.match(line)
+            if match:
+                for name, dims in declared_names(match.group(1)):
+                    count = 1
+                    for dimension in dims:
+                        count *= self.size(dimension)
+                    scope[key] += count
+                return
+        match = _system.match(line)
+        if match:
+            self.system += [name.strip() for name in match.group(1).split(',') if name.strip()]
+            return
+        match = _instance.match(line)
+        if match and match.group(3) in self.templates:
+            name, scalar, template, args = match.groups()
+            queues = [arg for arg in re.findall(r'\w+', args) if arg in self.globals['queues']]
+            self.instances[name] = {'template': template, 'count': self.scalars.get(scalar, 1) if scalar else 1, 'queues': queues}
+            return
+        match = _variable.match(line)
+        if match:
+            const, typeName, name, dims, init = match.groups()
+            dims = _dims.findall(dims)
+            if const:
+                # constants are not part of the state
+                if init is not None and dims:
+                    self.arrays[name] = [int(item) for item in re.findall(r'-?\d+', init)]
+                elif init is not None:
+                    self.constants[name] = self.value(init)
+                return
+            if name in scope['variables']:
+                return
+            scope['variables'][name] = self.variable(typeName, dims)
+            if typeName == 'intq':
+                scope['queues'][name] = self.queue(scope['variables'][name], init)
+
+    def queue(self, var, init):
+        fields = self.structs.get('intq', {})
+        if 'items' in fields:
+            size = fields['items']['count']
+        elif 'curr_size' in fields and fields['curr_size']['range'] != list(INT_RANGE):
+            size = fields['curr_size']['range'][1]
+        else:
+            size = None
+        numbers = re.findall(r'-?\d+', first_element(init)) if init else []
+        queueId = int(numbers[-1]) if numbers else None
+        capacity = self.arrays.get('capacity')
+        if capacity is not None and queueId is not None and queueId < len(capacity):
+            size = capacity[queueId]
+        return {'id': queueId, 'count': var['count'], 'size': size}
+
+    def report(self):
+        """
+        The statistics as a dict of plain values, ready for JSON.
+        """
+        if self.pending:
+            self.parse_line(self.pending.strip())
+            self.pending = ''
+        templates = {}
+        for name, scope in self.templates.items():
+            templates[name] = {'instances': 0, 'parameters': scope['parameters'],
+                               'locations': scope['locations'], 'committed': scope['committed'], 'edges': scope['edges'],
+                               'clocks': scope['clocks'], 'channels': scope['channels'], 'variables': scope['variables'],
+                               'state_bytes': SLOT_BYTES*(1 + sum(var['slots'] for var in scope['variables'].values()))}
+        instances = {}
+        for name in self.system:
+            instance = self.instances.get(name, {'template': name, 'count': 1, 'queues': []})
+            if instance['template'] not in templates:
+                continue
+            template = templates[instance['template']]
+            template['instances'] += instance['count']
+            instances[name] = {'template': instance['template'], 'count': instance['count'],
+                               'locations': template['locations'], 'committed': template['committed'], 'edges': template['edges'],
+                               'clocks': template['clocks'],
+                               'queues': {queue: self.globals['queues'][queue]['size'] for queue in instance['queues']},
+                               'state_bytes': template['state_bytes']*instance['count']}
+        totals = {'processes': 0, 'locations': 0, 'committed': 0, 'edges': 0,
+                  'clocks': self.globals['clocks'], 'channels': self.globals['channels'],
+                  'variables': len(self.globals['variables']),
+                  'queues': sum(queue['count'] for queue in self.globals['queues'].values())}
+        globalBytes = SLOT_BYTES*sum(var['slots'] for var in self.globals['variables'].values())
+        stateBytes = globalBytes
+        for template in templates.values():
+            count = template['instances']
+            totals['processes'] += count
+            for key in ['locations', 'committed', 'edges', 'clocks']:
+                totals[key] += count*template[key]
+            totals['variables'] += count*len(template['variables'])
+            stateBytes += count*template['state_bytes']
+        totals['zone_bytes'] = SLOT_BYTES*(totals['clocks'] + 1)**2
+        totals['state_bytes'] = stateBytes + totals['zone_bytes']
+        return {'templates': templates, 'instances': instances,
+                'globals': {'clocks': self.globals['clocks'], 'channels': self.globals['channels'],
+                            'variables': self.globals['variables'], 'state_bytes': globalBytes},
+                'queues': self.globals['queues'], 'scalars': dict(self.scalars), 'totals': totals}
+
+
+def format_stats(stats):
+    """
+    The statistics as a table with a row per template, one for the global
+    declarations and one for the whole network.
+    """
+    header = ['template', 'instances', 'locations', 'committed', 'edges', 'clocks', 'channels', 'variables', 'bytes']
+    table = [header]
+    for name, template in stats['templates'].items():
+        table.append([name] + [str(template[key]) for key in ['instances', 'locations', 'committed', 'edges', 'clocks', 'channels']] +
+                     [str(len(template['variables'])), str(template['state_bytes'])])
+    glob = stats['globals']
+    table.append(['(global)', '', '', '', '', str(glob['clocks']), str(glob['channels']), str(len(glob['variables'])), str(glob['state_bytes'])])
+    totals = stats['totals']
+    table.append(['(total)'] + [str(totals[key]) for key in ['processes', 'locations', 'committed', 'edges', 'clocks', 'channels', 'variables', 'state_bytes']])
+    widths = [max(len(line[i]) for line in table) for i in range(len(header))]
+    lines = ['  '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip() for line in table]
+    lines.insert(1, '  '.join('-'*width for width in widths))
+    sizes = sorted(set(queue['size'] for queue in stats['queues'].values() if queue['size'] is not None))
+    lines.append('queues: %d, sizes %s' % (totals['queues'], ', '.join(str(size) for size in sizes) or 'unknown'))
+    lines.append('state vector: about %d bytes, %d of them for the clock zone' % (totals['state_bytes'], totals['zone_bytes']))
+    return '\n'.join(lines)
+
+
+def write_stats(stats, path):
+    with open(path, 'w') as f:
+        json.dump(stats, f, indent=2)
@@ -7,16 +7,35 @@ import random
 from tokenize import tokenize, untokenize, NUMBER, STRING, NAME, OP, COMMENT
 from io import BytesIO
 import re
-from riaps.lang.lang import compileModel, LangError
-from riaps.utils.config import Config
-import sys
-from textx.metamodel import metamodel_from_file
-from textx.export import metamodel_export, model_export
-from textx.exceptions import TextXSemanticError, TextXSyntaxError
-import textx.model
 import os
-from jinja2 import FileSystemLoader, Environment
-from riaps.lang.depl import DeploymentModel
+import copy
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pythoncfg import __version__
+from cachestore import CacheStore, file_hash
+from xtawriter import XtaWriter, get_environment
+from modelstats import ModelStats, format_stats, write_stats
+from profiling import phase, profiled, enable, enable_from_environment, map_jobs, format_profile, TRACE_VARIABLE, CPROFILE_VARIABLE
+from queuebounds import infer_queue_bounds
+from clockreduction import reduce_component, timer_groups, clock_report
+from committedchains import compress_committed
+from deadports import message_index, unconnected_ports, dead_ports, prune_component, prune_scheduler
+from decomposition import interaction_groups, group_actor_map
+from slicing import influence_graph, query_seeds, cone_of_influence
+from timescale import component_constants, model_constants, time_unit, scale_value, scale_component, scale_model
+
+CACHE_DIR = '.riaps2uppaal'
+
+# port types that are instantiated as processes of their own
+PORT_PROCESSES = ['sub','req','rep','qry','ans','tim']
+
+# port queues are modelled as a ring buffer of messages or as a bounded counter
+QUEUE_MODELS = ['array', 'counter']
+# size of the port queues, unless bounds are inferred
+DEFAULT_QUEUE_SIZE = 10
+
+# import "other.riaps" in a model file
+IMPORT_STATEMENT = re.compile(r'^\s*import\s+["\']?([^"\'\s;]+)["\']?\s*;?')
 
 XMIN = -500
 XMAX = 500
@@ -78,47 +97,204 @@ def split_dirname(path):
         tail = os.path.basename(head)
     return (head,tail)
 
+def grammar_hashes():
+    """
+    Hashes of the textX grammars of the riaps model and deployment languages,
+    empty when the riaps package cannot be found.
+    """
+    import importlib.util
+    try:
+        spec = importlib.util.find_spec('riaps.lang')
+    except (ImportError, ValueError):
+        spec = None
+    if spec is None or not spec.submodule_search_locations:
+        return []
+    hashes = []
+    for folder in spec.submodule_search_locations:
+        for name in sorted(os.listdir(folder)):
+            if name.endswith('.tx'):
+                hashes.append([name, file_hash(os.path.join(folder, name))])
+    return hashes
+
+def model_files(modelPath):
+    """
+    The model file and every file it imports, directly or through other
+    imports, relative to the folder of the model, with the hash of each;
+    None for imports that do not exist.
+    """
+    result = []
+    seen = set()
+    work = [os.path.abspath(modelPath)]
+    root = os.path.dirname(work[0])
+    while work:
+        path = work.pop(0)
+        if path in seen:
+            continue
+        seen.add(path)
+        if not os.path.isfile(path):
+            result.append([os.path.relpath(path, root), None])
+            continue
+        result.append([os.path.relpath(path, root), file_hash(path)])
+        with open(path, 'r', errors='replace') as file:
+            for line in file:
+                match = IMPORT_STATEMENT.match(line)
+                if match:
+                    work.append(os.path.abspath(os.path.join(os.path.dirname(path), match.group(1))))
+    return result
+
 class riaps2uppaal():
-    def __init__(self, appFolder, appName):
+    def __init__(self, appFolder, appName, useCache=True, cacheDir=None, queueModel='array', queueBounds=False, reduceClocks=False, compressCommitted=False, symmetry=False, pruneDeadPorts=False, normalizeTime=False, timeQuantum=None, collectStats=False, profileTrace=None, profileDir=None):
         #self.appFolder, self.appName = split_dirname(appPath)
         self.appFolder =  appFolder
         self.appName = appName
+        if cacheDir is None:
+            cacheDir = os.path.join(self.appFolder, CACHE_DIR)
+        self.cacheDir = os.path.abspath(cacheDir)
+        self.compCache = CacheStore(os.path.join(self.cacheDir, 'components')) if useCache else None
+        self.modelCache = CacheStore(os.path.join(self.cacheDir, 'models')) if useCache else None
+        self.deplCache = CacheStore(os.path.join(self.cacheDir, 'deployments')) if useCache else None
         self.cfg = {}
         self.g = []
         self.modelData = {}
-        self.env = Environment(
-            loader = FileSystemLoader("templates"))
         self.sched = {}
         self.xtaFile = "%s/%s.xta" %(self.appFolder,self.appName)
-        file = open(self.xtaFile,'w')
-        file.close()
+        self.xtaWriter = None
         self.xtaContent = []
         self.actorMap = {}
         self.localMsgTypes = []
         self.templateArgs = {}
         self.schedArgs = {}
+        self.componentXta = None
+        # component types whose templates are written, None for all
+        self.componentTypes = None
+        assert queueModel in QUEUE_MODELS, "queueModel must be one of %s" % QUEUE_MODELS
+        # every intq shares one struct type, so the array model cannot size
+        # a queue by its bound; its items are all 1 anyway, the counter model
+        # keeps the same state in a range no larger than the largest bound
+        self.queueModel = 'counter' if queueBounds else queueModel
+        self.queueBounds = queueBounds
+        self.reduceClocks = reduceClocks
+        self.compressCommitted = compressCommitted
+        self.symmetry = symmetry
+        self.symmetricClasses = {}
+        self.symmetricActors = {}
+        self.pruneDeadPorts = pruneDeadPorts
+        self.messageIndex = None
+        self.prunedMetadata = {}
+        self.prunedSchedulers = {}
+        self.portReport = None
+        # a time quantum implies the normalisation
+        self.normalizeTime = normalizeTime or timeQuantum is not None
+        self.timeQuantum = timeQuantum
+        self.timeReport = None
+        self.collectStats = collectStats
+        self.modelStats = None
+        # profiling is process wide, RIAPS2UPPAAL_PROFILE enables it as well
+        if profileTrace is not None or profileDir is not None:
+            self.profiler = enable(profileTrace, profileDir=profileDir)
+        else:
+            self.profiler = enable_from_environment()
+        self.reducedMetadata = None
+        self.compressedLocations = {}
+        self.clockReport = None
+        self.sliceReports = None
         
-    def generate_cfg(self):
+    def __getstate__(self):
+        # only what the deployment dependent steps need is sent to worker processes
+        state = self.__dict__.copy()
+        state['xtaWriter'] = None
+        state['profiler'] = None
+        state['g'] = []
+        state['cfg'] = {compName : PyCFG.from_metadata(cfg.code_metadata, cfg.port_data) for compName, cfg in self.cfg.items()}
+        return state
+    
+    @profiled('generate_cfg')
+    def generate_cfg(self, parallel=None, workers=None, keepAst=True, graphs=False, dot=False, coverage=None):
+        """
+        Translate every component of the model. parallel selects how the
+        components are distributed: None translates them one by one, 'process'
+        and 'thread' use a pool of at most workers workers. All modes produce
+        the same model. Without keepAst the component CFGs release their AST
+        after translation. With dot the CFG of every component is kept in g as
+        dot text, with graphs as a pygraphviz graph; the graphs are built from
+        the AST, so these bypass the cached translations. coverage names a
+        coverage.py data file; statements that never ran in it are left out of
+        the model of every component it measured, with their port calls and
+        timing, unless their whole handler never ran.
+        """
         assert self.modelData, "call parse_model() first to get model data"
+        assert parallel in (None, 'process', 'thread'), "parallel must be None, 'process' or 'thread'"
+        jobs = []
+        translated = {}
+        order = []
+        cdata = read_coverage(coverage) if coverage else None
+        dot = dot or graphs
         for compName in self.modelData:
             fileName = "%s/%s.py" %(self.appFolder,compName)
             if os.path.isfile(fileName):
                 with open(fileName,'r') as file:
                     compCode = file.read()
-                    self.cfg[compName]=PyCFG()
-                    self.cfg[compName].gen_cfg(compCode, self.modelData)
-                    self.g.append(to_graph(CFGNode.cache, []))
-                    # compName = self.cfg[-1].code_metadata['template']
-                    self.sched[compName]=BatchSchedulerModel(compName, self.modelData[compName])
-                    self.sched[compName].gen_cfg()
+                order.append(compName)
+                covered = coverage_lines(cdata, fileName) if cdata is not None else None
+                key = None
+                if self.compCache is not None:
+                    # the port data goes into the key as it is before setDelay updates it
+                    keyParts = [__version__, compName, compCode, self.modelData[compName]]
+                    if covered is not None:
+                        keyParts.append(sorted(covered))
+                    key = CacheStore.key(*keyParts)
+                    entry = None if dot else self.compCache.get(key)
+                    if entry is not None:
+                        translated[compName] = self.load_translation(compName, entry)
+                        continue
+                jobs.append((compName, compCode, key, covered))
             else:
                 print("file %s.py not found in %s" %(compName, self.appFolder))
+                
+        # raised once for all the translations, worker threads only read it
+        raise_recursion_limit()
+        if parallel is None:
+            results = [translate_component(compName, compCode, self.modelData, False, keepAst, covered, dot) for compName, compCode, key, covered in jobs]
+        else:
+            detach = parallel == 'process'
+            executor = ProcessPoolExecutor if detach else ThreadPoolExecutor
+            with executor(max_workers=workers) as pool:
+                results = map_jobs(pool, translate_component, [(compName, compCode, self.modelData, detach, keepAst, covered, dot) for compName, compCode, key, covered in jobs])
+                
+        for (compName, compCode, key, covered), (cfg, sched, graph) in zip(jobs, results):
+            if parallel == 'process':
+                # workers translate a copy of the model, take back the port
+                # data that the component code may have updated (setDelay)
+                self.modelData[compName]['ports'] = cfg.port_data[compName]['ports']
+                sched.port_data = self.modelData[compName]
+            if key is not None:
+                self.compCache.put(key, {'code_metadata' : cfg.code_metadata,
+                                         'scheduler_metadata' : sched.scheduler_metadata,
+                                         'ports' : self.modelData[compName]['ports']})
+            translated[compName] = (cfg, sched, graph)
+            
+        for compName in order:
+            cfg, sched, graph = translated[compName]
+            self.cfg[compName] = cfg
+            if dot:
+                self.g.append(graph_from_string(graph) if graphs else graph)
+            self.sched[compName] = sched
+        self.componentXta = None
+        self.reducedMetadata = None
+        self.timeReport = None
+            
+    def load_translation(self, compName, entry):
+        self.modelData[compName]['ports'] = entry['ports']
+        cfg = PyCFG.from_metadata(entry['code_metadata'], self.modelData)
+        sched = BatchSchedulerModel(compName, self.modelData[compName])
+        sched.scheduler_metadata = entry['scheduler_metadata']
+        return cfg, sched, None
         
     def print_cfg(self):
         graphs = []
         if self.g is not None:
             for item in self.g:
-                graphs.append(item.to_string())
+                graphs.append(item if isinstance(item, str) else item.to_string())
         return graphs
             
     def generate_xml(self, start_new = True):
@@ -204,17 +380,37 @@ class riaps2uppaal():
     #                 print(m.groups())
     #             print(untokenize([(toknum,tokval)]))
     
+    @profiled('parse_model')
     def parse_model(self, modelFile=None):
         #thisFolder = '/home/riaps/workspace/RIAPS2UPPAAL'
         if not modelFile:
             modelFile = "%s.riaps" % (self.appName)
+        modelPath = os.path.abspath('%s/%s' %(self.appFolder,modelFile))
+        key = None
+        if self.modelCache is not None:
+            # the model depends on the files it imports and on the grammar as well
+            key = CacheStore.key(__version__, model_files(modelPath), grammar_hashes())
+            entry = self.modelCache.get(key)
+            if entry is not None:
+                self.appName = entry['appName']
+                self.actorMap = entry['actorMap']
+                self.localMsgTypes = entry['localMsgTypes']
+                self.modelData = entry['modelData']
+                return
+            
+        # the compiler writes <appName>.json into the working directory, keep it in the cache directory
+        os.makedirs(self.cacheDir, exist_ok=True)
+        cwd = os.getcwd()
+        os.chdir(self.cacheDir)
+        from riaps.lang.lang import compileModel
         try:
-            compiledApp = compileModel('%s/%s' %(self.appFolder,modelFile))
-        except:
-            raise
+            with phase('compileModel'):
+                compiledApp = compileModel(modelPath)
+        finally:
+            os.chdir(cwd)
         self.appName = list(compiledApp.keys())[0]
         
-        with open(self.appName+'.json') as f:
+        with open(os.path.join(self.cacheDir, self.appName+'.json')) as f:
             data = json.load(f)
             for actor, actorObj in data['actors'].items():
                 self.actorMap[actor] = {'comps' : []}
@@ -249,52 +445,340 @@ class riaps2uppaal():
                                 insert['timertype'] = 'periodic'
                         #self.ports.append({portName: insert})
                         self.modelData[compObj['name']]['ports'][portName]=insert
+                        
+        if key is not None:
+            self.modelCache.put(key, {'appName' : self.appName,
+                                      'actorMap' : self.actorMap,
+                                      'localMsgTypes' : self.localMsgTypes,
+                                      'modelData' : self.modelData})
                 
                         
+    @profiled('parse_depl')
     def parse_depl(self, deplFile=None):
         if deplFile is None:
             deplFile = "%s.depl" % (self.appName)
-        try:
-            compiledDepl = DeploymentModel('%s/%s' %(self.appFolder,deplFile))
+        deplPath = os.path.abspath('%s/%s' %(self.appFolder,deplFile))
+        key = None
+        targets = None
+        if self.deplCache is not None:
+            key = CacheStore.key(__version__, self.appName, file_hash(deplPath), grammar_hashes())
+            targets = self.deplCache.get(key)
+        if targets is None:
+            from riaps.lang.depl import DeploymentModel
+            with phase('DeploymentModel'):
+                compiledDepl = DeploymentModel(deplPath)
             deployment = compiledDepl.getDeployments()
+            # host lists per deployed actor, in deployment order
+            targets = []
             for deplObj in deployment:
                 for actor in deplObj['actors']:
-                    if 'target' not in self.actorMap[actor['name']]:
-                        self.actorMap[actor['name']]['target'] = []
-                    if len(deplObj['target']) > 0:
-                        self.actorMap[actor['name']]['target'] += deplObj['target']
-                        
-                        
-                    
-            
-        except:
-            raise
-        
+                    targets.append([actor['name'], list(deplObj['target'])])
+            if key is not None:
+                self.deplCache.put(key, targets)
+                
+        for actorName, target in targets:
+            if 'target' not in self.actorMap[actorName]:
+                self.actorMap[actorName]['target'] = []
+            if len(target) > 0:
+                self.actorMap[actorName]['target'] += target
+        # actors left out of this deployment have no instances
+        for actorName, actorObj in self.actorMap.items():
+            actorObj.setdefault('target', [])
+        self.messageIndex = message_index(self.modelData, self.actorMap)
         
-                        
     def add_xta(self, template, args={}):
         if template.split('.')[0] not in self.xtaContent:
             if template.split('.')[0] not in ["genericComponent","batchScheduler"]:
                 self.xtaContent.append(template.split('.')[0])
-            template = self.env.get_template(template)
-            with open(self.xtaFile,'a')  as file:
-                file.write(template.render(args)+"\n")
+            self.xtaWriter.render(get_environment().get_template(template), args)
             #print(template.render(args))
             
+    def component_xta(self, compNames=None):
+        """
+        Component and scheduler templates, of the components in compNames or
+        of all. They do not depend on the deployment, so they are rendered once
+        and shared by all deployments of a sweep.
+        """
+        if self.componentXta is None:
+            parts = {}
+            for compName, ports in self.modelData.items():
+                if compName in self.cfg:
+                    with phase('jinja', component=compName):
+                        parts[compName] = (get_environment().get_template("genericComponent.jinja").render({'compInfo' : self.component_metadata(compName)})+"\n" +
+                                           get_environment().get_template("batchScheduler.jinja").render({'compInfo' : self.prunedSchedulers.get(compName, self.sched[compName].scheduler_metadata)})+"\n")
+            self.componentXta = parts
+        return ''.join(text for compName, text in self.componentXta.items() if compNames is None or compName in compNames)
+            
+    def component_metadata(self, compName):
+        """
+        The code_metadata a component is rendered from, without its dead ports,
+        with its committed chains compressed, its clocks reduced and its timing
+        constants normalised when these are enabled.
+        """
+        if not (self.reduceClocks or self.compressCommitted or self.normalizeTime):
+            return self.prunedMetadata.get(compName, self.cfg[compName].code_metadata)
+        if self.reducedMetadata is None:
+            self.reducedMetadata = {}
+        if compName not in self.reducedMetadata:
+            metadata = self.prunedMetadata.get(compName, self.cfg[compName].code_metadata)
+            if self.compressCommitted:
+                metadata, self.compressedLocations[compName] = compress_committed(metadata)
+            if self.reduceClocks:
+                metadata = reduce_component(metadata)
+            if self.normalizeTime:
+                metadata = scale_component(metadata, self.time_report()['unit'])[0]
+            self.reducedMetadata[compName] = metadata
+        return self.reducedMetadata[compName]
+            
+    def actor_signature(self, actorName):
+        """
+        Everything the network takes from an actor: its component instances
+        with their types, and the type, message types, scope and timer
+        settings of every port.
+        """
+        signature = []
+        for compVal in self.actorMap[actorName]['comps']:
+            ports = self.modelData.get(compVal['type'], {}).get('ports', {})
+            signature.append((compVal['inst'], compVal['type'],
+                              sorted((portName, sorted((key, str(value)) for key, value in portAttr.items())) for portName, portAttr in ports.items())))
+        return signature
+    
+    def symmetric_classes(self):
+        """
+        The deployed instances that are interchangeable, as lists of (host,
+        actor) by the first actor of their class. Instances are in one class
+        when their actors have the same signature, and a class needs two or
+        more instances none of whose ports is bound to its host by a local
+        message scope or answers by instance identity.
+        """
+        classes = {}
+        signatures = []
+        for actorName, actorObj in self.actorMap.items():
+            if not actorObj['target']:
+                continue
+            ports = [portAttr for compVal in actorObj['comps'] for portAttr in self.modelData.get(compVal['type'], {}).get('ports', {}).values()]
+            if any(portAttr.get('msgscope') == 'local' or portAttr['type'] in ['qry','ans'] for portAttr in ports):
+                continue
+            signature = self.actor_signature(actorName)
+            for leader, other in signatures:
+                if other == signature:
+                    break
+            else:
+                leader = actorName
+                signatures.append((leader, signature))
+            classes.setdefault(leader, []).extend((host, actorName) for host in actorObj['target'])
+        return {leader : replicas for leader, replicas in classes.items() if len(replicas) > 1}
+    
+    def symmetric_actors(self):
+        """
+        The actors of the symmetric classes, by the first actor of their
+        class, under whose name the class is instantiated.
+        """
+        return {actorName : leader for leader, replicas in self.symmetricClasses.items() for host, actorName in replicas}
+            
+    def queue_ids(self):
+        """
+        The queues behind every port queue id, in the order globalDecl.jinja
+        and symmetricDecl.jinja number them. The queues of a symmetric actor
+        share the id of their port.
+        """
+        ids = []
+        for actorName, actorObj in self.actorMap.items():
+            if actorName in self.symmetricActors:
+                continue
+            for compVal in actorObj['comps']:
+                for host in actorObj['target']:
+                    for portName in self.modelData.get(compVal['type'], {}).get('ports', {}):
+                        ids.append(['%s_%s_%s_%s_q' %(host, actorName, compVal['inst'], portName)])
+        for leader, replicas in self.symmetricClasses.items():
+            for compVal in self.actorMap[leader]['comps']:
+                for portName in self.modelData.get(compVal['type'], {}).get('ports', {}):
+                    ids.append(['%s_%s_%s_%s_q' %(host, actorName, compVal['inst'], portName) for host, actorName in replicas])
+        return ids
+            
+    def symmetric_instances(self):
+        """
+        The component instances of the symmetric classes, one entry per
+        component of the class, with the id of each of its port queues.
+        """
+        instances = []
+        queueId = 1 + sum(len(self.modelData.get(compVal['type'], {}).get('ports', {})) * len(actorObj['target'])
+                          for actorName, actorObj in self.actorMap.items() if actorName not in self.symmetricActors for compVal in actorObj['comps'])
+        for actorName, replicas in self.symmetricClasses.items():
+            for compVal in self.actorMap[actorName]['comps']:
+                key = '%s_%s' %(actorName, compVal['inst'])
+                ports = list(self.modelData.get(compVal['type'], {}).get('ports', {}).items())
+                ids = {}
+                for portName, portAttr in ports:
+                    ids[portName] = queueId
+                    queueId += 1
+                processes = [key] + ['%s_%s' %(key, portName) for portName, portAttr in ports if portAttr['type'] in ['sub','req','rep','tim']] + ['%sScheduler' % key]
+                instances.append({'actor' : actorName, 'key' : key, 'size' : len(replicas), 'type' : compVal['type'],
+                                  'ports' : ports, 'ids' : ids, 'processes' : processes})
+        return instances
+            
+    def symmetric_channels(self):
+        """
+        Message channels the ports of symmetric actors listen on that
+        globalDecl.jinja does not declare.
+        """
+        declared = set()
+        channels = []
+        for symmetric in [False, True]:
+            for actorName, actorObj in self.actorMap.items():
+                if (actorName in self.symmetricActors) != symmetric:
+                    continue
+                for compVal in actorObj['comps']:
+                    for portAttr in self.modelData.get(compVal['type'], {}).get('ports', {}).values():
+                        if portAttr.get('msgscope') == 'local':
+                            continue
+                        if portAttr['type'] in ['sub','qry','req']:
+                            msgType = portAttr['msgtype'][0]
+                        elif portAttr['type'] in ['rep','ans']:
+                            msgType = portAttr['msgtype'][1]
+                        else:
+                            continue
+                        if symmetric and msgType not in declared:
+                            channels.append(msgType)
+                        declared.add(msgType)
+        return channels
+            
+    def time_report(self):
+        """
+        The time unit of the network, the largest timing constant before and
+        after scaling and the largest rounding error. It is computed once from
+        all component types, so every deployment of a sweep shares it.
+        """
+        if self.timeReport is None:
+            constants = model_constants(self.modelData)
+            for compName, cfg in self.cfg.items():
+                constants += component_constants(cfg.code_metadata)
+            unit = time_unit(constants, self.timeQuantum)
+            errors = [scale_model(self.modelData, unit)[1]] + [scale_component(cfg.code_metadata, unit)[1] for cfg in self.cfg.values()]
+            largest = max(constants) if constants else 0
+            self.timeReport = {'unit' : unit, 'quantum' : self.timeQuantum is not None, 'error' : max(errors),
+                               'largest' : largest, 'scaled' : scale_value(largest, unit, 'up')}
+        return self.timeReport
+            
+    def code_metadata(self):
+        """
+        The code_metadata of every component, without its dead ports.
+        """
+        return {compName : self.prunedMetadata.get(compName, cfg.code_metadata) for compName, cfg in self.cfg.items()}
+            
+    def prune_dead_ports(self):
+        """
+        Find the unconnected ports of the deployment and the ports that can be
+        dropped from the network. Returns the model data without them.
+        """
+        if self.messageIndex is None:
+            self.messageIndex = message_index(self.modelData, self.actorMap)
+        codeMetadata = {compName : cfg.code_metadata for compName, cfg in self.cfg.items()}
+        unconnected = unconnected_ports(self.modelData, self.actorMap, self.messageIndex, codeMetadata)
+        self.prunedMetadata = {}
+        self.prunedSchedulers = {}
+        # the component templates depend on the deployment now
+        self.componentXta = None
+        self.reducedMetadata = None
+        removed = []
+        for compName, portNames in dead_ports(self.modelData, self.actorMap, unconnected).items():
+            if compName not in self.cfg:
+                continue
+            ports = self.modelData[compName]['ports']
+            dead = []
+            for portName in portNames:
+                metadata = prune_component(codeMetadata[compName], ports, dead + [portName])
+                if metadata is not None:
+                    dead.append(portName)
+                    self.prunedMetadata[compName] = metadata
+            if dead:
+                self.prunedSchedulers[compName] = prune_scheduler(compName, ports, dead)
+                removed += [(compName, portName) for portName in dead]
+        self.portReport = {'unconnected' : ['%s_%s_%s_%s: %s' % item for item in unconnected],
+                           'removed' : ['%s.%s' % item for item in removed]}
+        modelData = {}
+        for compName, compData in self.modelData.items():
+            modelData[compName] = dict(compData, ports={portName : portAttr for portName, portAttr in compData['ports'].items() if (compName, portName) not in removed})
+        return modelData
+            
+    def queue_capacities(self):
+        """
+        Capacity of every port queue, indexed by the id globalDecl.jinja gives
+        it: the inferred bound, or DEFAULT_QUEUE_SIZE for queues without one.
+        """
+        bounds = infer_queue_bounds(self.modelData, self.actorMap, self.code_metadata())
+        capacities = [0]
+        for queues in self.queue_ids():
+            queueBounds = [bounds.get(queue) for queue in queues]
+            capacities.append(max(queueBounds) if None not in queueBounds else DEFAULT_QUEUE_SIZE)
+        return capacities
+            
     def calc_port_count(self):
         return max(len(compData['ports']) for compName, compData in self.modelData.items())
             
-    def merge_xta(self):
+    @profiled('merge_xta')
+    def merge_xta(self, output=None):
+        """
+        Write the network in a single pass to output: a file name (by default
+        the .xta file of the application), '-' for stdout or a text stream.
+        A file is only replaced once the whole network has been written.
+        """
+        if output is None:
+            output = self.xtaFile
+        self.xtaContent = []
+        # the statistics are gathered from the text as it is written
+        stats = ModelStats() if self.collectStats else None
+        with XtaWriter(output, tee=stats) as writer:
+            self.xtaWriter = writer
+            modelData = self.modelData
+            try:
+                if self.normalizeTime:
+                    self.time_report()
+                # the network of this deployment is written from the model
+                # without its dead ports
+                if self.pruneDeadPorts:
+                    self.modelData = self.prune_dead_ports()
+                self.write_xta()
+            finally:
+                self.xtaWriter = None
+                self.modelData = modelData
+        if stats is not None:
+            self.modelStats = stats.report()
+                
+    def write_xta(self):
         
         # print(str(self.actorMap))
         # print(str(self.modelData))
-        self.add_xta("globalDecl.jinja", {'actorMap' : self.actorMap,'compInfo' : self.modelData, 'maxSize': 10, 'portCount' : self.calc_port_count()})
+        self.symmetricClasses = self.symmetric_classes() if self.symmetry else {}
+        self.symmetricActors = self.symmetric_actors()
+        capacities = self.queue_capacities() if self.queueBounds else None
+        maxSize = max(capacities) if capacities else DEFAULT_QUEUE_SIZE
+        if self.normalizeTime:
+            # queue bounds are inferred in the original unit, the timer periods
+            # are written in the new one; merge_xta puts the model back
+            self.modelData = scale_model(self.modelData, self.time_report()['unit'])[0]
+            self.xtaWriter.write('// timing constants in units of %(unit)d, rounded by at most %(error)d\n' % self.time_report())
+        self.add_xta("globalDecl.jinja", {'actorMap' : self.actorMap,'compInfo' : self.modelData, 'maxSize': maxSize, 'portCount' : self.calc_port_count(),
+                                          'queueModel' : self.queueModel, 'capacities' : capacities, 'symmetric' : self.symmetricActors})
+        symmetricInstances = self.symmetric_instances()
+        if symmetricInstances:
+            self.add_xta("symmetricDecl.jinja", {'symmetric' : {actorName : len(replicas) for actorName, replicas in self.symmetricClasses.items()}, 'instances' : symmetricInstances, 'channels' : self.symmetric_channels(),
+                                                 'maxSize': maxSize, 'portCount' : self.calc_port_count(), 'queueModel' : self.queueModel})
         for actor, actuals in self.actorMap.items():
+            # a symmetric class is instantiated once, under the name of its
+            # first actor, its per instance variables are arrays indexed by
+            # the scalar parameter i
+            if self.symmetricActors.get(actor, actor) != actor:
+                continue
             for compAttr in actuals['comps']:
-                for host in actuals['target']:
-                    templateKey = '%s_%s_%s' %(host,actor,compAttr['inst'])
-                    self.templateArgs[templateKey]='%s_socket,' %(templateKey)
-                    self.schedArgs["%sScheduler" % (templateKey)] = "%s_sockets, %s_socket," %(templateKey, templateKey)
+                symmetric = actor in self.symmetricActors
+                idx = '[i]' if symmetric else ''
+                for host in ([None] if symmetric else actuals['target']):
+                    templateKey = '%s_%s' %(actor,compAttr['inst']) if symmetric else '%s_%s_%s' %(host,actor,compAttr['inst'])
+                    # every component has a handshake of its own with its scheduler
+                    handshake = "%s_executehandler%s, %s_handlerexit%s," %(templateKey,idx, templateKey,idx)
+                    self.templateArgs[templateKey]='%s_socket%s, %s' %(templateKey,idx, handshake)
+                    self.schedArgs["%sScheduler" % (templateKey)] = "%s_sockets%s, %s_socket%s, %s" %(templateKey,idx, templateKey,idx, handshake)
                     for portName, portAttr in self.modelData[compAttr['type']]["ports"].items():
                         if portAttr["type"] == "tim":
                             self.add_xta("timer.jinja")
@@ -318,14 +802,14 @@ class riaps2uppaal():
                         
                         if portAttr["type"] == "tim":
                             
-                            self.templateArgs[templateKey] += "%s_%s_activate, %s_%s_deactivate, %s_%s_start, %s_%s_cancel, %s_%s_terminate, %s_%s_setDelay, %s_%s_q," %(templateKey,portName,templateKey,portName,templateKey,portName,templateKey,portName,templateKey,portName,templateKey,portName,templateKey,portName)
-                            self.schedArgs["%sScheduler" % (templateKey)] += "%s_%s_q," %(templateKey,portName)
+                            self.templateArgs[templateKey] += "%s_%s_activate%s, %s_%s_deactivate%s, %s_%s_start%s, %s_%s_cancel%s, %s_%s_terminate%s, %s_%s_setDelay%s, %s_%s_q%s," %(templateKey,portName,idx,templateKey,portName,idx,templateKey,portName,idx,templateKey,portName,idx,templateKey,portName,idx,templateKey,portName,idx,templateKey,portName,idx)
+                            self.schedArgs["%sScheduler" % (templateKey)] += "%s_%s_q%s," %(templateKey,portName,idx)
                         else:
                             if portAttr["type"] in ["pub","sub","qry","req"]:
                                 if portAttr["msgscope"] == "local":
                                     self.templateArgs[templateKey] += "%s_%s_q, %s_%s_channel," %(templateKey,portName, host, portAttr['msgtype'][0])
                                 else:
-                                    self.templateArgs[templateKey] += "%s_%s_q, %s_channel," %(templateKey,portName,portAttr['msgtype'][0])
+                                    self.templateArgs[templateKey] += "%s_%s_q%s, %s_channel," %(templateKey,portName,idx,portAttr['msgtype'][0])
                                     
                             if portAttr["type"] in ["rep","ans"]:
                                 if portAttr["msgscope"] == "local":
@@ -337,17 +821,14 @@ class riaps2uppaal():
                                     if portAttr["type"] == "ans":
                                         self.templateArgs[templateKey] += "%s_%s_identity,%s_%s_q, %s_channel," %(templateKey,portName,templateKey,portName, portAttr['msgtype'][1])
                                     else:
-                                        self.templateArgs[templateKey] += "%s_%s_q, %s_channel," %(templateKey,portName,portAttr['msgtype'][1])
-                            self.schedArgs["%sScheduler" % (templateKey)] += "%s_%s_q," %(templateKey,portName)
+                                        self.templateArgs[templateKey] += "%s_%s_q%s, %s_channel," %(templateKey,portName,idx,portAttr['msgtype'][1])
+                            self.schedArgs["%sScheduler" % (templateKey)] += "%s_%s_q%s," %(templateKey,portName,idx)
                 
                     self.templateArgs[templateKey] =  self.templateArgs[templateKey][:-1]
                     self.schedArgs["%sScheduler" % (templateKey)] = self.schedArgs["%sScheduler" % (templateKey)][:-1]           
         
                             
-        for compName, ports in self.modelData.items():
-            if compName in self.cfg:
-                self.add_xta("genericComponent.jinja", {'compInfo' : self.cfg[compName].code_metadata})
-                self.add_xta("batchScheduler.jinja", {'compInfo' : self.sched[compName].scheduler_metadata})    
+        self.xtaWriter.write(self.component_xta(self.componentTypes))
                     
         # for compName, ports in self.modelData.items():
         #     if compName in self.cfg:
@@ -371,18 +852,237 @@ class riaps2uppaal():
         #         if portAttr["type"] == "ans":
         #             self.add_xta("answer.jinja")
         #             #self.xtaContent.append("answer")
+        groups = []
+        if self.reduceClocks:
+            codeMetadata = self.code_metadata()
+            # the timers of symmetric actors are arrays and keep their own clocks
+            groups = timer_groups(self.modelData, {actorName : actorObj for actorName, actorObj in self.actorMap.items() if actorName not in self.symmetricActors}, codeMetadata)
+            for period, timers in groups:
+                self.xtaWriter.render(get_environment().get_template("timerGroup.jinja"), {'period' : period, 'timers' : timers})
+            self.clockReport = clock_report(self.modelData, self.actorMap, codeMetadata,
+                                            {compName : self.component_metadata(compName) for compName in self.cfg}, groups)
         self.add_xta("urgentEdge.jinja")
-        self.add_xta("templateInst.jinja", {'actorMap' : self.actorMap,'compInfo' : self.modelData, 'templateArgs': self.templateArgs, 'schedArgs' : self.schedArgs})
+        self.add_xta("templateInst.jinja", {'actorMap' : self.actorMap,'compInfo' : self.modelData, 'templateArgs': self.templateArgs, 'schedArgs' : self.schedArgs,
+                                            'timerGroups' : groups, 'groupedTimers' : set(timer for period, timers in groups for timer in timers),
+                                            'symmetric' : self.symmetricActors, 'symmetricInstances' : symmetricInstances,
+                                            'symmetricProcesses' : [process for item in symmetricInstances for process in item['processes']]})
         
-obj = riaps2uppaal('/home/riaps/riaps_projects/DistributedEstimator/Python/','DistributedEstimator')
-obj.parse_model('sample.riaps')
-obj.parse_depl('variation1.depl')
-obj.generate_cfg()
-# for comp, item in obj.cfg.items():
-#     print(item.code_metadata)
-obj.merge_xta()
-# g = obj.print_cfg()
-# for item in g:
-#     print(item)
-# obj.generate_xml()
-# obj.parse_comments()
\ No newline at end of file
+    def deployment_copy(self, deplFile):
+        """
+        Copy that shares the parsed model and the component CFGs with this
+        object but has its own deployment state and output file.
+        """
+        other = copy.copy(self)
+        other.actorMap = copy.deepcopy(self.actorMap)
+        for actorName, actorObj in other.actorMap.items():
+            actorObj.pop('target', None)
+        other.templateArgs = {}
+        other.schedArgs = {}
+        other.xtaContent = []
+        other.messageIndex = None
+        other.xtaFile = "%s/%s_%s.xta" %(self.appFolder, self.appName, os.path.splitext(os.path.basename(deplFile))[0])
+        return other
+    
+    def reports(self):
+        """
+        What the last merge_xta found out about the network, for
+        print_reports.
+        """
+        return {'ports' : self.portReport, 'committed' : self.compressedLocations, 'time' : self.timeReport,
+                'clocks' : self.clockReport, 'stats' : self.modelStats}
+    
+    def deployment_summary(self, deplFile, elapsed):
+        hosts = set()
+        instances = 0
+        # the urgent edge helper
+        processes = 1
+        for actor, actuals in self.actorMap.items():
+            hosts.update(actuals['target'])
+            for compAttr in actuals['comps']:
+                count = len(actuals['target'])
+                portProcesses = sum(1 for portAttr in self.modelData[compAttr['type']]['ports'].values() if portAttr['type'] in PORT_PROCESSES)
+                instances += count
+                # component, scheduler and port processes of every instance
+                processes += count*(2 + portProcesses)
+        return {'deployment' : deplFile, 'hosts' : len(hosts), 'instances' : instances,
+                'processes' : processes, 'time' : elapsed, 'xta' : self.xtaFile, 'reports' : self.reports()}
+    
+    def group_copy(self, group, name):
+        """
+        Copy that writes the sub-network of the actors in group, with only
+        the declarations and templates they need, to its own file.
+        """
+        other = copy.copy(self)
+        other.actorMap = group_actor_map(self.actorMap, group)
+        other.templateArgs = {}
+        other.schedArgs = {}
+        other.xtaContent = []
+        other.messageIndex = None
+        other.componentTypes = set(compVal['type'] for actorObj in other.actorMap.values() if actorObj['target'] for compVal in actorObj['comps'])
+        other.xtaFile = "%s/%s_%s.xta" %(self.appFolder, self.appName, name)
+        return other
+    
+    def decompose(self, parallel=None, workers=None):
+        """
+        Generate one .xta per group of deployed actors that shares no channel
+        with the rest of the deployment, <appName>_part<n>.xta. The groups can
+        be verified independently. Returns one summary row per group.
+        """
+        assert self.cfg, "call generate_cfg() first to get the component models"
+        assert parallel in (None, 'process', 'thread'), "parallel must be None, 'process' or 'thread'"
+        if self.messageIndex is None:
+            self.messageIndex = message_index(self.modelData, self.actorMap)
+        self.component_xta()
+        groups = interaction_groups(self.modelData, self.actorMap, self.messageIndex)
+        jobs = [(self.group_copy(group, 'part%d' % number), 'part%d' % number) for number, group in enumerate(groups, 1)]
+        if parallel is None:
+            return [translate_group(obj, name) for obj, name in jobs]
+        executor = ProcessPoolExecutor if parallel == 'process' else ThreadPoolExecutor
+        with executor(max_workers=workers) as pool:
+            return map_jobs(pool, translate_group, jobs)
+    
+    def slice_query(self, query, output=None):
+        """
+        Write only the cone of influence of query, a verification query or a
+        list of process and variable names, to output (by default
+        <appName>_slice.xta): the actors it names and the actors whose
+        messages can reach them. Returns the (host, actor) pairs kept and
+        keeps the reports of the slice in sliceReports.
+        """
+        seeds = query_seeds(query, self.modelData, self.actorMap)
+        if not seeds:
+            raise ValueError('the query %r names no deployed process or variable; translate the whole deployment instead' % query.strip())
+        cone = cone_of_influence(influence_graph(self.modelData, self.actorMap), seeds)
+        other = self.group_copy(cone, 'slice')
+        other.merge_xta(output)
+        self.sliceReports = other.reports()
+        return [(host, actorName) for actorName, actorObj in self.actorMap.items() for host in actorObj['target'] if (host, actorName) in cone]
+    
+    def sweep(self, deplFiles, parallel='thread', workers=None):
+        """
+        Generate one .xta per deployment file. The model and the component
+        CFGs are shared; only parse_depl and the deployment dependent parts of
+        merge_xta run per deployment. Returns one summary row per deployment.
+        """
+        assert self.cfg, "call generate_cfg() first to get the component models"
+        assert parallel in (None, 'process', 'thread'), "parallel must be None, 'process' or 'thread'"
+        self.component_xta()
+        jobs = [(self.deployment_copy(deplFile), deplFile) for deplFile in deplFiles]
+        if parallel is None:
+            return [translate_deployment(obj, deplFile) for obj, deplFile in jobs]
+        executor = ProcessPoolExecutor if parallel == 'process' else ThreadPoolExecutor
+        with executor(max_workers=workers) as pool:
+            return map_jobs(pool, translate_deployment, jobs)
+        
+def translate_group(obj, name):
+    start = time.time()
+    obj.merge_xta()
+    return obj.deployment_summary(name, time.time() - start)
+        
+def translate_deployment(obj, deplFile):
+    start = time.time()
+    obj.parse_depl(deplFile)
+    obj.merge_xta()
+    return obj.deployment_summary(deplFile, time.time() - start)
+
+def print_reports(reports, stats=False, statsJson=None, name=None):
+    """
+    Print the reports of one network to stderr, prefixed with its name when
+    there are several, and write its statistics to statsJson, to
+    <statsJson>_<name>.json for a named network.
+    """
+    prefix = '%s: ' % name if name else ''
+    if reports['ports'] is not None:
+        for line in reports['ports']['unconnected']:
+            print('%sunconnected port %s' % (prefix, line), file=sys.stderr)
+        print('%sports removed: %s' % (prefix, ', '.join(reports['ports']['removed']) or 'none'), file=sys.stderr)
+    if reports['committed']:
+        print('%scommitted locations removed: %d' % (prefix, sum(reports['committed'].values())), file=sys.stderr)
+    if reports['time'] is not None:
+        print(prefix + 'time unit: %(unit)d, largest constant %(largest)d -> %(scaled)d, rounding error at most %(error)d' % reports['time'], file=sys.stderr)
+    if reports['clocks'] is not None:
+        print(prefix + 'clocks: %(before)d before, %(after)d after reduction (%(exec_time)d exec_time clocks removed, %(timers)d timer clocks shared)' % reports['clocks'], file=sys.stderr)
+    if stats and reports['stats'] is not None:
+        if name:
+            print('%sstatistics' % prefix, file=sys.stderr)
+        print(format_stats(reports['stats']), file=sys.stderr)
+    if statsJson and reports['stats'] is not None:
+        if name:
+            root, ext = os.path.splitext(statsJson)
+            statsJson = '%s_%s%s' % (root, os.path.splitext(os.path.basename(name))[0], ext or '.json')
+        write_stats(reports['stats'], statsJson)
+
+def format_summary(rows):
+    header = ['deployment', 'hosts', 'instances', 'processes', 'time [s]', 'xta']
+    table = [header] + [[row['deployment'], str(row['hosts']), str(row['instances']),
+                         str(row['processes']), '%.3f' % row['time'], row['xta']] for row in rows]
+    widths = [max(len(line[i]) for line in table) for i in range(len(header))]
+    lines = ['  '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip() for line in table]
+    lines.insert(1, '  '.join('-'*width for width in widths))
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser(description='Translate a RIAPS application into an UPPAAL timed automata network')
+    argParser.add_argument('appFolder', help='the application directory')
+    argParser.add_argument('appName', help='the application name')
+    argParser.add_argument('-m','--model', action='store', dest='model', default=None, help='model file, defaults to <appName>.riaps')
+    argParser.add_argument('-d','--depl', action='store', dest='depl', default=None, help='deployment file, defaults to <appName>.depl')
+    argParser.add_argument('-s','--sweep', action='store', dest='sweep', nargs='+', default=None, help='generate one .xta for each of these deployment files')
+    argParser.add_argument('-o','--output', action='store', dest='output', default=None, help="output file, '-' for stdout, defaults to <appFolder>/<appName>.xta")
+    argParser.add_argument('-p','--parallel', action='store', dest='parallel', choices=['process','thread'], default=None, help='translate components in parallel')
+    argParser.add_argument('-w','--workers', action='store', dest='workers', type=int, default=None, help='number of parallel workers')
+    argParser.add_argument('-c','--coverage', action='store', dest='coverage', default=None, help='coverage.py data file, statements that never ran in handlers that did are left out')
+    argParser.add_argument('-q','--queue', action='store', dest='queue', choices=QUEUE_MODELS, default='array', help='port queue model, counter keeps only the number of queued messages')
+    argParser.add_argument('-b','--bounds', action='store_true', dest='bounds', help='infer a bound for every port queue and flag overflows, implies the counter queue model')
+    argParser.add_argument('-r','--reduce-clocks', action='store_true', dest='reduce_clocks', help='drop unused clocks and share the clocks of periodic timers')
+    argParser.add_argument('-k','--compress', action='store_true', dest='compress', help='merge chains of committed locations in the component templates')
+    argParser.add_argument('-y','--symmetry', action='store_true', dest='symmetry', help='instantiate interchangeable actor instances, those of actors with the same components and ports, once over a scalar set')
+    argParser.add_argument('-u','--prune-ports', action='store_true', dest='prune_ports', help='drop ports no other deployed port talks to and report unconnected ports')
+    argParser.add_argument('-D','--decompose', action='store_true', dest='decompose', help='write one .xta per group of actors that share no channel with the others')
+    argParser.add_argument('-S','--slice', action='store', dest='slice', nargs='+', default=None, help='write only what can influence these queries, query files or process and variable names')
+    argParser.add_argument('-t','--normalize-time', action='store_true', dest='normalize_time', help='divide all timing constants by their greatest common divisor')
+    argParser.add_argument('--quantum', action='store', dest='quantum', type=int, default=None, help='divide all timing constants by this time quantum, rounding them conservatively')
+    argParser.add_argument('--stats', action='store_true', dest='stats', help='print the size of every template and an estimate of the state vector')
+    argParser.add_argument('--stats-json', action='store', dest='stats_json', default=None, help='write the size statistics of the network to this JSON file, one file per network with a suffix when there are several')
+    argParser.add_argument('--profile', action='store', dest='profile', default=None, help='write a trace of the translation phases to this file, for chrome://tracing or Perfetto, also set by %s' % TRACE_VARIABLE)
+    argParser.add_argument('--cprofile', action='store', dest='cprofile', default=None, help='dump cProfile statistics of every outermost translation phase into this directory, also set by %s' % CPROFILE_VARIABLE)
+    argParser.add_argument('--no-cache', action='store_true', dest='no_cache', help='do not read or write cached translations')
+    argParser.add_argument('--cache-dir', action='store', dest='cache_dir', default=None, help='cache directory, defaults to <appFolder>/%s' % CACHE_DIR)
+    args = argParser.parse_args()
+    
+    obj = riaps2uppaal(args.appFolder, args.appName, useCache=not args.no_cache, cacheDir=args.cache_dir, queueModel=args.queue, queueBounds=args.bounds, reduceClocks=args.reduce_clocks, compressCommitted=args.compress, symmetry=args.symmetry, pruneDeadPorts=args.prune_ports,
+                       normalizeTime=args.normalize_time, timeQuantum=args.quantum, collectStats=args.stats or args.stats_json is not None,
+                       profileTrace=args.profile, profileDir=args.cprofile)
+    obj.parse_model(args.model)
+    if args.sweep:
+        obj.generate_cfg(parallel=args.parallel, workers=args.workers, coverage=args.coverage)
+        rows = obj.sweep(args.sweep, parallel=args.parallel, workers=args.workers)
+        print(format_summary(rows))
+        for row in rows:
+            print_reports(row['reports'], args.stats, args.stats_json, row['deployment'])
+    else:
+        obj.parse_depl(args.depl)
+        obj.generate_cfg(parallel=args.parallel, workers=args.workers, coverage=args.coverage)
+        # for comp, item in obj.cfg.items():
+        #     print(item.code_metadata)
+        if args.decompose:
+            rows = obj.decompose(parallel=args.parallel, workers=args.workers)
+            print(format_summary(rows))
+            for row in rows:
+                print_reports(row['reports'], args.stats, args.stats_json, row['deployment'])
+        elif args.slice:
+            query = ' '.join(open(item).read() if os.path.isfile(item) else item for item in args.slice)
+            try:
+                kept = obj.slice_query(query, args.output)
+            except ValueError as error:
+                argParser.error(str(error))
+            print('slice: %d of %d deployed actors kept' % (len(kept), sum(len(actorObj['target']) for actorObj in obj.actorMap.values())), file=sys.stderr)
+            print_reports(obj.sliceReports, args.stats, args.stats_json)
+        else:
+            obj.merge_xta(args.output)
+            print_reports(obj.reports(), args.stats, args.stats_json)
+        # g = obj.print_cfg()
+        # for item in g:
+        #     print(item)
+    if obj.profiler is not None:
+        print(format_profile(obj.profiler.summary()), file=sys.stderr)
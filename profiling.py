@@ -0,0 +1,259 @@
+"""
+Phase level profiling of the translation.
+
+The translation steps are wrapped in phase(name), which does nothing until
+profiling is enabled, either by enable() or by setting RIAPS2UPPAAL_PROFILE
+to the file the trace is written to. Every phase then records its wall time
+and the peak of the memory traced by tracemalloc while it ran, and becomes
+a complete event of a Chrome trace that chrome://tracing or Perfetto can
+load. Phases nest; a phase inside the translation of a component is
+attributed to it. With a cProfile directory, every outermost phase is also
+run under cProfile and dumped to <name>-<n>.prof.
+
+tracemalloc keeps a single peak for the whole process, so memory is only
+measured on the main thread: phases that run in worker threads record their
+time but no peak, and the peak of a main thread phase includes whatever
+worker threads allocate meanwhile. Worker processes measure their own.
+"""
+
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+TRACE_VARIABLE = 'RIAPS2UPPAAL_PROFILE'
+CPROFILE_VARIABLE = 'RIAPS2UPPAAL_CPROFILE'
+
+_profiler = None
+
+
+class _Frame:
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = time.perf_counter()
+        self.base = None
+        self.peak = None
+
+
+class Profiler:
+    def __init__(self, memory=True, profileDir=None):
+        self.memory = memory
+        self.profileDir = profileDir
+        self.events = []
+        self.calls = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # only one cProfile profiler runs at a time
+        self.profiling = False
+        self.startedTracing = False
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.startedTracing = True
+
+    def settings(self):
+        return self.memory, self.profileDir
+
+    def stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def sample(self, stack):
+        """
+        Fold the memory peak since the last sample into the open phases of
+        the main thread. Other threads must not reset the peak, which is
+        shared by the whole process, and get None.
+        """
+        if self.memory and threading.current_thread() is threading.main_thread():
+            current, peak = tracemalloc.get_traced_memory()
+            for frame in stack:
+                frame.peak = max(frame.peak, peak)
+            tracemalloc.reset_peak()
+            return current
+        return None
+
+    @contextlib.contextmanager
+    def phase(self, name, **args):
+        stack = self.stack()
+        if stack and 'component' in stack[-1].args and 'component' not in args:
+            args['component'] = stack[-1].args['component']
+        current = self.sample(stack)
+        frame = _Frame(name, args)
+        frame.base = frame.peak = current
+        stack.append(frame)
+        profile = None
+        if self.profileDir is not None and len(stack) == 1:
+            with self.lock:
+                if not self.profiling:
+                    self.profiling = True
+                    profile = cProfile.Profile()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield frame
+        finally:
+            if profile is not None:
+                profile.disable()
+            end = time.perf_counter()
+            self.sample(stack)
+            stack.pop()
+            self.record(frame, end)
+            if profile is not None:
+                self.dump(profile, frame)
+
+    def record(self, frame, end):
+        args = dict(frame.args)
+        if frame.base is not None:
+            args['peak_bytes'] = frame.peak - frame.base
+        event = {'name': frame.name, 'cat': args.get('component', 'phase'), 'ph': 'X',
+                 'ts': frame.start*1e6, 'dur': (end - frame.start)*1e6,
+                 'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args}
+        with self.lock:
+            self.events.append(event)
+            self.calls[frame.name] = self.calls.get(frame.name, 0) + 1
+
+    def dump(self, profile, frame):
+        os.makedirs(self.profileDir, exist_ok=True)
+        name = '-'.join([frame.name] + ([frame.args['component']] if 'component' in frame.args else []))
+        profile.dump_stats(os.path.join(self.profileDir, '%s-%d.prof' % (name, self.calls[frame.name])))
+        with self.lock:
+            self.profiling = False
+
+    def merge(self, events):
+        """
+        Add the events recorded by another process.
+        """
+        with self.lock:
+            for event in events:
+                self.events.append(event)
+                self.calls[event['name']] = self.calls.get(event['name'], 0) + 1
+
+    def summary(self):
+        """
+        Calls, total wall time in seconds and largest memory peak in bytes,
+        by phase and by phase and component.
+        """
+        phases = {}
+        components = {}
+        for event in self.events:
+            keys = [(phases, event['name'])]
+            if 'component' in event['args']:
+                keys.append((components, (event['args']['component'], event['name'])))
+            for table, key in keys:
+                row = table.setdefault(key, {'calls': 0, 'time': 0.0, 'peak': 0})
+                row['calls'] += 1
+                row['time'] += event['dur']/1e6
+                row['peak'] = max(row['peak'], event['args'].get('peak_bytes', 0))
+        return {'phases': phases, 'components': components}
+
+    def trace(self):
+        return {'traceEvents': sorted(self.events, key=lambda event: event['ts']), 'displayTimeUnit': 'ms'}
+
+    def write_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.trace(), f)
+
+    def close(self):
+        if self.startedTracing:
+            tracemalloc.stop()
+            self.startedTracing = False
+
+
+def enable(trace=None, memory=True, profileDir=None):
+    """
+    Start profiling in this process. With trace the trace is written to that
+    file when the process exits.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(memory, profileDir)
+        if trace is not None:
+            atexit.register(_profiler.write_trace, os.path.abspath(trace))
+    return _profiler
+
+
+def enable_from_environment():
+    """
+    Enable profiling if RIAPS2UPPAAL_PROFILE names a trace file.
+    """
+    if os.environ.get(TRACE_VARIABLE):
+        return enable(os.environ[TRACE_VARIABLE], profileDir=os.environ.get(CPROFILE_VARIABLE) or None)
+    return _profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+def phase(name, **args):
+    if _profiler is None:
+        return contextlib.nullcontext()
+    return _profiler.phase(name, **args)
+
+
+def profiled(name):
+    """
+    Decorator that runs every call of a function as a phase.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_call(settings, function, *args):
+    """
+    Run function in a worker process under a profiler of its own, and return
+    its result together with the recorded events.
+    """
+    global _profiler
+    outer = _profiler
+    _profiler = Profiler(*settings)
+    try:
+        result = function(*args)
+        return result, _profiler.events
+    finally:
+        _profiler.close()
+        _profiler = outer
+
+
+def map_jobs(pool, function, jobs):
+    """
+    The results of function(*job) for every job, run on pool. Worker
+    processes profile on their own and send back their events.
+    """
+    traced = _profiler is not None and isinstance(pool, ProcessPoolExecutor)
+    if traced:
+        futures = [pool.submit(traced_call, _profiler.settings(), function, *job) for job in jobs]
+    else:
+        futures = [pool.submit(function, *job) for job in jobs]
+    results = []
+    for future in futures:
+        if traced:
+            result, events = future.result()
+            _profiler.merge(events)
+        else:
+            result = future.result()
+        results.append(result)
+    return results
+
+
+def format_profile(summary):
+    header = ['phase', 'component', 'calls', 'time [s]', 'peak [KiB]']
+    rows = [[name, '', row] for name, row in summary['phases'].items()]
+    rows += [[name, component, row] for (component, name), row in sorted(summary['components'].items())]
+    table = [header] + [[name, component, str(row['calls']), '%.3f' % row['time'], '%.1f' % (row['peak']/1024)] for name, component, row in rows]
+    widths = [max(len(line[i]) for line in table) for i in range(len(header))]
+    lines = ['  '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip() for line in table]
+    lines.insert(1, '  '.join('-'*width for width in widths))
+    return '\n'.join(lines)
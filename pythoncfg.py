@@ -8,36 +8,109 @@ Use http://viz-js.com/ to view digraph output
 """
 
 import ast
-import horast
+import bisect
+import io
+import json
+import os
 import re
-import astunparse
-import pygraphviz
-import typed_ast.ast3 as tast
 import random
+import sys
+import types
+from profiling import phase
+
+# bump whenever the generated metadata changes, cached translations depend on it
+__version__ = '0.1.3'
+
+SPEC_GRAMMAR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'xtaspec.tx')
+
+# horast.parse recurses once per nesting level, about four frames per elif,
+# so the default limit of 1000 stops it at some 250 chained elif
+PARSE_RECURSION_LIMIT = 20000
+
+# the parsing modules are heavy to import and not needed when every
+# translation comes from the cache, load_ast_modules() binds them on first use
+horast = None
+astunparse = None
+tast = None
+TextXSyntaxError = None
+_metamodel = None
+
+def load_ast_modules():
+    global horast, astunparse, tast
+    if horast is None:
+        with phase('load_ast_modules'):
+            import horast as _horast
+            import astunparse as _astunparse
+            import typed_ast.ast3 as _tast
+        horast, astunparse, tast = _horast, _astunparse, _tast
+
+def get_metamodel():
+    """
+    The textX metamodel of the timing annotations, built once and shared by
+    all PyCFG instances.
+    """
+    global _metamodel, TextXSyntaxError
+    if _metamodel is None:
+        with phase('textx.metamodel'):
+            from textx import metamodel_from_file
+            from textx.exceptions import TextXSyntaxError as _TextXSyntaxError
+            TextXSyntaxError = _TextXSyntaxError
+            _metamodel = metamodel_from_file(SPEC_GRAMMAR)
+    return _metamodel
+
+class CFGContext:
+    """
+    Node storage of a single CFG. Every PyCFG owns one, so several
+    components can be translated side by side.
+    """
+    def __init__(self):
+        self.registry = 0
+        self.cache = {}
+        self.stack = []
+
+    def reset(self):
+        self.registry = 0
+        self.cache = {}
+        self.stack = []
+
+    def register(self, node):
+        rid = self.registry
+        self.cache[rid] = node
+        self.registry += 1
+        return rid
 
-from textx import metamodel_from_file
-from textx.exceptions import TextXSyntaxError
 
-class CFGNode(dict):
-    registry = 0
-    cache = {}
-    stack = []
-    def __init__(self, parents=[], ast=None):
+class CFGNode:
+    """
+    A CFG node. Parents and children are kept in insertion order, with a set
+    of their ids for constant time membership tests. Attributes outside of
+    the constructor (exit_nodes, return_nodes, calllink, calleelink and
+    fn_exit_node) are only set on the nodes that need them.
+    """
+    __slots__ = ('kind', 'parents', 'children', 'calls', 'ast_node', 'rid', 'line', 'text',
+                 'parent_ids', 'child_ids',
+                 'exit_nodes', 'return_nodes', 'calllink', 'calleelink', 'fn_exit_node')
+
+    def __init__(self, ctx, parents=[], ast=None):
         #assert type(parents) is list
         if type(parents) is tuple:
             self.kind = parents[1]
-            self.parents = parents[0]
+            parents = parents[0]
         else:
             self.kind = ''
-            self.parents = parents
+        self.parents = list(parents)
+        self.parent_ids = {p.rid for p in self.parents}
         self.calls = []
         self.children = []
+        self.child_ids = set()
         self.ast_node = ast
-        self.rid  = CFGNode.registry
-        CFGNode.cache[self.rid] = self
-        CFGNode.registry += 1
+        self.line = None
+        self.text = None
+        self.rid  = ctx.register(self)
 
     def lineno(self):
+        if self.line is not None:
+            return self.line
         return self.ast_node.lineno if hasattr(self.ast_node, 'lineno') else 0
 
     def __str__(self):
@@ -48,7 +121,8 @@ class CFGNode(dict):
         return str(self)
 
     def add_child(self, c):
-        if c not in self.children:
+        if c.rid not in self.child_ids:
+            self.child_ids.add(c.rid)
             self.children.append(c)
 
     def __eq__(self, other):
@@ -57,11 +131,16 @@ class CFGNode(dict):
     def __neq__(self, other):
         return self.rid != other.rid
 
+    def __hash__(self):
+        return hash(self.rid)
+
     def set_parents(self, p):
-        self.parents = p
+        self.parents = list(p)
+        self.parent_ids = {n.rid for n in self.parents}
 
     def add_parent(self, p):
-        if p not in self.parents:
+        if p.rid not in self.parent_ids:
+            self.parent_ids.add(p.rid)
             self.parents.append(p)
 
     def add_parents(self, ps):
@@ -72,18 +151,46 @@ class CFGNode(dict):
         self.calls.append(func)
 
     def source(self):
+        if self.text is not None:
+            return self.text
+        if self.ast_node is None:
+            return ''
+        load_ast_modules()
         return horast.unparse(self.ast_node).strip()
 
+    def drop_ast(self, keep_source=False):
+        """
+        Release the AST node, keeping its line number and optionally its
+        source text.
+        """
+        if self.ast_node is None:
+            return
+        self.line = self.lineno()
+        self.text = self.source() if keep_source else None
+        self.ast_node = None
+
     def to_json(self):
         return {'id':self.rid, 'parents': [p.rid for p in self.parents], 'children': [c.rid for c in self.children], 'calls': self.calls, 'at':self.lineno() ,'ast':self.source()}
 
 
+def raise_recursion_limit():
+    """
+    Raise the recursion limit to PARSE_RECURSION_LIMIT for good. The limit
+    is process wide, so it is never lowered again: a parse in one thread
+    could otherwise restore it while another is deep inside horast.parse.
+    """
+    if sys.getrecursionlimit() < PARSE_RECURSION_LIMIT:
+        sys.setrecursionlimit(PARSE_RECURSION_LIMIT)
+
+
 class PyCFG:
     """
     The python CFG
     """
     def __init__(self):
-        self.founder = CFGNode(parents=[], ast=horast.parse('start').body[0]) # sentinel
+        load_ast_modules()
+        self.ctx = CFGContext()
+        self.founder = CFGNode(parents=[], ast=horast.parse('start').body[0], ctx=self.ctx) # sentinel
         self.founder.ast_node.lineno = 0
         self.functions = {}
         self.functions_node = {}
@@ -96,26 +203,55 @@ class PyCFG:
         self.code_metadata['edges']=[]
         self.code_metadata['specs']=[]
         self.code_metadata['port_args'] = ''
+        # port and function calls by defining function, see add_port_call
+        self.code_metadata['port_calls'] = []
+        # indexes over the locations and edges of code_metadata
+        self.loc_index = {}
+        self.loc_prefix = {}
+        self.edge_index = {}
+        self.node_function = {}
         self.auto_edges = []
         self.user_edges = []
         self.port_data = None
         self.origin = None
-        self.metamodel = metamodel_from_file("templates/xtaspec.tx")
+        self.covered = None
+        # handlers the coverage run never dispatched
+        self.unrun_handlers = set()
 
     def parse(self, src):
+        raise_recursion_limit()
         return horast.parse(src)
 
     def walk(self, node, myparents):
+        """
+        Walk node with an explicit stack instead of recursion. Handlers that
+        need to walk a child are generators: they yield (child, parents) and
+        are sent back the result of walking it. Other handlers simply return
+        their result.
+        """
+        stack = []
+        value = self.visit(node, myparents)
+        while True:
+            if isinstance(value, types.GeneratorType):
+                stack.append(value)
+                value = None
+            elif not stack:
+                return value
+            try:
+                child, parents = stack[-1].send(value)
+            except StopIteration as stop:
+                stack.pop()
+                value = stop.value
+                continue
+            value = self.visit(child, parents)
+            
+    def visit(self, node, myparents):
         if node is None: return
         fname = "on_%s" % node.__class__.__name__.lower()
         #print(fname)
-        # print(fname)
         if hasattr(self, fname):
             fn = getattr(self, fname)
-            # print('fn')
-            # print(fname)
-            v = fn(node, myparents)
-            return v
+            return fn(node, myparents)
         else:
             return myparents
         
@@ -123,10 +259,10 @@ class PyCFG:
         # print(ast.dump(node))
         if node.bases[0].id == 'Component':
             self.code_metadata['template'] = node.name
-        p = [CFGNode(parents=[], ast=horast.parse('_class: %s' % node.name))]
+        p = [CFGNode(parents=[], ast=horast.parse('_class: %s' % node.name), ctx=self.ctx)]
         p[0].ast_node.lineno=node.lineno
         for c_method in node.body:
-            p=self.walk(c_method, p)
+            p = (yield c_method, p)
         return myparents
 
     def on_module(self, node, myparents):
@@ -137,7 +273,7 @@ class PyCFG:
         # the result to next statement
         p = myparents
         for n in node.body:
-            p = self.walk(n, p)
+            p = (yield n, p)
         return p
 
     def on_assign(self, node, myparents):
@@ -149,14 +285,14 @@ class PyCFG:
         """
         # print(ast.dump(node))
         if len(node.targets) > 1: raise NotImplemented('Parallel assignments')
-        p = [CFGNode(parents=myparents, ast=node)]
-        p = self.walk(node.value, p)
-        r=self.walk(node.targets[0],myparents)
+        p = [CFGNode(parents=myparents, ast=node, ctx=self.ctx)]
+        p = (yield node.value, p)
+        r = (yield node.targets[0], myparents)
 
         return p
 
     def on_pass(self, node, myparents):
-        return [CFGNode(parents=myparents, ast=node)]
+        return [CFGNode(parents=myparents, ast=node, ctx=self.ctx)]
 
     def on_break(self, node, myparents):
         parent = myparents[0]
@@ -165,7 +301,7 @@ class PyCFG:
             parent = parent.parents[0]
 
         assert hasattr(parent, 'exit_nodes')
-        p = CFGNode(parents=myparents, ast=node)
+        p = CFGNode(parents=myparents, ast=node, ctx=self.ctx)
 
         # make the break one of the parents of label node.
         parent.exit_nodes.append(p)
@@ -179,7 +315,7 @@ class PyCFG:
             # we have ordered parents
             parent = parent.parents[0]
         assert hasattr(parent, 'exit_nodes')
-        p = CFGNode(parents=myparents, ast=node)
+        p = CFGNode(parents=myparents, ast=node, ctx=self.ctx)
 
         # make continue one of the parents of the original test node.
         parent.add_parent(p)
@@ -190,20 +326,20 @@ class PyCFG:
 
     def on_for(self, node, myparents):
         #node.target in node.iter: node.body
-        _test_node = CFGNode(parents=myparents, ast=horast.parse('_for: True if %s else False' % horast.unparse(node.iter).strip()).body[0])
+        _test_node = CFGNode(parents=myparents, ast=horast.parse('_for: True if %s else False' % horast.unparse(node.iter).strip()).body[0], ctx=self.ctx)
         tast.copy_location(_test_node.ast_node, node)
 
         # we attach the label node here so that break can find it.
         _test_node.exit_nodes = []
-        test_node = self.walk(node.iter, [_test_node])
+        test_node = (yield node.iter, [_test_node])
 
-        extract_node = CFGNode(parents=[_test_node], ast=ast.parse('%s = %s.shift()' % (horast.unparse(node.target).strip(), astunparse.unparse(node.iter).strip())).body[0])
+        extract_node = CFGNode(parents=[_test_node], ast=ast.parse('%s = %s.shift()' % (horast.unparse(node.target).strip(), astunparse.unparse(node.iter).strip())).body[0], ctx=self.ctx)
         tast.copy_location(extract_node.ast_node, _test_node.ast_node)
 
         # now we evaluate the body, one at a time.
         p1 = [extract_node]
         for n in node.body:
-            p1 = self.walk(n, p1)
+            p1 = (yield n, p1)
 
         # the test node is looped back at the end of processing.
         _test_node.add_parents(p1)
@@ -214,11 +350,11 @@ class PyCFG:
     def on_while(self, node, myparents):
         # For a while, the earliest parent is the node.test
         # lbl1 node
-        _test_node = CFGNode(parents=myparents, ast=horast.parse('_while: %s' % horast.unparse(node.test).strip()).body[0])
+        _test_node = CFGNode(parents=myparents, ast=horast.parse('_while: %s' % horast.unparse(node.test).strip()).body[0], ctx=self.ctx)
         tast.copy_location(_test_node.ast_node, node.test)
         _test_node.exit_nodes = []
         # p
-        test_node = self.walk(node.test, [_test_node])
+        test_node = (yield node.test, [_test_node])
 
         # # we attach the label node here so that break can find it.
         #
@@ -232,15 +368,15 @@ class PyCFG:
         #
         # # link label node back to the condition.
         # return _test_node.exit_nodes
-        lbl2_node = CFGNode(parents=test_node, ast=node.test)
-        g_false = CFGNode(parents=[lbl2_node], ast=horast.parse("_if:False"))
-        g_true = CFGNode(parents=[lbl2_node], ast=horast.parse("_if:True"))
+        lbl2_node = CFGNode(parents=test_node, ast=node.test, ctx=self.ctx)
+        g_false = CFGNode(parents=[lbl2_node], ast=horast.parse("_if:False"), ctx=self.ctx)
+        g_true = CFGNode(parents=[lbl2_node], ast=horast.parse("_if:True"), ctx=self.ctx)
         _test_node.exit_nodes = [g_false]
 
         p = [g_true]
 
         for n in node.body:
-            p = self.walk(n, p)
+            p = (yield n, p)
 
         # the last node is the parent for the lb1 node.
         _test_node.add_parents(p)
@@ -249,35 +385,35 @@ class PyCFG:
 
 
     def on_if(self, node, myparents):
-        _test_node = CFGNode(parents=myparents, ast=horast.parse('_if: %s' % horast.unparse(node.test).strip()).body[0])
+        _test_node = CFGNode(parents=myparents, ast=horast.parse('_if: %s' % horast.unparse(node.test).strip()).body[0], ctx=self.ctx)
         tast.copy_location(_test_node.ast_node, node.test)
-        test_node = self.walk(node.test, [_test_node])
+        test_node = (yield node.test, [_test_node])
         g1 = (test_node, True)
         for n in node.body:
-            g1 = self.walk(n, g1)
+            g1 = (yield n, g1)
         g2 = (test_node, False)
         for n in node.orelse:
-            g2 = self.walk(n, g2)
+            g2 = (yield n, g2)
         # treat no else as a simple pass    
         if len(node.orelse) == 0:
             g2 = self.on_pass(n, g2)
         return g1 + g2
 
     def on_binop(self, node, myparents):
-        left = self.walk(node.left, myparents)
+        left = (yield node.left, myparents)
         # print(ast.dump(node))
         # print(node.left.__class__.__name__.lower())
         # print(node.left.value.id)
-        right = self.walk(node.right, left)
+        right = (yield node.right, left)
         return right
 
     def on_compare(self, node, myparents):
-        left = self.walk(node.left, myparents)
-        right = self.walk(node.comparators[0], left)
+        left = (yield node.left, myparents)
+        right = (yield node.comparators[0], left)
         return right
 
     def on_unaryop(self, node, myparents):
-        return self.walk(node.operand, myparents)
+        return (yield node.operand, myparents)
     
     def on_attribute(self, node, myparents):
         # if node.value.id == 'self':
@@ -292,12 +428,13 @@ class PyCFG:
 
     def on_call(self, node, myparents):
         def get_func(node):
+            # f()() calls the result of f(), the name is that of the innermost call
+            while type(node.func) is tast.Call:
+                node = node.func
             if type(node.func) is tast.Name:
                 mid = node.func.id
             elif type(node.func) is tast.Attribute:
                 mid = node.func.attr
-            elif type(node.func) is tast.Call:
-                mid = get_func(node.func)
             else:
                 raise Exception(str(type(node.func)))
             return mid
@@ -305,7 +442,7 @@ class PyCFG:
 
         p = myparents
         for a in node.args:
-            p = self.walk(a, p)
+            p = (yield a, p)
         mid = get_func(node)
         myparents[0].add_calls(mid)
 
@@ -318,8 +455,8 @@ class PyCFG:
         return p
 
     def on_expr(self, node, myparents):
-        p = [CFGNode(parents=myparents, ast=node)]
-        return self.walk(node.value, p)
+        p = [CFGNode(parents=myparents, ast=node, ctx=self.ctx)]
+        return (yield node.value, p)
 
     def on_return(self, node, myparents):
         if type(myparents) is tuple:
@@ -327,13 +464,13 @@ class PyCFG:
         else:
             parent = myparents[0]
 
-        val_node = self.walk(node.value, myparents)
+        val_node = (yield node.value, myparents)
         # on return look back to the function definition.
         while not hasattr(parent, 'return_nodes'):
             parent = parent.parents[0]
         assert hasattr(parent, 'return_nodes')
 
-        p = CFGNode(parents=val_node, ast=node)
+        p = CFGNode(parents=val_node, ast=node, ctx=self.ctx)
 
         # make the break one of the parents of label node.
         parent.return_nodes.append(p)
@@ -354,26 +491,27 @@ class PyCFG:
             pt = myparents
             # add initial location "ready"
             #self.code_metadata['arguments'] =[a.arg for a in node.args.args if a.arg != 'self']
-            self.code_metadata['locations'].append({'id': 'ready_%d' % node.lineno, 'init' : True })
+            self.add_location({'id': 'ready_%d' % node.lineno, 'init' : True })
             self.origin = 'ready_%d' %(node.lineno)
         else:
             pt = []
             # add method and handler locations
             #print(node.name+','+str(node.lineno))
-            self.code_metadata['locations'].append({'id':'%s_%d' % (node.name, node.lineno)})
+            self.add_location({'id':'%s_%d' % (node.name, node.lineno)})
             self.code_metadata['committed'].append('%s_%d' % (node.name, node.lineno))
             self.code_metadata['locations'][-1]['commit'] = True
             if node.name.startswith('on_'):
                 port_nm = node.name[3:]
-                port_info = self.port_data[self.code_metadata['template']]['ports'][port_nm]
-                if port_info['type'] == 'tim':
-                    self.code_metadata['local_variables'].append({'name': 'period', 'type' : 'int' , 'value' : port_info['period']})
+                if self.port_data is not None:
+                    port_info = self.port_data[self.code_metadata['template']]['ports'][port_nm]
+                    if port_info['type'] == 'tim':
+                        self.code_metadata['local_variables'].append({'name': 'period', 'type' : 'int' , 'value' : port_info['period']})
                 for item in self.code_metadata['locations']:
                     if 'ready' in item['id']:
                         src = item['id']
                         break
                 # add edges for handlers from the initial location
-                self.code_metadata['edges'].append({'source': src, 'target':'%s_%s' % (node.name, node.lineno), 
+                self.add_edge({'source': src, 'target':'%s_%s' % (node.name, node.lineno), 
                                                     'sync' : 'executehandler?',
                                                     'guard' : 'socket == %s_%s_q.id' % (self.code_metadata['template'],port_nm),
                                                     'assign' : "exec_time = 0"})
@@ -381,27 +519,36 @@ class PyCFG:
             else:
                 pass
                 
-        enter_node = CFGNode(parents=pt, ast=horast.parse('enter: %s(%s)' % (node.name, ', '.join([a.arg for a in node.args.args])) ).body[0]) # sentinel
+        enter_node = CFGNode(parents=pt, ast=horast.parse('enter: %s(%s)' % (node.name, ', '.join([a.arg for a in node.args.args])) ).body[0], ctx=self.ctx) # sentinel
         enter_node.calleelink = True
         tast.copy_location(enter_node.ast_node, node)
-        exit_node = CFGNode(parents=[], ast=horast.parse('exit: %s(%s)' % (node.name, ', '.join([a.arg for a in node.args.args])) ).body[0]) # sentinel
+        exit_node = CFGNode(parents=[], ast=horast.parse('exit: %s(%s)' % (node.name, ', '.join([a.arg for a in node.args.args])) ).body[0], ctx=self.ctx) # sentinel
         exit_node.fn_exit_node = True
         tast.copy_location(exit_node.ast_node, node)
         enter_node.return_nodes = [] # sentinel
 
         p = [enter_node]
+        statements = [n for n in node.body if n.__class__.__name__.lower() != "comment"]
+        if self.covered is not None and node.name.startswith('on_') and statements and statements[0].lineno not in self.covered:
+            self.unrun_handlers.add(node.name)
         
         #print(node.name)
-        for n in node.body:
-            p = self.walk(n, p)
+        for i, n in enumerate(node.body):
+            p = (yield n, p)
             if node.name.startswith('on_'):
+                following = [m for m in node.body[i+1:] if m.__class__.__name__.lower() != "comment"]
+                # the timing of statements that never ran goes with their call sites
+                if self.covered is not None and node.name not in self.unrun_handlers and (not following or following[0].lineno not in self.covered):
+                    continue
                 if n.__class__.__name__.lower() == "comment":
                     #print(n.comment)
                     try:
-                        specs = self.metamodel.model_from_str(n.comment)
+                        metamodel = get_metamodel()
+                        with phase('textx.model_from_str'):
+                            specs = metamodel.model_from_str(n.comment)
                         for ant in specs.annotations:
                             if ant.prop.__class__.__name__.lower()=="timing":
-                                self.code_metadata["locations"].append({'id':'user_op_%d' % (n.lineno), 'inv' : 'exec_time <= %d' %(ant.prop.min*10), 'min' : ant.prop.min, 'max' : ant.prop.max})
+                                self.add_location({'id':'user_op_%d' % (n.lineno), 'inv' : 'exec_time <= %d' %(ant.prop.min*10), 'min' : ant.prop.min, 'max' : ant.prop.max})
                                 #print('user_op_%d' %(n.lineno))
                     except TextXSyntaxError:
                         pass
@@ -419,16 +566,24 @@ class PyCFG:
         return myparents
 
     def get_defining_function(self, node):
-        if node.lineno() in self.functions_node: return self.functions_node[node.lineno()]
-        if not node.parents:
-            self.functions_node[node.lineno()] = ''
-            return ''
-        val = self.get_defining_function(node.parents[0])
-        self.functions_node[node.lineno()] = val
+        """
+        Name of the function that node belongs to, found by following the
+        first parents up to a function entry. Every line on the way is
+        memoized in functions_node.
+        """
+        chain = []
+        seen = set()
+        while node.lineno() not in self.functions_node and node.parents and node.rid not in seen:
+            seen.add(node.rid)
+            chain.append(node)
+            node = node.parents[0]
+        val = self.functions_node.setdefault(node.lineno(), '')
+        for n in chain:
+            self.functions_node[n.lineno()] = val
         return val
 
     def link_functions(self):
-        for nid,node in CFGNode.cache.items():
+        for nid,node in self.ctx.cache.items():
             if node.calls:
                 for calls in node.calls:
                     # print(ast.dump(node.ast_node))
@@ -458,55 +613,59 @@ class PyCFG:
                             # #passn.ast_node = exit.ast_node
 
     def update_functions(self):
-        for nid,node in CFGNode.cache.items():
-            _n = self.get_defining_function(node)
+        # node -> defining function
+        self.node_function = {}
+        for nid,node in self.ctx.cache.items():
+            self.node_function[nid] = self.get_defining_function(node)
 
     def update_children(self):
-        for nid,node in CFGNode.cache.items():
+        for nid,node in self.ctx.cache.items():
             #print(node)
             for p in node.parents:
                 p.add_child(node)
                 
     def generate_port_arguments(self):
-        for portName, portAttr in self.port_data[self.code_metadata['template']]['ports'].items():
-            if portAttr['type'] == 'tim':
-                self.code_metadata['port_args']+= 'chan &%s_%s_activate, chan &%s_%s_deactivate, chan &%s_%s_start, chan &%s_%s_cancel, chan &%s_%s_terminate, chan &%s_%s_setDelay, intq &%s_%s_q,' %(self.code_metadata['template'],portName,self.code_metadata['template'],portName,self.code_metadata['template'],portName,self.code_metadata['template'],portName,self.code_metadata['template'],portName,self.code_metadata['template'],portName,self.code_metadata['template'],portName)
-            if portAttr['type'] in ['rep','ans']:
-                if portAttr['type'] == 'ans':
-                    self.code_metadata['port_args']+= 'int& ans_port_identity, intq &%s_%s_q,broadcast chan &%s_channel,' %(self.code_metadata['template'],portName, portAttr['msgtype'][1])
-                else:
-                    self.code_metadata['port_args']+= 'intq &%s_%s_q,broadcast chan &%s_channel,' %(self.code_metadata['template'],portName, portAttr['msgtype'][1])
-            
-            if portAttr['type'] in ["pub","sub","qry","req"]:
-                self.code_metadata['port_args']+= 'intq &%s_%s_q,broadcast chan &%s_channel,' %(self.code_metadata['template'],portName, portAttr['msgtype'][0])
+        self.code_metadata['port_args'] = port_arguments(self.code_metadata['template'], self.port_data[self.code_metadata['template']]['ports'])
                 
-        self.code_metadata['port_args'] = self.code_metadata['port_args'][:-1]
+    def add_location(self, loc):
+        """
+        Append a location and index it by id and by name, i.e. the id without
+        its trailing line number, so that functions can be found by name.
+        """
+        self.code_metadata['locations'].append(loc)
+        self.loc_index[loc['id']] = loc
+        name, _, lineno = loc['id'].rpartition('_')
+        if name and lineno.isdigit():
+            self.loc_prefix.setdefault(name, loc['id'])
+        return loc
+    
+    def add_edge(self, edge):
+        self.edge_index[(edge['source'], edge['target'])] = len(self.code_metadata['edges'])
+        self.code_metadata['edges'].append(edge)
+        return edge
+    
+    def find_location(self, name):
+        """
+        Location id for an exact id or for a function name.
+        """
+        if name in self.loc_index:
+            return name
+        return self.loc_prefix.get(name)
                 
     def add_ta_edges(self, calls, called, args=None):
         
-        src = None
-        dst = None
         # print('calls'+calls)
         # print('called'+called)
-        for item in self.code_metadata['locations']:
-            if calls in item['id']:
-                dst = item['id']
-            if called in item['id']:
-                src = item['id']
-            if src is not None and dst is not None:
-                break
-        found = False
+        dst = self.find_location(calls)
+        src = self.find_location(called)
         idx = -1
         if src is not None and dst is not None:
-            for idx,edge in enumerate(self.code_metadata['edges']):
-                if src in edge['source'] and dst in edge['target']:
-                    found = True
-                    break
-            if not found:
-                self.code_metadata['edges'].append({'source': src, 'target':dst})
+            idx = self.edge_index.get((src, dst), -1)
+            if idx < 0:
+                self.add_edge({'source': src, 'target':dst})
                 self.add_guards_syncs_outs(self.code_metadata['edges'][-1],args)
                 # self.code_metadata['edges'].append({'source': dst, 'target':src})
-                idx = idx + 1
+                idx = len(self.code_metadata['edges']) - 1
         
         return idx
     
@@ -569,23 +728,33 @@ class PyCFG:
         if 'user_op' in edge['target']:
             edge['assign'] = "exec_time = 0"
     
+    def add_port_call(self, node, kind, name, value=None):
+        call = {'function': self.node_function[node.rid], 'kind': kind, 'name': name, 'line': node.lineno()}
+        if value is not None:
+            call['value'] = value
+        self.code_metadata['port_calls'].append(call)
+
     def add_riaps_ports(self):
         sequence = {}
-        for nid,node in CFGNode.cache.items():
-            if node.calls:
+        for nid,node in self.ctx.cache.items():
+            # call sites that never ran under coverage are left out, unless
+            # the whole handler never ran: the model can still dispatch it
+            if node.calls and (self.covered is None or node.lineno() in self.covered or self.node_function[node.rid] in self.unrun_handlers):
                 for calls in node.calls:
                     if calls in self.functions:
                         if 'init' not in calls:
                             # called = self.get_defining_function(node)
                             # print(node.lineno())
                             sequence[node.lineno()]=(node,calls,'func',None)
+                            self.add_port_call(node, 'func', calls)
                             # self.add_ta_edges(calls, called)
                         
                     elif 'send_pyobj' in calls:
                         port_name = node.ast_node.value.func.value.attr
-                        self.code_metadata['locations'].append({'id': 'post_send_%s' % node.lineno(), 'commit' : True})
+                        self.add_location({'id': 'post_send_%s' % node.lineno(), 'commit' : True})
                         self.code_metadata['committed'].append('post_send_%s' % node.lineno())
                         sequence[node.lineno()]=(node,'post_send_%s' % node.lineno(),'send',port_name)
+                        self.add_port_call(node, 'send', port_name)
                         # called = self.get_defining_function(node)
                         # rcalled = self.get_returning_function(called)
                         # # print(called+','+rcalled)
@@ -595,16 +764,17 @@ class PyCFG:
                                             
                     elif 'recv_pyobj' in calls:
                         port_name = node.ast_node.value.func.value.attr
-                        self.code_metadata['locations'].append({'id': 'pre_recv_%s' % node.lineno(), 'commit' : True})
+                        self.add_location({'id': 'pre_recv_%s' % node.lineno(), 'commit' : True})
                         self.code_metadata['committed'].append('pre_recv_%s' % node.lineno())
-                        self.code_metadata['locations'].append({'id': 'post_recv_%s' % node.lineno(), 'commit' : True})
+                        self.add_location({'id': 'post_recv_%s' % node.lineno(), 'commit' : True})
                         self.code_metadata['committed'].append('post_recv_%s' % node.lineno())
-                        self.code_metadata['locations'].append({'id': 'blocking_%s' % node.lineno()})
+                        self.add_location({'id': 'blocking_%s' % node.lineno()})
                         sequence[node.lineno()-0.1]=(node,'pre_recv_%s' % node.lineno(),'recv',port_name)
                         # sequence[node.lineno()]=(node,'blocking_%s' % node.lineno(),'recv',port_name)
                         self.add_ta_edges('pre_recv_%s' %(node.lineno()), 'blocking_%s' %(node.lineno()), None)
                         self.add_ta_edges('blocking_%s' % (node.lineno()), 'pre_recv_%s' % (node.lineno()), {'port' : port_name})
                         sequence[node.lineno()+0.1]=(node,'post_recv_%s' % node.lineno(),'recv',port_name)
+                        self.add_port_call(node, 'recv', port_name)
                         # called = self.get_defining_function(node)
                         # rcalled = self.get_returning_function(called)
                         # # print(called)
@@ -615,38 +785,43 @@ class PyCFG:
                             # self.code_metadata['edges'][idx].setdefault('guard',[]).append('intq.%s == 1' % port_name)
                     elif 'activate' == calls:
                         port_name = node.ast_node.value.func.value.attr
-                        self.code_metadata['locations'].append({'id': '%s_%s_%s' % (port_name,calls,node.lineno()), 'commit' : True})
+                        self.add_location({'id': '%s_%s_%s' % (port_name,calls,node.lineno()), 'commit' : True})
                         self.code_metadata['committed'].append('%s_%s_%s' % (port_name,calls,node.lineno()))
                         sequence[node.lineno()]=(node,'%s_%s_%s' % (port_name,calls,node.lineno()),'tim',port_name)
+                        self.add_port_call(node, calls, port_name)
                         
                     elif 'deactivate' == calls:
                         port_name = node.ast_node.value.func.value.attr
-                        self.code_metadata['locations'].append({'id': '%s_%s_%s' % (port_name,calls,node.lineno()), 'commit' : True})
+                        self.add_location({'id': '%s_%s_%s' % (port_name,calls,node.lineno()), 'commit' : True})
                         self.code_metadata['committed'].append('%s_%s_%s' % (port_name,calls,node.lineno()))
                         sequence[node.lineno()]=(node,'%s_%s_%s' % (port_name,calls,node.lineno()),'tim',port_name)
+                        self.add_port_call(node, calls, port_name)
                         
                     elif 'launch' == calls:
                         port_name = node.ast_node.value.func.value.attr
-                        self.code_metadata['locations'].append({'id': '%s_%s_%s' % (port_name,calls,node.lineno()), 'commit' : True})
+                        self.add_location({'id': '%s_%s_%s' % (port_name,calls,node.lineno()), 'commit' : True})
                         self.code_metadata['committed'].append('%s_%s_%s' % (port_name,calls,node.lineno()))
                         sequence[node.lineno()]=(node,'%s_%s_%s' % (port_name,calls,node.lineno()),'tim',port_name)
+                        self.add_port_call(node, calls, port_name)
                         
                     elif 'cancel' == calls:
                         port_name = node.ast_node.value.func.value.attr
-                        self.code_metadata['locations'].append({'id': '%s_%s_%s' % (port_name,calls,node.lineno()), 'commit' : True})
+                        self.add_location({'id': '%s_%s_%s' % (port_name,calls,node.lineno()), 'commit' : True})
                         self.code_metadata['committed'].append('%s_%s_%s' % (port_name,calls,node.lineno()))
                         sequence[node.lineno()]=(node,'%s_%s_%s' % (port_name,calls,node.lineno()),'tim',port_name)
+                        self.add_port_call(node, calls, port_name)
                         
                     elif 'terminate' == calls:
                         port_name = node.ast_node.value.func.value.attr
-                        self.code_metadata['locations'].append({'id': '%s_%s_%s' % (port_name,calls,node.lineno()), 'commit' : True})
+                        self.add_location({'id': '%s_%s_%s' % (port_name,calls,node.lineno()), 'commit' : True})
                         self.code_metadata['committed'].append('%s_%s_%s' % (port_name,calls,node.lineno()))
                         sequence[node.lineno()]=(node,'%s_%s_%s' % (port_name,calls,node.lineno()),'tim',port_name)
+                        self.add_port_call(node, calls, port_name)
                         
                         
                     elif 'setDelay' == calls:
                         port_name = node.ast_node.value.func.value.attr
-                        self.code_metadata['locations'].append({'id': '%s_%s_%s' % (port_name,calls,node.lineno()), 'commit' : True})
+                        self.add_location({'id': '%s_%s_%s' % (port_name,calls,node.lineno()), 'commit' : True})
                         self.code_metadata['committed'].append('%s_%s_%s' % (port_name,calls,node.lineno()))
                         sequence[node.lineno()]=(node,'%s_%s_%s' % (port_name,calls,node.lineno()),'tim',port_name)
                         
@@ -654,34 +829,49 @@ class PyCFG:
                             self.port_data[self.code_metadata['template']]['ports'][port_name]['period'] = node.ast_node.value.args[0].n
                         else:
                             self.port_data[self.code_metadata['template']]['ports'][port_name]['period'] = random.randint(1, 10)
+                        self.add_port_call(node, calls, port_name, self.port_data[self.code_metadata['template']]['ports'][port_name]['period'])
         prev = None
         next = self.origin
         curr_chain = None
         key_list=sorted(sequence.keys())
         prev_args = None
+        # user operations and handlers sorted by line, searched with bisect
+        user_lines = []
+        user_locs = []
+        handler_lines = []
+        for idx, loc in enumerate(self.code_metadata['locations']):
+            if loc['id'].startswith('user_'):
+                user_lines.append(float(loc['id'].split("_")[-1]))
+                user_locs.append((idx, loc))
+            elif loc['id'].startswith('on_'):
+                handler_lines.append(float(loc['id'].split("_")[-1]))
+        user_order = sorted(range(len(user_locs)), key=lambda k: user_lines[k])
+        user_lines = [user_lines[k] for k in user_order]
+        user_locs = [user_locs[k] for k in user_order]
+        handler_lines.sort()
+        defining_function = lambda node: self.node_function[node.rid]
+        
         for i,lineno in enumerate(key_list):
         #for lineno, tup in sorted(sequence.items()):
             tup = sequence[lineno]
             node, calls, type, port_nm = tup
-            called = self.get_defining_function(node)
+            called = defining_function(node)
             if called.startswith('on_'):
                 curr_chain = called
             #print('calls'+calls)
+            # user operations strictly between this call and the next call,
+            # or the next handler for the last call
             if i < len(key_list) - 1:
                 next_node = sequence[key_list[i+1]][0]
-                #print([loc['id'].split("_")[-1] for loc in self.code_metadata["locations"]])
-                usr_locs = [(i,loc) for i,loc in enumerate(self.code_metadata['locations']) if loc['id'].startswith('user_') and float(loc['id'].split("_")[-1]) < next_node.lineno() and float(loc['id'].split("_")[-1]) > node.lineno()]
+                upper = next_node.lineno()
             else:
                 next_node = None
-                for loc in self.code_metadata["locations"]: 
-                    next_loc = None
-                    if loc["id"].startswith("on_") and float(loc['id'].split("_")[-1]) > node.lineno():
-                        next_loc = loc
-                        break
-                if next_loc:
-                    usr_locs = [(i,loc) for i,loc in enumerate(self.code_metadata['locations']) if loc['id'].startswith('user_') and float(loc['id'].split("_")[-1]) < float(next_loc['id'].split("_")[-1]) and float(loc['id'].split("_")[-1]) > node.lineno()]
-                else:
-                    usr_locs = []
+                pos = bisect.bisect_right(handler_lines, node.lineno())
+                upper = handler_lines[pos] if pos < len(handler_lines) else None
+            if upper is not None:
+                usr_locs = user_locs[bisect.bisect_right(user_lines, node.lineno()):bisect.bisect_left(user_lines, upper)]
+            else:
+                usr_locs = []
                 
             if port_nm is not None:
                 port_info = self.port_data[self.code_metadata['template']]['ports'][port_nm]
@@ -704,8 +894,8 @@ class PyCFG:
                     dest = loc['id']
                 #self.add_ta_edges(next, loc['id'], args)
                 
-            if (prev is None) or (prev[0] is not None and called != self.get_defining_function(prev[0])):
-                called = self.get_defining_function(node)
+            if (prev is None) or (prev[0] is not None and called != defining_function(prev[0])):
+                called = defining_function(node)
                 self.add_ta_edges(calls, called, args)
                 # if prev is None:
                 #     next = called
@@ -725,7 +915,7 @@ class PyCFG:
                 prev_args = args
                 continue
             if next_node is not None:
-                if self.get_defining_function(next_node).startswith('on_') and curr_chain != self.get_defining_function(next_node):
+                if defining_function(next_node).startswith('on_') and curr_chain != defining_function(next_node):
                     # print('curr chain'+curr_chain)
                     # print('new chain'+self.get_defining_function(next_node))
                     # print('calls'+calls)
@@ -737,14 +927,15 @@ class PyCFG:
         # print(self.code_metadata['template'])
         # print('outside'+calls)
         # print('next'+next)
-        self.add_ta_edges(next,calls)
+        if key_list:
+            self.add_ta_edges(next,calls)
                     
                         
                         
                         
     def get_returning_function(self,called):
         rcalled = 'ready'
-        for nnid,nnode in CFGNode.cache.items():
+        for nnid,nnode in self.ctx.cache.items():
             if nnode.calls:
                 for rcalls in nnode.calls:
                     # print(rcalls)
@@ -754,25 +945,99 @@ class PyCFG:
         
                         
 
-    def gen_cfg(self, src, port_data):
+    def gen_cfg(self, src, port_data=None, covered=None):
         """
+        covered is the set of executed line numbers from a coverage run. The
+        statements on any other line are pruned from code_metadata with their
+        port calls and timing annotations, except in handlers that never ran
+        at all, which are kept whole since the model can still dispatch them.
+        Without port_data only the CFG is built, the ports are not modelled.
         >>> i = PyCFG()
         >>> i.walk("100")
         5
         """
-        CFGNode.cache = {}
-        CFGNode.registry = 0
+        self.ctx.reset()
         self.port_data = port_data
-        node = self.parse(src)
-        nodes = self.walk(node, [self.founder])
-        self.last_node = CFGNode(parents=nodes, ast=horast.parse('stop').body[0])
+        self.covered = covered
+        self.unrun_handlers = set()
+        with phase('horast.parse'):
+            node = self.parse(src)
+        with phase('PyCFG.walk'):
+            nodes = self.walk(node, [self.founder])
+        self.last_node = CFGNode(parents=nodes, ast=horast.parse('stop').body[0], ctx=self.ctx)
         tast.copy_location(self.last_node.ast_node, self.founder.ast_node)
-        self.update_children()
-        self.update_functions()
-        self.link_functions()
-        self.add_riaps_ports()
-        self.generate_port_arguments()
+        with phase('PyCFG.link_functions'):
+            self.update_children()
+            self.update_functions()
+            self.link_functions()
+        if port_data is not None:
+            with phase('add_riaps_ports'):
+                self.add_riaps_ports()
+            self.generate_port_arguments()
+
+    def drop_ast(self, keep_source=False):
+        """
+        Release the AST of every node once code_metadata has been extracted.
+        Line numbers stay available; the source text only with keep_source.
+        """
+        for nid, node in self.ctx.cache.items():
+            node.drop_ast(keep_source)
+        for node in (self.founder, self.last_node):
+            if node is not None:
+                node.drop_ast(keep_source)
+
+    def detach(self):
+        """
+        Drop the node graph so that only the extracted
+        metadata remains. A detached PyCFG can be pickled.
+        """
+        self.ctx = None
+        self.founder = None
+        self.last_node = None
+        self.functions = {}
+
+    @classmethod
+    def from_metadata(cls, code_metadata, port_data):
+        """
+        Rebuild a detached PyCFG from previously extracted metadata.
+        """
+        cfg = cls.__new__(cls)
+        cfg.ctx = None
+        cfg.founder = None
+        cfg.last_node = None
+        cfg.functions = {}
+        cfg.functions_node = {}
+        cfg.code_metadata = code_metadata
+        cfg.loc_index = {}
+        cfg.loc_prefix = {}
+        cfg.edge_index = {}
+        cfg.node_function = {}
+        cfg.auto_edges = []
+        cfg.user_edges = []
+        cfg.port_data = port_data
+        cfg.origin = None
+        cfg.covered = None
+        cfg.unrun_handlers = set()
+        return cfg
+        
+def port_arguments(template, ports):
+    """
+    Parameter list of a component template for its ports.
+    """
+    port_args = ''
+    for portName, portAttr in ports.items():
+        if portAttr['type'] == 'tim':
+            port_args+= 'chan &%s_%s_activate, chan &%s_%s_deactivate, chan &%s_%s_start, chan &%s_%s_cancel, chan &%s_%s_terminate, chan &%s_%s_setDelay, intq &%s_%s_q,' %(template,portName,template,portName,template,portName,template,portName,template,portName,template,portName,template,portName)
+        if portAttr['type'] in ['rep','ans']:
+            if portAttr['type'] == 'ans':
+                port_args+= 'int& ans_port_identity, intq &%s_%s_q,broadcast chan &%s_channel,' %(template,portName, portAttr['msgtype'][1])
+            else:
+                port_args+= 'intq &%s_%s_q,broadcast chan &%s_channel,' %(template,portName, portAttr['msgtype'][1])
         
+        if portAttr['type'] in ["pub","sub","qry","req"]:
+            port_args+= 'intq &%s_%s_q,broadcast chan &%s_channel,' %(template,portName, portAttr['msgtype'][0])
+    return port_args[:-1]
+
 class BatchSchedulerModel:
     def __init__(self, comp_name, port_data):
         self.scheduler_metadata = {}
@@ -790,105 +1055,357 @@ class BatchSchedulerModel:
         self.scheduler_metadata['guard'] = '||'.join('%s_%s_q.curr_size > 0' %(self.scheduler_metadata['template'],port_name) for port_name in self.port_data['ports'])
         self.scheduler_metadata['assign'] = ','.join('poll(%s_%s_q)' %(self.scheduler_metadata['template'],port_name) for port_name in self.port_data['ports'])
 
+def translate_component(comp_name, src, port_data, detach=False, keep_ast=True, covered=None, dot=False):
+    """
+    Build the CFG and the scheduler model of one component. With detach the
+    results are reduced to plain data so that they can be returned from a
+    worker process. With dot the graph is returned as a dot string, otherwise
+    as None. Without keep_ast the CFG nodes release their AST once the graph
+    is built.
+    """
+    with phase('translate_component', component=comp_name):
+        cfg = PyCFG()
+        with phase('PyCFG.gen_cfg'):
+            cfg.gen_cfg(src, port_data, covered)
+        graph = None
+        if dot:
+            with phase('to_dot'):
+                graph = to_dot(cfg.ctx.cache)
+        if not keep_ast:
+            cfg.drop_ast()
+        sched = BatchSchedulerModel(comp_name, port_data[comp_name])
+        sched.gen_cfg()
+        if detach:
+            cfg.detach()
+    return cfg, sched, graph
+
+def graph_from_string(dot):
+    import pygraphviz
+    return pygraphviz.AGraph(string=dot)
+
+class DominatorTree:
+    """
+    Immediate dominators of a graph in the get_cfg format, computed with the
+    Cooper-Harvey-Kennedy algorithm over reverse postorder indices. key names
+    the predecessor edges, so key='children' gives post-dominators. Nodes not
+    reachable from start only dominate themselves.
+    """
+    def __init__(self, cfg, start=0, key='parents'):
+        self.start = start
+        succ_key = 'children' if key == 'parents' else 'parents'
+        # an edge counts when either end lists it: the line graphs are not
+        # symmetric, link_functions adds parents after the children are built
+        succ = {n: set(s for s in cfg[n][succ_key] if s in cfg and s != n) for n in cfg}
+        for n in cfg:
+            for p in cfg[n][key]:
+                if p in cfg and p != n:
+                    succ[p].add(n)
+        # reverse postorder of the nodes reachable from start
+        order = []
+        seen = {start}
+        stack = [(start, iter(sorted(succ[start])))]
+        while stack:
+            n, it = stack[-1]
+            for s in it:
+                if s not in seen:
+                    seen.add(s)
+                    stack.append((s, iter(sorted(succ[s]))))
+                    break
+            else:
+                stack.pop()
+                order.append(n)
+        order.reverse()
+        self.order = order
+        index = {n: i for i, n in enumerate(order)}
+        # the predecessors are the reversed edges the walk followed
+        preds = [[] for n in order]
+        for n in order:
+            for s in succ[n]:
+                preds[index[s]].append(index[n])
+        idom = [None] * len(order)
+        idom[0] = 0
+        changed = True
+        while changed:
+            changed = False
+            for i in range(1, len(order)):
+                new = None
+                for p in preds[i]:
+                    if idom[p] is None:
+                        continue
+                    if new is None:
+                        new = p
+                        continue
+                    a, b = p, new
+                    while a != b:
+                        while a > b:
+                            a = idom[a]
+                        while b > a:
+                            b = idom[b]
+                    new = a
+                if idom[i] != new:
+                    idom[i] = new
+                    changed = True
+        self.idoms = {n: order[idom[i]] for i, n in enumerate(order) if i}
+        self.idoms[start] = None
+        # pre and post numbers of the dominator tree answer dominance in O(1)
+        self.tree = {n: [] for n in order}
+        for n, d in self.idoms.items():
+            if d is not None:
+                self.tree[d].append(n)
+        self.pre = {}
+        self.post = {}
+        clock = 0
+        stack = [(start, iter(self.tree[start]))]
+        self.pre[start] = clock
+        while stack:
+            n, it = stack[-1]
+            c = next(it, None)
+            clock += 1
+            if c is None:
+                stack.pop()
+                self.post[n] = clock
+            else:
+                self.pre[c] = clock
+                stack.append((c, iter(self.tree[c])))
+        self.nodes = list(cfg.keys())
+
+    def idom(self, n):
+        return self.idoms.get(n)
+
+    def dominates(self, a, b):
+        if a == b:
+            return True
+        if a not in self.pre or b not in self.pre:
+            return False
+        return self.pre[a] <= self.pre[b] and self.post[b] <= self.post[a]
+
+    def dominators(self, n):
+        doms = {n}
+        d = self.idoms.get(n)
+        while d is not None:
+            doms.add(d)
+            d = self.idoms[d]
+        return doms
+
+    def to_sets(self):
+        """
+        The dominator sets of every node, as returned by compute_dominator.
+        """
+        return {n: self.dominators(n) for n in self.nodes}
+
 def compute_dominator(cfg, start = 0, key='parents'):
-    dominator = {}
-    dominator[start] = {start}
-    all_nodes = set(cfg.keys())
-    rem_nodes = all_nodes - {start}
-    for n in rem_nodes:
-        dominator[n] = all_nodes
-
-    c = True
-    while c:
-        c = False
-        for n in rem_nodes:
-            pred_n = cfg[n][key]
-            doms = [dominator[p] for p in pred_n]
-            i = set.intersection(*doms) if doms else set()
-            v = {n} | i
-            if dominator[n] != v:
-                c = True
-            dominator[n] = v
-    return dominator
+    return DominatorTree(cfg, start, key).to_sets()
+
+def read_coverage(data_file):
+    import coverage
+    try:
+        cdata = coverage.CoverageData(basename=data_file)
+        cdata.read()
+    except TypeError:
+        # coverage.py before 5.0
+        cdata = coverage.CoverageData()
+        cdata.read_file(filename=data_file)
+    return cdata
+
+def measured_file(cdata, source_file=None):
+    """
+    The file of the coverage data that matches source_file, by path and then
+    by name, or the first measured file without one.
+    """
+    files = list(cdata.measured_files())
+    if source_file is None:
+        return files[0] if files else None
+    path = os.path.abspath(source_file)
+    for f in files:
+        if os.path.abspath(f) == path:
+            return f
+    for f in files:
+        if os.path.basename(f) == os.path.basename(path):
+            return f
+    return None
+
+def coverage_lines(cdata, source_file=None):
+    """
+    The executed lines of source_file, or None when it was not measured.
+    """
+    f = measured_file(cdata, source_file)
+    if f is None:
+        return None
+    lines = set(cdata.lines(f) or [])
+    for i, j in cdata.arcs(f) or []:
+        lines.update(l for l in (i, j) if l > 0)
+    return lines
 
 def slurp(f):
     with open(f, 'r') as f: return f.read()
 
 def gen_cfg(fnsrc, remove_start_stop=True):
-    CFGNode.cache = {}
-    CFGNode.registry = 0
     cfg = PyCFG()
     cfg.gen_cfg(fnsrc)
-    cache = dict(CFGNode.cache)
+    cache = dict(cfg.ctx.cache)
     if remove_start_stop:
         return {k:cache[k] for k in cache if cache[k].source() not in {'start', 'stop'}}
     else:
         return cache
 
+def cache_lines(cache):
+    """
+    Store the line number and the unparsed source on every node so that
+    later passes read them instead of going back to the AST.
+    """
+    for node in cache.values():
+        if node.line is None:
+            node.line = node.lineno()
+        if node.text is None:
+            node.text = node.source()
+
+def line_graph(cfg):
+    """
+    Collapse the nodes of a PyCFG into a graph of source lines in a single
+    pass. Every line maps to the sets of its parent and child lines, the
+    calls made on it and its defining function.
+    """
+    cache = cfg.ctx.cache
+    cache_lines(cache)
+    lines = [0] * cfg.ctx.registry
+    for rid, node in cache.items():
+        lines[rid] = node.line
+    g = {}
+    for rid, node in cache.items():
+        at = lines[rid]
+        entry = g.get(at)
+        if entry is None:
+            entry = g[at] = {'parents':set(), 'children':set()}
+        entry['parents'].update(lines[p.rid] for p in node.parents)
+        entry['children'].update(lines[c.rid] for c in node.children)
+        if node.calls:
+            entry['calls'] = node.calls
+        entry['function'] = cfg.functions_node[at]
+    # remove dummy nodes
+    for at, entry in g.items():
+        entry['parents'].discard(at)
+        entry['children'].discard(at)
+    return g
+
+def unhack(v):
+    for i in ['if', 'while', 'for', 'elif']:
+        v = re.sub(r'^_%s:' % i, '%s:' % i, v)
+    return v
+
+def node_label(cnode):
+    return "%d: %s" % (cnode.lineno(), unhack(cnode.source()))
+
+def in_edges(cnode, arcs, cov_lines):
+    """
+    The edges into cnode as (parent, child, attributes). Calls are dotted;
+    with coverage arcs the edges are coloured green when covered and red
+    otherwise, without them the true branches are blue.
+    """
+    lineno = cnode.lineno()
+    for pn in cnode.parents:
+        plineno = pn.lineno()
+        if hasattr(pn, 'calllink') and pn.calllink > 0 and not hasattr(cnode, 'calleelink'):
+            yield pn.rid, cnode.rid, {'style': 'dotted', 'weight': '100'}
+            continue
+
+        if arcs:
+            if  (plineno, lineno) in arcs:
+                yield pn.rid, cnode.rid, {'color': 'green'}
+            elif plineno == lineno and lineno in cov_lines:
+                yield pn.rid, cnode.rid, {'color': 'green'}
+            elif hasattr(cnode, 'fn_exit_node') and plineno in cov_lines:  # child is exit and parent is covered
+                yield pn.rid, cnode.rid, {'color': 'green'}
+            elif hasattr(pn, 'fn_exit_node') and (cov_lines or pn.parents): # parent is exit and one of its parents is covered.
+                yield pn.rid, cnode.rid, {'color': 'green'}
+            elif plineno in cov_lines and hasattr(cnode, 'calleelink'): # child is a callee (has calleelink) and one of the parents is covered.
+                yield pn.rid, cnode.rid, {'color': 'green'}
+            else:
+                yield pn.rid, cnode.rid, {'color': 'red'}
+        else:
+            if cnode.kind == True:
+                yield pn.rid, cnode.rid, {'color': 'blue', 'label': 'T'}
+            else:
+                yield pn.rid, cnode.rid, {}
+
+def dot_quote(text):
+    # quoted like graphviz does, escape sequences in the source are kept
+    return '"%s"' % text.replace('"', '\\"')
+
+def write_dot(cache, out, arcs=[]):
+    """
+    Stream the CFG as DOT text into out, without building a graph first.
+    The graph is strict like the one from to_graph, repeated edges merge.
+    """
+    cache_lines(cache)
+    arcs = set(tuple(arc) for arc in arcs)
+    cov_lines = set(i for i,j in arcs)
+    out.write('strict digraph {\n')
+    for nid, cnode in cache.items():
+        out.write('\t%d [label=%s];\n' % (cnode.rid, dot_quote(node_label(cnode))))
+        for src, dst, attrs in in_edges(cnode, arcs, cov_lines):
+            if attrs:
+                out.write('\t%d -> %d [%s];\n' % (src, dst, ', '.join('%s=%s' % (k, dot_quote(v)) for k, v in attrs.items())))
+            else:
+                out.write('\t%d -> %d;\n' % (src, dst))
+    out.write('}\n')
+
+def to_dot(cache, arcs=[]):
+    out = io.StringIO()
+    write_dot(cache, out, arcs)
+    return out.getvalue()
+
+def write_json(cache, out, arcs=[]):
+    """
+    Stream the CFG as a compact JSON object: nodes as [id, line, source] and
+    edges as [parent, child, attributes].
+    """
+    cache_lines(cache)
+    arcs = set(tuple(arc) for arc in arcs)
+    cov_lines = set(i for i,j in arcs)
+    dumps = json.JSONEncoder(separators=(',', ':')).encode
+    out.write('{"nodes":[')
+    sep = ''
+    for nid, cnode in cache.items():
+        out.write(sep + dumps([cnode.rid, cnode.lineno(), unhack(cnode.source())]))
+        sep = ','
+    out.write('],"edges":[')
+    sep = ''
+    for nid, cnode in cache.items():
+        for edge in in_edges(cnode, arcs, cov_lines):
+            out.write(sep + dumps(edge))
+            sep = ','
+    out.write(']}\n')
+
 def to_graph(cache, arcs=[]):
-    def unhack(v):
-        for i in ['if', 'while', 'for', 'elif']:
-            v = re.sub(r'^_%s:' % i, '%s:' % i, v)
-        return v
+    import pygraphviz
+    cache_lines(cache)
     G = pygraphviz.AGraph(directed=True)
+    arcs = set(tuple(arc) for arc in arcs)
     cov_lines = set(i for i,j in arcs)
     for nid, cnode in cache.items():
         G.add_node(cnode.rid)
         n = G.get_node(cnode.rid)
-        lineno = cnode.lineno()
-        n.attr['label'] = "%d: %s" % (lineno, unhack(cnode.source()))
-        # print(cnode.source())
-        for pn in cnode.parents:
-            plineno = pn.lineno()
-            if hasattr(pn, 'calllink') and pn.calllink > 0 and not hasattr(cnode, 'calleelink'):
-                G.add_edge(pn.rid, cnode.rid, style='dotted', weight=100)
-                continue
-
-            if arcs:
-                if  (plineno, lineno) in arcs:
-                    G.add_edge(pn.rid, cnode.rid, color='green')
-                elif plineno == lineno and lineno in cov_lines:
-                    G.add_edge(pn.rid, cnode.rid, color='green')
-                elif hasattr(cnode, 'fn_exit_node') and plineno in cov_lines:  # child is exit and parent is covered
-                    G.add_edge(pn.rid, cnode.rid, color='green')
-                elif hasattr(pn, 'fn_exit_node') and len(set(n.lineno() for n in pn.parents) | cov_lines) > 0: # parent is exit and one of its parents is covered.
-                    G.add_edge(pn.rid, cnode.rid, color='green')
-                elif plineno in cov_lines and hasattr(cnode, 'calleelink'): # child is a callee (has calleelink) and one of the parents is covered.
-                    G.add_edge(pn.rid, cnode.rid, color='green')
-                else:
-                    G.add_edge(pn.rid, cnode.rid, color='red')
-            else:
-                if cnode.kind == True:
-                    G.add_edge(pn.rid, cnode.rid, color='blue', label='T')
-                else:
-                    G.add_edge(pn.rid, cnode.rid)
+        n.attr['label'] = node_label(cnode)
+        for src, dst, attrs in in_edges(cnode, arcs, cov_lines):
+            G.add_edge(src, dst, **attrs)
     return G
 
-def get_cfg(pythonfile):
+def get_cfg(pythonfile, port_data=None):
     cfg = PyCFG()
-    cfg.gen_cfg(slurp(pythonfile).strip())
-    cache = CFGNode.cache
-    g = {}
-    for k,v in cache.items():
-        j = v.to_json()
-        at = j['at']
-        parents_at = [cache[p].to_json()['at'] for p in j['parents']]
-        children_at = [cache[c].to_json()['at'] for c in j['children']]
-        if at not in g:
-            g[at] = {'parents':set(), 'children':set()}
-        # remove dummy nodes
-        ps = set([p for p in parents_at if p != at])
-        cs = set([c for c in children_at if c != at])
-        g[at]['parents'] |= ps
-        g[at]['children'] |= cs
-        if v.calls:
-            g[at]['calls'] = v.calls
-        g[at]['function'] = cfg.functions_node[v.lineno()]
-    return (g, cfg.founder.ast_node.lineno, cfg.last_node.ast_node.lineno)
-
-def compute_flow(pythonfile):
-    cfg,first,last = get_cfg(pythonfile)
-    return cfg, compute_dominator(cfg, start=first), compute_dominator(cfg, start=last, key='children')
+    cfg.gen_cfg(slurp(pythonfile).strip(), port_data)
+    return (line_graph(cfg), cfg.founder.lineno(), cfg.last_node.lineno())
+
+def compute_flow(pythonfile, trees=False, port_data=None):
+    """
+    The line graph with its dominators and post-dominators, as sets or, with
+    trees, as DominatorTree objects.
+    """
+    cfg,first,last = get_cfg(pythonfile, port_data)
+    dom = DominatorTree(cfg, start=first)
+    pdom = DominatorTree(cfg, start=last, key='children')
+    if trees:
+        return cfg, dom, pdom
+    return cfg, dom.to_sets(), pdom.to_sets()
 
 if __name__ == '__main__':
     import json
@@ -898,24 +1415,28 @@ if __name__ == '__main__':
     parser.add_argument('pythonfile', help='The python file to be analyzed')
     parser.add_argument('-d','--dots', action='store_true', help='generate a dot file')
     parser.add_argument('-c','--cfg', action='store_true', help='print cfg')
+    parser.add_argument('-j','--json', action='store_true', help='print the cfg as a json edge list')
     parser.add_argument('-x','--coverage', action='store', dest='coverage', type=str, help='branch coverage file')
     parser.add_argument('-y','--ccoverage', action='store', dest='ccoverage', type=str, help='custom coverage file')
     args = parser.parse_args()
+    # the edges of both exporters are coloured by the coverage arcs
+    if args.coverage:
+        cdata = read_coverage(args.coverage)
+        arcs = [(abs(i),abs(j)) for i,j in cdata.arcs(measured_file(cdata))]
+    elif args.ccoverage:
+        arcs = [(i,j) for i,j in json.loads(open(args.ccoverage).read())]
+    else:
+        arcs = []
     if args.dots:
-        arcs = None
-        if args.coverage:
-            cdata = coverage.CoverageData()
-            cdata.read_file(filename=args.coverage)
-            arcs = [(abs(i),abs(j)) for i,j in cdata.arcs(cdata.measured_files()[0])]
-        elif args.ccoverage:
-            arcs = [(i,j) for i,j in json.loads(open(args.ccoverage).read())]
-        else:
-            arcs = []
         cfg = PyCFG()
         cfg.gen_cfg(slurp(args.pythonfile).strip())
-        g = CFGNode.to_graph(CFGNode.cache, arcs)
+        g = to_graph(cfg.ctx.cache, arcs)
         g.draw(args.pythonfile + '.png', prog='dot')
         print(g.string(), file=sys.stderr)
+    elif args.json:
+        cfg = PyCFG()
+        cfg.gen_cfg(slurp(args.pythonfile).strip())
+        write_json(cfg.ctx.cache, sys.stdout, arcs)
     elif args.cfg:
         cfg,first,last = get_cfg(args.pythonfile)
         for i in sorted(cfg.keys()):
@@ -0,0 +1,188 @@
+"""
+Bounds for the port queues of a deployed application.
+
+Arrivals at every queue are described by a burst and a rate: at most
+burst + rate*t messages arrive in any interval of length t. Periodic timers
+start the chains, and every handler forwards the arrivals of its own queue,
+scaled by the number of messages it sends or timers it launches per
+invocation. A component serves each of its queues once per batch of
+handlers, so a message waits at most two batches and a queue holds at most
+burst + 2*rate*W messages, where W is the worst case duration of a batch:
+the sum of the timing annotations of all its handlers.
+
+Queues fed through a cycle of handlers, by components without a CFG or
+whose handlers may block on a receive, and queues that fill faster than
+they are served get no bound (None).
+"""
+
+import bisect
+import math
+from fractions import Fraction
+
+# index into msgtype of the message a port type receives and sends
+LISTEN = {'sub': 0, 'rep': 0, 'ans': 0, 'req': 1, 'qry': 1}
+SEND = {'pub': 0, 'req': 0, 'qry': 0, 'clt': 0, 'rep': 1, 'ans': 1}
+TIMER_LAUNCHES = ['launch']
+
+
+def channel(host, portAttr, index):
+    if portAttr.get('msgscope') == 'local':
+        return '%s_%s' % (host, portAttr['msgtype'][index])
+    return portAttr['msgtype'][index]
+
+
+def handler_summary(codeMetadata):
+    """
+    Per handler of a component: its worst case duration, the messages it
+    sends and the timers it launches per port, including those of the
+    functions it calls, and whether it may block on another port's receive.
+    """
+    handlers = []
+    for loc in codeMetadata['locations']:
+        if loc['id'].startswith('on_'):
+            name, line = loc['id'].rsplit('_', 1)
+            handlers.append((int(line), name))
+    handlers.sort()
+    lines = [line for line, name in handlers]
+    summary = {name: {'wcet': 0, 'send': {}, 'launch': {}, 'blocks': False} for line, name in handlers}
+    for loc in codeMetadata['locations']:
+        if loc['id'].startswith('user_op_'):
+            pos = bisect.bisect_right(lines, int(loc['id'].rsplit('_', 1)[1])) - 1
+            if pos >= 0:
+                summary[handlers[pos][1]]['wcet'] += loc['max']*10
+    calls = {}
+    for call in codeMetadata.get('port_calls', []):
+        calls.setdefault(call['function'], []).append(call)
+    for handler, info in summary.items():
+        stack = [handler]
+        seen = {handler}
+        while stack:
+            for call in calls.get(stack.pop(), []):
+                if call['kind'] == 'func':
+                    if call['name'] not in seen:
+                        seen.add(call['name'])
+                        stack.append(call['name'])
+                elif call['kind'] == 'send':
+                    info['send'][call['name']] = info['send'].get(call['name'], 0) + 1
+                elif call['kind'] in TIMER_LAUNCHES:
+                    info['launch'][call['name']] = info['launch'].get(call['name'], 0) + 1
+                elif call['kind'] == 'recv' and call['name'] != handler[3:]:
+                    info['blocks'] = True
+    return summary
+
+
+def timer_delays(codeMetadata):
+    delays = {}
+    for call in codeMetadata.get('port_calls', []):
+        if call['kind'] == 'setDelay':
+            delays.setdefault(call['name'], []).append(call['value'])
+    return delays
+
+
+class QueueBounds:
+    def __init__(self, modelData, actorMap, codeMetadata):
+        """
+        codeMetadata maps component types to the code_metadata of their CFG.
+        """
+        self.modelData = modelData
+        self.summary = {compType: handler_summary(metadata) for compType, metadata in codeMetadata.items()}
+        self.delays = {compType: timer_delays(metadata) for compType, metadata in codeMetadata.items()}
+        self.instances = []
+        self.senders = {}
+        for actorName, actorObj in actorMap.items():
+            for compVal in actorObj['comps']:
+                for host in actorObj.get('target', []):
+                    instance = (host, actorName, compVal['inst'], compVal['type'])
+                    self.instances.append(instance)
+                    for portName, portAttr in modelData.get(compVal['type'], {}).get('ports', {}).items():
+                        if portAttr['type'] in SEND:
+                            self.senders.setdefault(channel(host, portAttr, SEND[portAttr['type']]), []).append((instance, portName))
+        self.curves = {}
+        self.visiting = set()
+
+    def batch_time(self, compType):
+        if compType not in self.summary:
+            return None
+        handlers = self.summary[compType].values()
+        if any(info['blocks'] for info in handlers):
+            return None
+        return sum(info['wcet'] for info in handlers)
+
+    def handler_curves(self, instance, key, portName):
+        """
+        Arrivals of the messages or launches (key 'send' or 'launch') of a
+        port, summed over the handlers of instance that use it.
+        """
+        compType = instance[3]
+        if compType not in self.summary:
+            return None
+        burst, rate = 0, Fraction(0)
+        for handler, info in self.summary[compType].items():
+            count = info[key].get(portName, 0)
+            if count:
+                arrivals = self.curve(instance, handler[3:])
+                if arrivals is None:
+                    return None
+                burst, rate = burst + count*arrivals[0], rate + count*arrivals[1]
+        return burst, rate
+
+    def curve(self, instance, portName):
+        """
+        (burst, rate) of the arrivals at a port queue, None without a bound.
+        """
+        key = (instance, portName)
+        if key in self.curves:
+            return self.curves[key]
+        if key in self.visiting:
+            return None
+        self.visiting.add(key)
+        host, actorName, inst, compType = instance
+        portAttr = self.modelData[compType]['ports'].get(portName)
+        arrivals = (0, Fraction(0))
+        if portAttr is None:
+            arrivals = None
+        elif portAttr['type'] == 'tim':
+            periods = [portAttr.get('period', 0)] + self.delays.get(compType, {}).get(portName, [])
+            periods = [p for p in periods if p > 0]
+            if portAttr.get('timertype') == 'periodic' and periods:
+                arrivals = (1, Fraction(1, min(periods)))
+            launched = self.handler_curves(instance, 'launch', portName)
+            if launched is None:
+                arrivals = None
+            else:
+                arrivals = (arrivals[0] + launched[0], arrivals[1] + launched[1])
+        elif portAttr['type'] in LISTEN:
+            for sender, senderPort in self.senders.get(channel(host, portAttr, LISTEN[portAttr['type']]), []):
+                sent = self.handler_curves(sender, 'send', senderPort)
+                if sent is None:
+                    arrivals = None
+                    break
+                arrivals = (arrivals[0] + sent[0], arrivals[1] + sent[1])
+        self.visiting.discard(key)
+        self.curves[key] = arrivals
+        return arrivals
+
+    def bound(self, instance, portName):
+        arrivals = self.curve(instance, portName)
+        batch = self.batch_time(instance[3])
+        if arrivals is None or batch is None:
+            return None
+        burst, rate = arrivals
+        if rate*batch >= 1:
+            return None
+        return max(1, math.ceil(burst + 2*rate*batch))
+
+    def bounds(self):
+        """
+        Bound of every port queue by queue name, None where there is none.
+        """
+        result = {}
+        for instance in self.instances:
+            host, actorName, inst, compType = instance
+            for portName in self.modelData.get(compType, {}).get('ports', {}):
+                result['%s_%s_%s_%s_q' % (host, actorName, inst, portName)] = self.bound(instance, portName)
+        return result
+
+
+def infer_queue_bounds(modelData, actorMap, codeMetadata):
+    return QueueBounds(modelData, actorMap, codeMetadata).bounds()
@@ -0,0 +1,73 @@
+"""
+Cone of influence slicing for verification queries.
+
+A deployed actor influences another when it sends a message the other
+receives; broadcast sends never wait for their receivers, so nothing flows
+back from a receiver to a sender. The cone of influence of a query is the set
+of actors the processes and variables it names belong to, closed under the
+actors that influence them. Only the cone needs to be in the network the
+query is checked on.
+"""
+
+import re
+from queuebounds import LISTEN, SEND, channel
+
+_name = re.compile(r'[A-Za-z_]\w*')
+
+
+def influence_graph(modelData, actorMap):
+    """
+    For every deployed (host, actor), the (host, actor) pairs that send it
+    messages.
+    """
+    senders = {}
+    listeners = []
+    graph = {}
+    for actorName, actorObj in actorMap.items():
+        for compVal in actorObj['comps']:
+            for host in actorObj.get('target', []):
+                graph.setdefault((host, actorName), set())
+                for portName, portAttr in modelData.get(compVal['type'], {}).get('ports', {}).items():
+                    if portAttr['type'] in SEND:
+                        senders.setdefault(channel(host, portAttr, SEND[portAttr['type']]), set()).add((host, actorName))
+                    if portAttr['type'] in LISTEN:
+                        listeners.append(((host, actorName), channel(host, portAttr, LISTEN[portAttr['type']])))
+    for node, key in listeners:
+        graph[node] |= senders.get(key, set())
+    return graph
+
+
+def query_seeds(query, modelData, actorMap):
+    """
+    The deployed (host, actor) pairs a query names a process or a variable
+    of. Message variables and channels name the actors that send on them.
+    """
+    names = set(_name.findall(query))
+    seeds = set()
+    for actorName, actorObj in actorMap.items():
+        for compVal in actorObj['comps']:
+            hosts = actorObj.get('target', [])
+            # the process names of an instance, and of a symmetric actor
+            prefixes = [('%s_%s_%s' % (host, actorName, compVal['inst']), [host]) for host in hosts]
+            prefixes.append(('%s_%s' % (actorName, compVal['inst']), hosts))
+            for prefix, where in prefixes:
+                if any(name == prefix or name.startswith(prefix + '_') or name == prefix + 'Scheduler' for name in names):
+                    seeds.update((host, actorName) for host in where)
+            for host in hosts:
+                for portName, portAttr in modelData.get(compVal['type'], {}).get('ports', {}).items():
+                    if portAttr['type'] in SEND:
+                        key = channel(host, portAttr, SEND[portAttr['type']])
+                        if '%s_value' % key in names or '%s_channel' % key in names:
+                            seeds.add((host, actorName))
+    return seeds
+
+
+def cone_of_influence(graph, seeds):
+    cone = set(seeds)
+    work = list(seeds)
+    while work:
+        for node in graph.get(work.pop(), ()):
+            if node not in cone:
+                cone.add(node)
+                work.append(node)
+    return cone
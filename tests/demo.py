@@ -0,0 +1,125 @@
+"""
+A fixed deployment shared by the tests of the analysis passes.
+"""
+
+import copy
+import os
+
+MODEL = {
+    'Sensor': {'ports': {
+        'clock': {'type': 'tim', 'period': 1000, 'timertype': 'periodic'},
+        'ready': {'type': 'pub', 'msgtype': ['SensorReady'], 'msgscope': 'global'},
+        'request': {'type': 'rep', 'msgtype': ['SensorQuery', 'SensorValue'], 'msgscope': 'global'},
+    }},
+    'Estimator': {'ports': {
+        'ready': {'type': 'sub', 'msgtype': ['SensorReady'], 'msgscope': 'global'},
+        'query': {'type': 'req', 'msgtype': ['SensorQuery', 'SensorValue'], 'msgscope': 'global'},
+        'wakeup': {'type': 'tim', 'period': 0, 'timertype': 'sporadic'},
+    }},
+    'Unused': {'ports': {
+        'loc': {'type': 'pub', 'msgtype': ['Lonely'], 'msgscope': 'local'},
+    }},
+    'Asker': {'ports': {
+        'ask': {'type': 'req', 'msgtype': ['Question', 'Answer'], 'msgscope': 'global'},
+    }},
+    'Snoop': {'ports': {
+        'heard': {'type': 'sub', 'msgtype': ['Question'], 'msgscope': 'global'},
+    }},
+}
+
+ACTORS = {
+    'SensorActor': {'comps': [{'inst': 'sensor', 'type': 'Sensor'}], 'target': ['h1', 'h2']},
+    'EstActor': {'comps': [{'inst': 'est', 'type': 'Estimator'}], 'target': ['h1']},
+    'Idle': {'comps': [{'inst': 'u', 'type': 'Unused'}], 'target': ['h3']},
+}
+
+# code_metadata of the component CFGs, reduced to what the analyses read
+CODE = {
+    'Sensor': {
+        'locations': [{'id': 'on_clock_10'}, {'id': 'user_op_11', 'max': 2}, {'id': 'on_request_20'}, {'id': 'user_op_21', 'max': 1}],
+        'port_calls': [{'function': 'on_clock', 'kind': 'send', 'name': 'ready'},
+                       {'function': 'on_request', 'kind': 'send', 'name': 'request'}],
+    },
+    'Estimator': {
+        'locations': [{'id': 'on_ready_10'}, {'id': 'user_op_11', 'max': 3}, {'id': 'on_query_20'}, {'id': 'user_op_21', 'max': 1}],
+        'port_calls': [{'function': 'on_ready', 'kind': 'func', 'name': 'ask'},
+                       {'function': 'ask', 'kind': 'send', 'name': 'query'}],
+    },
+}
+
+SENSOR = '''from riaps.run.comp import Component
+import random
+
+class Sensor(Component):
+    def __init__(self, base):
+        super(Sensor, self).__init__()
+        self.base = base
+
+    def on_clock(self):
+        now = self.clock.recv_pyobj()
+        # ta: add time 2 4
+        msg = now * 2
+        self.ready.send_pyobj(msg)
+        self.clock.setDelay(5)
+
+    def on_request(self):
+        req = self.request.recv_pyobj()
+        # ta: add time 1 3
+        if req > 0:
+            self.helper()
+        self.request.send_pyobj(req)
+
+    def helper(self):
+        self.ready.send_pyobj(1)
+'''
+
+ESTIMATOR = '''from riaps.run.comp import Component
+
+class Estimator(Component):
+    def __init__(self):
+        super(Estimator, self).__init__()
+        self.count = 0
+
+    def on_ready(self):
+        msg = self.ready.recv_pyobj()
+        # ta: add time 1 2
+        while self.count < 3:
+            self.count = self.count + 1
+        self.query.send_pyobj(msg)
+
+    def on_query(self):
+        rep = self.query.recv_pyobj()
+        # ta: add time 3 5
+        self.count = rep
+
+    def on_wakeup(self):
+        now = self.wakeup.recv_pyobj()
+        self.wakeup.cancel()
+        self.wakeup.launch()
+        self.query.send_pyobj(now)
+'''
+
+
+def write_app(folder, sources=None):
+    """
+    Write the component sources of the demo application, or sources, to
+    folder. Unused has none, so it gets no CFG.
+    """
+    for name, src in (sources or {'Sensor': SENSOR, 'Estimator': ESTIMATOR}).items():
+        with open(os.path.join(str(folder), '%s.py' % name), 'w') as f:
+            f.write(src)
+
+
+def translator(folder, actors=None, generate=True, sources=None, **options):
+    """
+    A riaps2uppaal for the demo application in folder, with its model and
+    deployment set and, with generate, its component CFGs built.
+    """
+    from parser import riaps2uppaal
+    write_app(folder, sources)
+    obj = riaps2uppaal(str(folder), 'Demo', **options)
+    obj.modelData = copy.deepcopy(MODEL)
+    obj.actorMap = copy.deepcopy(ACTORS if actors is None else actors)
+    if generate:
+        obj.generate_cfg()
+    return obj
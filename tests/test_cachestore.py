@@ -0,0 +1,77 @@
+import os
+from cachestore import CacheStore, file_hash
+
+
+def entry(number):
+    return {'number': number, 'data': 'x'*100}
+
+
+def entry_size(tmp_path):
+    store = CacheStore(str(tmp_path.joinpath('size')))
+    store.put('k', entry(0))
+    return os.path.getsize(store.path('k'))
+
+
+def test_oldest_entries_are_evicted(tmp_path):
+    size = entry_size(tmp_path)
+    store = CacheStore(str(tmp_path.joinpath('store')), max_bytes=3*size)
+    for number, key in enumerate(['a', 'b', 'c']):
+        store.put(key, entry(number))
+        # distinct times, oldest first, whatever the resolution of the clock
+        os.utime(store.path(key), (1000 + number, 1000 + number))
+    assert sorted(os.listdir(store.directory)) == ['a.json', 'b.json', 'c.json']
+    # a use makes an entry the most recent one
+    assert store.get('a') == entry(0)
+    store.put('d', entry(3))
+    assert sorted(os.listdir(store.directory)) == ['a.json', 'c.json', 'd.json']
+    store.put('e', entry(4))
+    assert sorted(os.listdir(store.directory)) == ['a.json', 'd.json', 'e.json']
+    assert store.get('b') is None
+    assert store.get('e') == entry(4)
+
+
+def test_cap_is_kept(tmp_path):
+    size = entry_size(tmp_path)
+    store = CacheStore(str(tmp_path.joinpath('store')), max_bytes=5*size)
+    for number in range(20):
+        store.put('k%d' % number, entry(number))
+    files = [os.path.join(store.directory, name) for name in os.listdir(store.directory)]
+    assert sum(os.path.getsize(name) for name in files) <= 5*size
+    assert store.get('k19') == entry(19)
+    # no temporary files are left behind
+    assert all(name.endswith('.json') for name in os.listdir(store.directory))
+
+
+def test_corrupted_entries_are_misses(tmp_path):
+    store = CacheStore(str(tmp_path))
+    store.put('good', entry(1))
+    with open(store.path('partial'), 'w') as f:
+        f.write('{"number": 1, "da')
+    with open(store.path('garbage'), 'wb') as f:
+        f.write(b'\xff\xfe\x00')
+    open(store.path('empty'), 'w').close()
+    for key in ['partial', 'garbage', 'empty', 'missing']:
+        assert store.get(key) is None
+    assert store.get('good') == entry(1)
+    assert (store.hits, store.misses) == (1, 4)
+
+
+def test_key_stability():
+    key = CacheStore.key('0.1', 'Sensor', {'ports': {'b': 1, 'a': [1, 2]}})
+    # the same parts always give the same key, whatever the order of dict items
+    assert key == CacheStore.key('0.1', 'Sensor', {'ports': {'a': [1, 2], 'b': 1}})
+    assert len(key) == 64 and int(key, 16) >= 0
+    assert key != CacheStore.key('0.2', 'Sensor', {'ports': {'b': 1, 'a': [1, 2]}})
+    assert key != CacheStore.key('0.1', 'Sensor', {'ports': {'b': 1, 'a': [2, 1]}})
+    assert CacheStore.key('a', 'b') != CacheStore.key('ab')
+    # and across runs and interpreters, the cache outlives them
+    assert CacheStore.key('x') == 'cd65ea2c2ad99e94a85b1b6df72efef9cb2ed0ae933a60c32ce16317f7d7d6aa'
+
+
+def test_file_hash_follows_the_contents(tmp_path):
+    path = tmp_path.joinpath('model.riaps')
+    path.write_text('app Demo {}')
+    first = file_hash(str(path))
+    assert file_hash(str(path)) == first
+    path.write_text('app Demo { }')
+    assert file_hash(str(path)) != first
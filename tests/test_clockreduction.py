@@ -0,0 +1,60 @@
+import copy
+import io
+from clockreduction import reduce_component, timer_groups, clock_report
+from demo import MODEL, ACTORS, CODE, SENSOR, ESTIMATOR, translator
+
+CLOCKS = ['h1_SensorActor_sensor_clock', 'h2_SensorActor_sensor_clock']
+
+
+def test_reduce_component_drops_unread_clock():
+    metadata = {'locations': [{'id': 'a'}, {'id': 'b'}],
+                'edges': [{'source': 'a', 'target': 'b', 'assign': 'exec_time = 0, x = 1'},
+                          {'source': 'b', 'target': 'a', 'assign': 'exec_time=0'}]}
+    reduced = reduce_component(metadata)
+    assert reduced['exec_clock'] is False
+    assert reduced['edges'] == [{'source': 'a', 'target': 'b', 'assign': 'x = 1'}, {'source': 'b', 'target': 'a'}]
+    assert metadata['edges'][0]['assign'] == 'exec_time = 0, x = 1'
+
+
+def test_reduce_component_resets_dead_clock():
+    metadata = {'locations': [{'id': 'op', 'inv': 'exec_time <= 40'}, {'id': 'next'}],
+                'edges': [{'source': 'op', 'target': 'next', 'guard': 'exec_time >= 20'}]}
+    reduced = reduce_component(metadata)
+    assert reduced['exec_clock'] is True
+    assert reduced['edges'][0]['assign'] == 'exec_time = 0'
+
+
+def test_timer_groups():
+    assert timer_groups(MODEL, ACTORS, CODE) == [(1000, CLOCKS)]
+    # a timer a handler changes keeps its clock
+    code = copy.deepcopy(CODE)
+    code['Sensor']['port_calls'].append({'function': 'on_clock', 'kind': 'setDelay', 'name': 'clock', 'value': 5})
+    assert timer_groups(MODEL, ACTORS, code) == []
+
+
+def test_timer_with_phase_is_not_merged():
+    model = copy.deepcopy(MODEL)
+    model['Sensor']['ports']['clock']['phase'] = 300
+    assert timer_groups(model, ACTORS, CODE) == []
+
+
+def test_clock_report():
+    groups = timer_groups(MODEL, ACTORS, CODE)
+    reduced = {compType: dict(metadata, exec_clock=compType != 'Sensor') for compType, metadata in CODE.items()}
+    # global_time, three exec_time clocks and three timers
+    assert clock_report(MODEL, ACTORS, CODE, reduced, groups) == {'before': 7, 'after': 4, 'exec_time': 2, 'timers': 1}
+
+
+def test_timer_group_in_network(tmp_path):
+    sources = {'Sensor': SENSOR.replace('        self.clock.setDelay(5)\n', ''), 'Estimator': ESTIMATOR}
+    obj = translator(tmp_path, sources=sources, reduceClocks=True)
+    out = io.StringIO()
+    obj.merge_xta(out)
+    text = out.getvalue()
+    assert 'process timer_group_1000(intq &port_0, intq &port_1) {' in text
+    assert 'assign push(port_0), push(port_1), counter = 0;' in text
+    assert 'timer_group_1000_clock = timer_group_1000(%s_q, %s_q);' % tuple(CLOCKS) in text
+    for timer in CLOCKS:
+        assert '%s = timer_port(' % timer not in text
+    # every component reads exec_time, the two sensor clocks share one
+    assert obj.clockReport == {'before': 7, 'after': 6, 'exec_time': 0, 'timers': 1}
@@ -0,0 +1,41 @@
+from committedchains import merge_edges, compress_committed
+
+
+def chain(edges, committed):
+    locations = [{'id': 'idle', 'init': True}] + [{'id': loc} for loc in committed] + [{'id': 'done'}]
+    return {'locations': locations, 'committed': list(committed), 'edges': edges}
+
+
+def test_merge_edges():
+    assert merge_edges({'source': 'a', 'target': 'b', 'assign': 'x = 1'}, {'source': 'b', 'target': 'c', 'assign': 'y = 2'}) == \
+        {'source': 'a', 'target': 'c', 'assign': 'x = 1, y = 2'}
+    assert merge_edges({'source': 'a', 'target': 'b', 'guard': 'x > 0'}, {'source': 'b', 'target': 'c', 'sync': 'go!'}) == \
+        {'source': 'a', 'target': 'c', 'guard': 'x > 0', 'sync': 'go!'}
+    # two synchronisations, or a guard behind an assignment
+    assert merge_edges({'source': 'a', 'target': 'b', 'sync': 'go!'}, {'source': 'b', 'target': 'c', 'sync': 'done!'}) is None
+    assert merge_edges({'source': 'a', 'target': 'b', 'assign': 'x = 1'}, {'source': 'b', 'target': 'c', 'guard': 'x > 0'}) is None
+    assert merge_edges({'source': 'a', 'target': 'b', 'assign': 'x = 1'}, {'source': 'b', 'target': 'c', 'sync': 'go!'}) is None
+
+
+def test_compress_chain():
+    metadata = chain([{'source': 'idle', 'target': 'c1', 'sync': 'go?'},
+                      {'source': 'c1', 'target': 'c2', 'assign': 'x = 1'},
+                      {'source': 'c2', 'target': 'done', 'assign': 'y = 2'}], ['c1', 'c2'])
+    reduced, removed = compress_committed(metadata)
+    assert removed == 2
+    assert reduced['edges'] == [{'source': 'idle', 'target': 'done', 'sync': 'go?', 'assign': 'x = 1, y = 2'}]
+    assert reduced['committed'] == []
+    assert [loc['id'] for loc in reduced['locations']] == ['idle', 'done']
+    # the input is left alone
+    assert len(metadata['edges']) == 3
+
+
+def test_keep_branching_and_observing_locations():
+    metadata = chain([{'source': 'idle', 'target': 'c1', 'assign': 'x = 1'},
+                      {'source': 'c1', 'target': 'c2', 'guard': 'x > 0'},
+                      {'source': 'c1', 'target': 'done', 'guard': 'x <= 0'},
+                      {'source': 'c2', 'target': 'done', 'sync': 'go!'}], ['c1', 'c2'])
+    reduced, removed = compress_committed(metadata)
+    assert removed == 1
+    assert reduced['committed'] == ['c1']
+    assert {'source': 'c1', 'target': 'done', 'guard': 'x > 0', 'sync': 'go!'} in reduced['edges']
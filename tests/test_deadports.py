@@ -0,0 +1,47 @@
+from deadports import message_index, unconnected_ports, dead_ports
+from demo import MODEL, ACTORS
+
+
+def unconnected(actors, codeMetadata={}):
+    return unconnected_ports(MODEL, actors, message_index(MODEL, actors), codeMetadata)
+
+
+def test_message_index_by_channel():
+    index = message_index(MODEL, ACTORS)
+    assert index['SensorQuery']['send'] == [('h1', 'EstActor', 'est', 'query')]
+    assert index['SensorQuery']['listen'] == [('h1', 'SensorActor', 'sensor', 'request'), ('h2', 'SensorActor', 'sensor', 'request')]
+    assert index['SensorValue']['listen'] == [('h1', 'EstActor', 'est', 'query')]
+    assert index['h3_Lonely'] == {'send': [('h3', 'Idle', 'u', 'loc')], 'listen': []}
+
+
+def test_unconnected_publisher():
+    assert unconnected(ACTORS) == [('h3', 'Idle', 'u', 'loc', 'nothing listens on h3_Lonely')]
+
+
+def test_sporadic_timer_never_launched():
+    codeMetadata = {'Estimator': {'port_calls': [{'kind': 'launch', 'name': 'wakeup', 'function': 'on_wakeup'}]}}
+    assert ('h1', 'EstActor', 'est', 'wakeup', 'sporadic timer never launched') in unconnected(ACTORS, codeMetadata)
+    codeMetadata = {'Estimator': {'port_calls': [{'kind': 'launch', 'name': 'wakeup', 'function': 'on_ready'}]}}
+    assert [item for item in unconnected(ACTORS, codeMetadata) if item[3] == 'wakeup'] == []
+
+
+def test_subscriber_fed_by_request():
+    actors = {
+        'AskActor': {'comps': [{'inst': 'a', 'type': 'Asker'}], 'target': ['h1']},
+        'SnoopActor': {'comps': [{'inst': 's', 'type': 'Snoop'}], 'target': ['h2']},
+    }
+    assert unconnected(actors) == []
+
+
+def test_port_does_not_connect_to_itself():
+    actors = {'AskActor': {'comps': [{'inst': 'a', 'type': 'Asker'}], 'target': ['h1']}}
+    assert unconnected(actors) == [('h1', 'AskActor', 'a', 'ask', 'nothing listens on Question, nothing sends on Answer')]
+
+
+def test_dead_only_when_unconnected_everywhere():
+    actors = dict(ACTORS, Other={'comps': [{'inst': 'u', 'type': 'Unused'}], 'target': ['h4']},
+                  Reader={'comps': [{'inst': 'r', 'type': 'Snoop'}], 'target': []})
+    assert dead_ports(MODEL, actors, unconnected(actors)) == {'Unused': ['loc']}
+    sensorOnly = {'SensorActor': ACTORS['SensorActor']}
+    dead = dead_ports(MODEL, sensorOnly, unconnected(sensorOnly))
+    assert dead == {'Sensor': ['ready', 'request']}
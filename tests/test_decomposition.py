@@ -0,0 +1,40 @@
+import os
+from decomposition import interaction_groups, group_actor_map
+from demo import MODEL, ACTORS, translator
+
+
+def test_groups_of_demo():
+    assert interaction_groups(MODEL, ACTORS) == [[('h1', 'SensorActor'), ('h2', 'SensorActor'), ('h1', 'EstActor')], [('h3', 'Idle')]]
+
+
+def test_local_channels_split_hosts():
+    actors = {'Idle': {'comps': [{'inst': 'u', 'type': 'Unused'}], 'target': ['h3', 'h4']}}
+    assert interaction_groups(MODEL, actors) == [[('h3', 'Idle')], [('h4', 'Idle')]]
+
+
+def test_request_links_subscriber():
+    actors = {
+        'AskActor': {'comps': [{'inst': 'a', 'type': 'Asker'}], 'target': ['h1']},
+        'SnoopActor': {'comps': [{'inst': 's', 'type': 'Snoop'}], 'target': ['h2']},
+    }
+    assert interaction_groups(MODEL, actors) == [[('h1', 'AskActor'), ('h2', 'SnoopActor')]]
+
+
+def test_group_actor_map_keeps_other_actors_without_hosts():
+    result = group_actor_map(ACTORS, [('h2', 'SensorActor'), ('h3', 'Idle')])
+    assert result['SensorActor']['target'] == ['h2']
+    assert result['Idle']['target'] == ['h3']
+    assert result['EstActor']['target'] == []
+    assert result['EstActor']['comps'] == ACTORS['EstActor']['comps']
+
+
+def test_parts_have_private_handshakes(tmp_path):
+    obj = translator(tmp_path)
+    obj.decompose()
+    text = open(os.path.join(str(tmp_path), 'Demo_part1.xta')).read()
+    assert 'urgent chan executehandler;' not in text
+    for inst in ['h1_SensorActor_sensor', 'h2_SensorActor_sensor', 'h1_EstActor_est']:
+        assert 'urgent chan %s_executehandler, %s_handlerexit;' % (inst, inst) in text
+        handshake = '%s_socket, %s_executehandler, %s_handlerexit,' % (inst, inst, inst)
+        # the component and its scheduler get the same pair
+        assert len([line for line in text.splitlines() if line.startswith(inst) and handshake in line]) == 2
@@ -0,0 +1,75 @@
+import io
+from modelstats import ModelStats, format_stats
+from demo import translator
+
+
+def render_stats(folder, **options):
+    obj = translator(folder, collectStats=True, **options)
+    out = io.StringIO()
+    obj.merge_xta(out)
+    return obj, out.getvalue(), obj.modelStats
+
+
+def test_default_counts(tmp_path):
+    obj, text, stats = render_stats(tmp_path)
+    totals = stats['totals']
+    assert (totals['processes'], totals['locations'], totals['edges']) == (14, 74, 102)
+    # global_time, one per timer port and one per component instance
+    assert totals['clocks'] == 7
+    assert stats['globals']['clocks'] == 1
+    assert totals['channels'] == stats['globals']['channels'] == 31
+    assert totals['zone_bytes'] == 4*8**2
+    assert stats['templates']['Sensor']['instances'] == 2
+    assert (stats['templates']['Estimator']['locations'], stats['templates']['Estimator']['edges']) == (19, 23)
+    # the array model stores DEFAULT_QUEUE_SIZE items per queue
+    assert totals['queues'] == 10
+    assert set(queue['size'] for queue in stats['queues'].values()) == {10}
+    assert stats['scalars'] == {}
+
+
+def test_counter_queue_sizes(tmp_path):
+    obj, text, stats = render_stats(tmp_path, queueModel='counter')
+    assert 'typedef struct { int[0,10] curr_size; int id;} intq;' in text
+    assert set(queue['size'] for queue in stats['queues'].values()) == {10}
+    assert stats['instances']['h1_SensorActor_sensorScheduler']['queues'] == {
+        'h1_SensorActor_sensor_clock_q': 10, 'h1_SensorActor_sensor_ready_q': 10, 'h1_SensorActor_sensor_request_q': 10}
+
+
+def test_bounded_queue_sizes(tmp_path):
+    obj, text, stats = render_stats(tmp_path, queueBounds=True)
+    capacities = obj.queue_capacities()
+    # the sizes come from the capacity table, not from the struct
+    for queue in stats['queues'].values():
+        assert queue['size'] == capacities[queue['id']]
+    assert stats['queues']['h1_SensorActor_sensor_ready_q']['size'] == 1
+    assert stats['queues']['h1_EstActor_est_ready_q']['size'] == 10
+    assert (stats['totals']['locations'], stats['totals']['clocks'], stats['totals']['channels']) == (74, 7, 31)
+
+
+def test_symmetric_counts(tmp_path):
+    obj, text, stats = render_stats(tmp_path, symmetry=True)
+    assert stats['scalars'] == {'SensorActor_id': 2}
+    assert stats['instances']['SensorActor_sensor']['count'] == 2
+    assert stats['templates']['Sensor']['instances'] == 2
+    # the replicas are still counted as processes
+    assert (stats['totals']['processes'], stats['totals']['locations'], stats['totals']['edges']) == (14, 74, 102)
+    assert stats['totals']['clocks'] == 7
+    # the two ready channels of the sensors become one SensorActor indexed array
+    assert stats['totals']['channels'] == 30
+    assert stats['queues']['SensorActor_sensor_ready_q']['count'] == 2
+    assert stats['totals']['queues'] == 10
+
+
+def test_stats_of_a_small_network():
+    stats = ModelStats()
+    for chunk in ['const int N = 3;\nclock x, y;\nurgent chan a[N];\nint[0,N] v;\n',
+                  'process P(int &s) {\nclock c;\nstate\n  idle, busy;\ncommit\n  busy;\ninit\n  idle;\ntrans\n',
+                  '  idle -> busy { sync a[0]!; },\n  busy -> idle { };\n}\nsystem P;\n']:
+        stats.write(chunk)
+    report = stats.report()
+    assert report['globals']['variables']['v']['range'] == [0, 3]
+    assert report['totals']['clocks'] == 3
+    assert report['totals']['channels'] == 3
+    assert (report['totals']['locations'], report['totals']['committed'], report['totals']['edges']) == (2, 1, 2)
+    assert format_stats(report).splitlines()[-1] == 'state vector: about %d bytes, %d of them for the clock zone' % (
+        report['totals']['state_bytes'], 4*4**2)
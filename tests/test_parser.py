@@ -0,0 +1,143 @@
+import io
+import json
+import os
+import sys
+import types
+import pytest
+import parser
+import pythoncfg
+from cachestore import CacheStore, file_hash
+from demo import translator
+
+
+def cache_entries(folder):
+    directory = os.path.join(str(folder), '.riaps2uppaal', 'components')
+    return [json.load(open(os.path.join(directory, name))) for name in sorted(os.listdir(directory)) if name.endswith('.json')]
+
+
+def test_no_dot_by_default(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(pythoncfg, 'to_dot', lambda *args: calls.append(args))
+    obj = translator(tmp_path)
+    assert calls == []
+    assert obj.g == []
+    entries = cache_entries(tmp_path)
+    assert len(entries) == 2
+    assert all('dot' not in entry for entry in entries)
+
+
+def test_dot_on_request(tmp_path):
+    translator(tmp_path)
+    # the cached translations have no graph, so they are not used
+    obj = translator(tmp_path, generate=False)
+    obj.generate_cfg(dot=True)
+    assert len(obj.g) == 2
+    assert all(graph.startswith('strict digraph') for graph in obj.g)
+
+
+def render(obj):
+    out = io.StringIO()
+    obj.merge_xta(out)
+    return out.getvalue()
+
+
+def test_bounds_size_the_queues(tmp_path):
+    obj = translator(tmp_path, queueBounds=True)
+    text = render(obj)
+    capacities = obj.queue_capacities()
+    assert 'const int capacity[%d] = { %s };' % (len(capacities), ', '.join(map(str, capacities))) in text
+    # the array model would give every queue the items of the largest
+    assert 'typedef struct { int[0,%d] curr_size; int id;} intq;' % max(capacities) in text
+    assert 'intq h1_EstActor_est_ready_q = {0,7};' in text
+    assert obj.queueModel == 'counter'
+
+
+def test_model_files_follow_imports(tmp_path):
+    tmp_path.joinpath('lib').mkdir()
+    tmp_path.joinpath('Demo.riaps').write_text('import "lib/messages.riaps";\napp Demo {}\n')
+    tmp_path.joinpath('lib', 'messages.riaps').write_text("import '../Demo.riaps'\nimport missing.riaps\nmessage M;\n")
+    files = parser.model_files(str(tmp_path.joinpath('Demo.riaps')))
+    assert [name for name, digest in files] == ['Demo.riaps', os.path.join('lib', 'messages.riaps'), os.path.join('lib', 'missing.riaps')]
+    assert files[-1][1] is None
+    assert files[1][1] == file_hash(str(tmp_path.joinpath('lib', 'messages.riaps')))
+
+
+def test_model_cache_follows_imports(tmp_path, monkeypatch):
+    tmp_path.joinpath('Demo.riaps').write_text('import "messages.riaps";\napp Demo {}\n')
+    tmp_path.joinpath('messages.riaps').write_text('message M;\n')
+    obj = translator(tmp_path, generate=False)
+    key = CacheStore.key(pythoncfg.__version__, parser.model_files(str(tmp_path.joinpath('Demo.riaps'))), parser.grammar_hashes())
+    obj.modelCache.put(key, {'appName': 'Demo', 'actorMap': {}, 'localMsgTypes': [], 'modelData': {'M': {'ports': {}}}})
+    obj.parse_model()
+    assert obj.modelData == {'M': {'ports': {}}}
+    # a change to an imported file is a miss and compiles the model again
+    compiled = []
+    lang = types.ModuleType('riaps.lang.lang')
+    lang.compileModel = lambda path: compiled.append(path) or {}
+    monkeypatch.setitem(sys.modules, 'riaps', types.ModuleType('riaps'))
+    monkeypatch.setitem(sys.modules, 'riaps.lang', types.ModuleType('riaps.lang'))
+    monkeypatch.setitem(sys.modules, 'riaps.lang.lang', lang)
+    tmp_path.joinpath('messages.riaps').write_text('message N;\n')
+    # the stand-in compiles no application
+    with pytest.raises(IndexError):
+        obj.parse_model()
+    assert compiled == [str(tmp_path.joinpath('Demo.riaps'))]
+
+
+DEPLOYMENTS = {'v1.depl': [('SensorActor', ['h1', 'h2']), ('EstActor', ['h1']), ('Idle', ['h3'])],
+               'v2.depl': [('SensorActor', ['h1']), ('EstActor', ['h2'])]}
+
+
+class DeploymentModel:
+    def __init__(self, path):
+        self.name = os.path.basename(path)
+
+    def getDeployments(self):
+        return [{'actors': [{'name': actorName}], 'target': hosts} for actorName, hosts in DEPLOYMENTS[self.name]]
+
+
+def fake_depl(folder, monkeypatch):
+    for name in DEPLOYMENTS:
+        folder.joinpath(name).write_text(repr(DEPLOYMENTS[name]))
+    depl = types.ModuleType('riaps.lang.depl')
+    depl.DeploymentModel = DeploymentModel
+    monkeypatch.setitem(sys.modules, 'riaps', types.ModuleType('riaps'))
+    monkeypatch.setitem(sys.modules, 'riaps.lang', types.ModuleType('riaps.lang'))
+    monkeypatch.setitem(sys.modules, 'riaps.lang.depl', depl)
+
+
+def test_sweep_writes_every_deployment(tmp_path, monkeypatch, capsys):
+    fake_depl(tmp_path, monkeypatch)
+    obj = translator(tmp_path, reduceClocks=True, collectStats=True)
+    rows = obj.sweep(['v1.depl', 'v2.depl'], parallel='thread', workers=2)
+    assert [row['deployment'] for row in rows] == ['v1.depl', 'v2.depl']
+    assert [(row['hosts'], row['instances']) for row in rows] == [(3, 4), (2, 2)]
+    texts = []
+    for row, name in zip(rows, ['Demo_v1.xta', 'Demo_v2.xta']):
+        assert row['xta'] == os.path.join(str(tmp_path), name)
+        texts.append(open(row['xta']).read())
+    assert 'h2_SensorActor_sensor = Sensor(' in texts[0] and 'h2_EstActor_est = Estimator(' in texts[1]
+    assert 'h2_EstActor_est' not in texts[0] and 'h2_SensorActor_sensor' not in texts[1]
+    # every deployment brings back the reports of its own network
+    assert rows[0]['reports']['clocks']['before'] > rows[1]['reports']['clocks']['before']
+    assert rows[1]['reports']['stats']['templates']['Sensor']['instances'] == 1
+    statsJson = str(tmp_path.joinpath('stats.json'))
+    for row in rows:
+        parser.print_reports(row['reports'], True, statsJson, row['deployment'])
+    err = capsys.readouterr().err
+    assert 'v1.depl: clocks: ' in err and 'v2.depl: clocks: ' in err
+    assert json.load(open(str(tmp_path.joinpath('stats_v2.json'))))['totals'] == rows[1]['reports']['stats']['totals']
+    assert os.path.exists(str(tmp_path.joinpath('stats_v1.json')))
+
+
+def test_single_run_reports_like_a_sweep(tmp_path, monkeypatch, capsys):
+    fake_depl(tmp_path, monkeypatch)
+    obj = translator(tmp_path, generate=False, reduceClocks=True)
+    obj.actorMap = {actorName: {'comps': actorObj['comps']} for actorName, actorObj in obj.actorMap.items()}
+    obj.parse_depl('v2.depl')
+    obj.generate_cfg()
+    obj.merge_xta()
+    single = obj.reports()
+    row = translator(tmp_path, reduceClocks=True).sweep(['v2.depl'], parallel=None)[0]
+    assert single['clocks'] == row['reports']['clocks']
+    assert open(obj.xtaFile).read() == open(row['xta']).read()
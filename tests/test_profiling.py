@@ -0,0 +1,44 @@
+import json
+import threading
+import profiling
+from demo import translator
+
+PHASES = ['translate_component', 'PyCFG.gen_cfg', 'horast.parse', 'PyCFG.walk', 'PyCFG.link_functions', 'add_riaps_ports']
+
+
+def profiled_trace(folder, monkeypatch, parallel=None):
+    profiler = profiling.Profiler()
+    monkeypatch.setattr(profiling, '_profiler', profiler)
+    try:
+        obj = translator(folder, generate=False)
+        assert obj.profiler is profiler
+        obj.generate_cfg(parallel=parallel, workers=2)
+        path = str(folder.joinpath('trace.json'))
+        profiler.write_trace(path)
+    finally:
+        profiler.close()
+    with open(path) as f:
+        return json.load(f)['traceEvents']
+
+
+def test_trace_has_the_phases(tmp_path, monkeypatch):
+    events = profiled_trace(tmp_path, monkeypatch)
+    assert events[0]['name'] == 'generate_cfg'
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
+    for component in ['Sensor', 'Estimator']:
+        names = [event['name'] for event in events if event['args'].get('component') == component]
+        assert [name for name in PHASES if name in names] == PHASES
+        outer = [event for event in events if event['name'] == 'translate_component' and event['cat'] == component][0]
+        for event in events:
+            if event['args'].get('component') == component:
+                assert outer['ts'] <= event['ts'] <= outer['ts'] + outer['dur']
+    assert all('peak_bytes' in event['args'] for event in events)
+
+
+def test_worker_threads_record_no_peak(tmp_path, monkeypatch):
+    events = profiled_trace(tmp_path, monkeypatch, parallel='thread')
+    main = threading.get_ident()
+    workers = [event for event in events if event['tid'] != main]
+    assert set(event['args']['component'] for event in workers) == {'Sensor', 'Estimator'}
+    assert [event for event in workers if 'peak_bytes' in event['args']] == []
+    assert 'peak_bytes' in [event for event in events if event['name'] == 'generate_cfg'][0]['args']
@@ -0,0 +1,201 @@
+import copy
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+
+import pythoncfg
+
+RELAY_DEVICE = '''from riaps.run.comp import Component
+import random
+
+class RelayDevice(Component):
+    def __init__(self, base, dev):
+        super(RelayDevice, self).__init__()
+        self.base = base
+        self.dev = dev
+        self.period = None
+
+    def on_delay(self):
+        now = self.delay.recv_pyobj()
+        # ta: add time 2 4
+        msg = (random.randint(0, 1), now)
+        self.SendRelayStatus.send_pyobj(msg)
+        self.period = self.base
+        self.delay.setDelay(5)
+        if self.dev < self.base:
+            self.helper()
+        self.delay.launch()
+
+    def helper(self):
+        self.SendRelayStatus.send_pyobj('test')
+'''
+
+PORT_DATA = {'RelayDevice': {'ports': {'SendRelayStatus': {'type': 'pub', 'msgtype': ['RelayStatus'], 'msgscope': 'global'},
+                                       'delay': {'type': 'tim', 'period': 5000, 'timertype': 'periodic'}}}}
+
+
+def component(tmp_path):
+    path = tmp_path / 'RelayDevice.py'
+    path.write_text(RELAY_DEVICE)
+    return str(path)
+
+
+def test_compute_flow_on_component(tmp_path):
+    cfg, dom, pdom = pythoncfg.compute_flow(component(tmp_path), port_data=copy.deepcopy(PORT_DATA))
+    assert set(dom) == set(cfg) and set(pdom) == set(cfg)
+    for n in cfg:
+        assert n in dom[n] and n in pdom[n]
+
+
+def test_dominator_tree_on_handler(tmp_path):
+    cfg, first, last = pythoncfg.get_cfg(component(tmp_path), copy.deepcopy(PORT_DATA))
+    dom = pythoncfg.DominatorTree(cfg, start=11)
+    # both branches of the if on line 19 join again at the launch on line 20
+    assert dom.idom(12) == 11 and dom.idom(20) == 19 and dom.idom(22) == 19
+    assert dom.dominates(11, 23) and not dom.dominates(22, 20)
+    pdom = pythoncfg.DominatorTree(cfg, start=20, key='children')
+    assert pdom.idom(19) == 20 and pdom.idom(23) == 22
+
+
+def test_dominator_tree_asymmetric_edges():
+    # 2 lists 1 as child, 1 does not list 2 as parent
+    g = {0: {'parents': set(), 'children': {1}},
+         1: {'parents': {0}, 'children': {2}},
+         2: {'parents': set(), 'children': set()}}
+    tree = pythoncfg.DominatorTree(g, start=0)
+    assert tree.idom(2) == 1 and tree.idom(1) == 0
+    post = pythoncfg.DominatorTree(g, start=2, key='children')
+    assert post.idom(1) == 2 and post.idom(0) == 1
+
+
+def test_get_cfg_without_port_data(tmp_path):
+    cfg, first, last = pythoncfg.get_cfg(component(tmp_path))
+    assert {11, 12, 20, 22} <= set(cfg)
+    plain = tmp_path / 'plain.py'
+    plain.write_text('def f(x):\n    if x:\n        return 1\n    return 2\n\nprint(f(3))\n')
+    cfg, first, last = pythoncfg.get_cfg(str(plain))
+    assert cfg[3]['children'] == {1, 4}
+
+
+def test_json_export(tmp_path):
+    path = component(tmp_path)
+    out = subprocess.run([sys.executable, pythoncfg.__file__, '-j', path], capture_output=True, text=True, check=True).stdout
+    graph = json.loads(out)
+    ids = set(node[0] for node in graph['nodes'])
+    assert graph['edges'] and all(src in ids and dst in ids for src, dst, attrs in graph['edges'])
+    assert any(line == 20 and text == 'self.delay.launch()' for rid, line, text in graph['nodes'])
+    # with coverage arcs every edge is coloured
+    arcs = tmp_path / 'arcs.json'
+    arcs.write_text(json.dumps([[19, 20], [20, 11]]))
+    out = subprocess.run([sys.executable, pythoncfg.__file__, '-j', path, '-y', str(arcs)], capture_output=True, text=True, check=True).stdout
+    colours = set(attrs.get('color') for src, dst, attrs in json.loads(out)['edges'])
+    assert 'green' in colours and 'red' in colours
+
+
+def test_dot_and_json_agree(tmp_path):
+    cfg = pythoncfg.PyCFG()
+    cfg.gen_cfg(RELAY_DEVICE.strip(), copy.deepcopy(PORT_DATA))
+    out = io.StringIO()
+    pythoncfg.write_json(cfg.ctx.cache, out)
+    edges = set((src, dst) for src, dst, attrs in json.loads(out.getvalue())['edges'])
+    dot = pythoncfg.to_dot(cfg.ctx.cache)
+    assert edges == set((int(src), int(dst)) for src, dst in re.findall(r'(\d+) -> (\d+)', dot))
+
+
+def test_translation_does_not_import_pygraphviz():
+    script = ('import sys, pythoncfg\n'
+              'pythoncfg.translate_component("RelayDevice", %r, %r)\n'
+              'assert "pygraphviz" not in sys.modules\n' % (RELAY_DEVICE.strip(), PORT_DATA))
+    subprocess.run([sys.executable, '-c', script], check=True, cwd=os.path.dirname(pythoncfg.__file__))
+
+
+def test_long_elif_chain():
+    src = 'x = 1\nif x == 0:\n    y = 0\n' + ''.join('elif x == %d:\n    y = %d\n' % (i, i) for i in range(1, 1000)) + 'else:\n    y = -1\n'
+    cfg = pythoncfg.PyCFG()
+    cfg.gen_cfg(src)
+    # raised for good, never toggled per parse
+    assert sys.getrecursionlimit() >= pythoncfg.PARSE_RECURSION_LIMIT
+    assert len(cfg.ctx.cache) > 2000
+
+
+def test_recursion_limit_is_never_lowered():
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(pythoncfg.PARSE_RECURSION_LIMIT + 1)
+    try:
+        pythoncfg.raise_recursion_limit()
+        assert sys.getrecursionlimit() == pythoncfg.PARSE_RECURSION_LIMIT + 1
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+EARLY_RETURN = '''from riaps.run.comp import Component
+
+class RelayDevice(Component):
+    def __init__(self):
+        super(RelayDevice, self).__init__()
+
+    def on_delay(self):
+        now = self.delay.recv_pyobj()
+        if now is None:
+            return now
+        # ta: add time 2 4
+        self.SendRelayStatus.send_pyobj(now)
+'''
+
+
+def test_coverage_prunes_statements_that_never_ran():
+    cfg = pythoncfg.PyCFG()
+    cfg.gen_cfg(EARLY_RETURN, copy.deepcopy(PORT_DATA), {1, 3, 4, 5, 7, 8, 9, 10})
+    # the send after the early return goes together with its timing
+    assert [loc['id'] for loc in cfg.code_metadata['locations']] == ['ready_4', 'on_delay_7', 'pre_recv_8', 'post_recv_8', 'blocking_8']
+    assert ('post_recv_8', 'ready_4') in [(edge['source'], edge['target']) for edge in cfg.code_metadata['edges']]
+    assert [call['kind'] for call in cfg.code_metadata['port_calls']] == ['recv']
+
+
+def test_coverage_keeps_handlers_that_never_ran():
+    full = pythoncfg.PyCFG()
+    full.gen_cfg(EARLY_RETURN, copy.deepcopy(PORT_DATA))
+    cfg = pythoncfg.PyCFG()
+    cfg.gen_cfg(EARLY_RETURN, copy.deepcopy(PORT_DATA), {1, 3, 4, 5})
+    assert cfg.unrun_handlers == {'on_delay'}
+    assert cfg.code_metadata == full.code_metadata
+    assert 'user_op_11' in [loc['id'] for loc in cfg.code_metadata['locations']]
+
+
+def graph(cfg):
+    nodes = {}
+    for rid, node in cfg.ctx.cache.items():
+        # the id sets always follow the lists
+        assert node.parent_ids == set(p.rid for p in node.parents)
+        assert node.child_ids == set(c.rid for c in node.children)
+        nodes[rid] = ([p.rid for p in node.parents], [c.rid for c in node.children], node.lineno())
+    return nodes
+
+
+def test_round_trip_of_the_demo_component(tmp_path):
+    from demo import translator, SENSOR, MODEL
+    cfg = pythoncfg.PyCFG()
+    cfg.gen_cfg(SENSOR, copy.deepcopy({'Sensor': MODEL['Sensor']}))
+    before = graph(cfg)
+    metadata = copy.deepcopy(cfg.code_metadata)
+    cfg.drop_ast(keep_source=True)
+    assert graph(cfg) == before
+    assert all(node.ast_node is None for node in cfg.ctx.cache.values())
+    rebuilt = pythoncfg.PyCFG.from_metadata(metadata, {'Sensor': MODEL['Sensor']})
+    assert rebuilt.code_metadata == cfg.code_metadata
+    # the network is the same from the AST, without it and from the cache
+    texts = []
+    for options, keepAst in [(dict(useCache=False), True), (dict(useCache=False), False), ({}, True), ({}, True)]:
+        obj = translator(tmp_path, generate=False, **options)
+        obj.generate_cfg(keepAst=keepAst)
+        out = io.StringIO()
+        obj.merge_xta(out)
+        texts.append(out.getvalue())
+        if not keepAst:
+            assert all(node.ast_node is None for node in obj.cfg['Sensor'].ctx.cache.values())
+    assert texts[0] == texts[1] == texts[2] == texts[3]
+    # the last translation was rebuilt from the cached metadata
+    assert obj.cfg['Sensor'].ctx is None
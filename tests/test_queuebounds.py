@@ -0,0 +1,67 @@
+from fractions import Fraction
+from parser import riaps2uppaal, DEFAULT_QUEUE_SIZE
+from queuebounds import QueueBounds, handler_summary, infer_queue_bounds
+from demo import MODEL, ACTORS, CODE
+
+SENSOR = ('h1', 'SensorActor', 'sensor', 'Sensor')
+ESTIMATOR = ('h1', 'EstActor', 'est', 'Estimator')
+
+
+def test_handler_summary():
+    summary = handler_summary(CODE['Estimator'])
+    assert summary['on_ready'] == {'wcet': 30, 'send': {'query': 1}, 'launch': {}, 'blocks': False}
+    assert summary['on_query'] == {'wcet': 10, 'send': {}, 'launch': {}, 'blocks': False}
+
+
+def test_curves():
+    bounds = QueueBounds(MODEL, ACTORS, CODE)
+    # ready is resolved first, through the sensors' handlers, which also
+    # reply to the estimator's requests: no cycle as long as only the ports
+    # on the way are followed
+    assert bounds.curve(ESTIMATOR, 'ready') == (2, Fraction(2, 1000))
+    assert bounds.curve(SENSOR, 'clock') == (1, Fraction(1, 1000))
+    assert bounds.curve(SENSOR, 'request') == (2, Fraction(2, 1000))
+    # both sensors reply to every request
+    assert bounds.curve(ESTIMATOR, 'query') == (4, Fraction(4, 1000))
+
+
+def test_bounds():
+    bounds = QueueBounds(MODEL, ACTORS, CODE)
+    assert bounds.batch_time('Sensor') == 30
+    assert bounds.batch_time('Estimator') == 40
+    # burst + 2*rate*batch
+    assert bounds.bound(SENSOR, 'clock') == 2
+    assert bounds.bound(ESTIMATOR, 'ready') == 3
+    assert bounds.bound(SENSOR, 'request') == 3
+    assert bounds.bound(ESTIMATOR, 'query') == 5
+    # no CFG for Unused
+    assert bounds.bound(('h3', 'Idle', 'u', 'Unused'), 'loc') is None
+
+
+def test_cycle_has_no_bound():
+    model = {'Echo': {'ports': {
+        'hear': {'type': 'sub', 'msgtype': ['Ping'], 'msgscope': 'global'},
+        'say': {'type': 'pub', 'msgtype': ['Ping'], 'msgscope': 'global'},
+    }}}
+    code = {'Echo': {'locations': [{'id': 'on_hear_10'}, {'id': 'user_op_11', 'max': 1}],
+                     'port_calls': [{'function': 'on_hear', 'kind': 'send', 'name': 'say'}]}}
+    actors = {'EchoActor': {'comps': [{'inst': 'e', 'type': 'Echo'}], 'target': ['h1']}}
+    assert infer_queue_bounds(model, actors, code) == {'h1_EchoActor_e_hear_q': None, 'h1_EchoActor_e_say_q': 1}
+
+
+def test_overloaded_queue_has_no_bound():
+    model = {'Busy': {'ports': {'tick': {'type': 'tim', 'period': 10, 'timertype': 'periodic'}}}}
+    code = {'Busy': {'locations': [{'id': 'on_tick_10'}, {'id': 'user_op_11', 'max': 2}]}}
+    actors = {'BusyActor': {'comps': [{'inst': 'b', 'type': 'Busy'}], 'target': ['h1']}}
+    assert infer_queue_bounds(model, actors, code) == {'h1_BusyActor_b_tick_q': None}
+
+
+def test_capacities_fall_back_to_default(tmp_path):
+    obj = riaps2uppaal(str(tmp_path), 'Demo', useCache=False, queueBounds=True)
+    obj.modelData = MODEL
+    obj.actorMap = ACTORS
+    obj.cfg = {compType: type('cfg', (), {'code_metadata': code}) for compType, code in CODE.items()}
+    # id 0 is unused, then the clock, ready and request queues of both
+    # sensors, ready, query and wakeup of the estimator, and loc of Idle,
+    # which has no CFG and so no bound
+    assert obj.queue_capacities() == [0, 2, 1, 3, 2, 1, 3, 3, 5, 1, DEFAULT_QUEUE_SIZE]
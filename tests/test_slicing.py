@@ -0,0 +1,32 @@
+import types
+import pytest
+from parser import riaps2uppaal
+from slicing import influence_graph, query_seeds, cone_of_influence
+from demo import MODEL, ACTORS
+
+
+def test_influence_graph():
+    graph = influence_graph(MODEL, ACTORS)
+    assert graph[('h1', 'EstActor')] == {('h1', 'SensorActor'), ('h2', 'SensorActor')}
+    assert graph[('h1', 'SensorActor')] == {('h1', 'EstActor')}
+    assert graph[('h3', 'Idle')] == set()
+
+
+def test_query_seeds():
+    assert query_seeds('A[] not h1_EstActor_est.user_op_17', MODEL, ACTORS) == {('h1', 'EstActor')}
+    assert query_seeds('E<> SensorQuery_value > 0', MODEL, ACTORS) == {('h1', 'EstActor')}
+    assert query_seeds('SensorActor_sensorScheduler.idle', MODEL, ACTORS) == {('h1', 'SensorActor'), ('h2', 'SensorActor')}
+    assert query_seeds('A[] not deadlock', MODEL, ACTORS) == set()
+
+
+def test_cone_of_influence():
+    graph = influence_graph(MODEL, ACTORS)
+    assert cone_of_influence(graph, {('h3', 'Idle')}) == {('h3', 'Idle')}
+    assert cone_of_influence(graph, {('h2', 'SensorActor')}) == {('h1', 'SensorActor'), ('h2', 'SensorActor'), ('h1', 'EstActor')}
+
+
+@pytest.mark.parametrize('query', ['A[] not deadlock', 'overflow', 'global_time'])
+def test_slice_query_without_seeds(query):
+    obj = types.SimpleNamespace(modelData=MODEL, actorMap=ACTORS)
+    with pytest.raises(ValueError, match='names no deployed process or variable'):
+        riaps2uppaal.slice_query(obj, query)
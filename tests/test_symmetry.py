@@ -0,0 +1,49 @@
+import copy
+import io
+from demo import MODEL, SENSOR, ESTIMATOR, translator
+
+SOURCES = {'Sensor': SENSOR, 'Estimator': ESTIMATOR}
+
+
+def network(tmp_path, model, actors):
+    obj = translator(tmp_path, actors=actors, generate=False, symmetry=True)
+    obj.modelData = model
+    obj.generate_cfg()
+    out = io.StringIO()
+    obj.merge_xta(out)
+    return obj, out.getvalue()
+
+
+def test_identical_actors_share_a_scalar_set(tmp_path):
+    actors = {
+        'SensorActor': {'comps': [{'inst': 'sensor', 'type': 'Sensor'}], 'target': ['h1']},
+        'OtherSensor': {'comps': [{'inst': 'sensor', 'type': 'Sensor'}], 'target': ['h2']},
+    }
+    obj, text = network(tmp_path, copy.deepcopy(MODEL), actors)
+    assert obj.symmetricClasses == {'SensorActor': [('h1', 'SensorActor'), ('h2', 'OtherSensor')]}
+    assert 'typedef scalar[2] SensorActor_id;' in text
+    assert 'SensorActor_sensor(const SensorActor_id i) = Sensor(' in text
+    assert 'OtherSensor' not in text
+
+
+def test_timer_period_breaks_symmetry(tmp_path):
+    model = copy.deepcopy(MODEL)
+    model['FastSensor'] = copy.deepcopy(model['Sensor'])
+    model['FastSensor']['ports']['clock']['period'] = 500
+    actors = {
+        'SensorActor': {'comps': [{'inst': 'sensor', 'type': 'Sensor'}], 'target': ['h1']},
+        'FastActor': {'comps': [{'inst': 'sensor', 'type': 'FastSensor'}], 'target': ['h2']},
+    }
+    tmp_path.joinpath('FastSensor.py').write_text(SENSOR.replace('Sensor', 'FastSensor'))
+    obj, text = network(tmp_path, model, actors)
+    assert obj.symmetricClasses == {}
+    assert 'scalar' not in text
+    assert 'h1_SensorActor_sensor = Sensor(' in text
+    assert 'h2_FastActor_sensor = FastSensor(' in text
+
+
+def test_signature_compares_ports(tmp_path):
+    obj = translator(tmp_path, generate=False)
+    signature = obj.actor_signature('SensorActor')
+    obj.modelData['Sensor']['ports']['clock']['period'] = 500
+    assert obj.actor_signature('SensorActor') != signature
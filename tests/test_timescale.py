@@ -0,0 +1,51 @@
+from timescale import scale_value, component_constants, model_constants, time_unit, scale_component, scale_model
+from demo import MODEL
+
+COMPONENT = {
+    'locations': [{'id': 'user_op_11', 'inv': 'exec_time <= 250'}],
+    'edges': [{'source': 'user_op_11', 'target': 'done', 'guard': 'exec_time >= 150'},
+              {'source': 'done', 'target': 'idle', 'assign': 'wakeup_delay = 500'}],
+    'local_variables': [{'name': 'period', 'value': 1000}],
+}
+
+
+def test_scale_value():
+    assert scale_value(250, 100, 'up') == 3
+    assert scale_value(250, 100, 'down') == 2
+    assert scale_value(250, 100) == 3
+    assert scale_value(20, 100) == 1
+    assert scale_value(0, 100) == 0
+
+
+def test_time_unit():
+    constants = component_constants(COMPONENT) + model_constants(MODEL)
+    assert sorted(constants) == [0, 150, 250, 500, 1000, 1000]
+    assert time_unit(constants) == 50
+    assert time_unit(constants, 100) == 100
+    assert time_unit([]) == 1
+
+
+def test_scale_component_by_gcd():
+    scaled, error = scale_component(COMPONENT, 50)
+    assert error == 0
+    assert scaled['locations'][0]['inv'] == 'exec_time <= 5'
+    assert scaled['edges'][0]['guard'] == 'exec_time >= 3'
+    assert scaled['edges'][1]['assign'] == 'wakeup_delay = 10'
+    assert scaled['local_variables'] == [{'name': 'period', 'value': 20}]
+    assert COMPONENT['locations'][0]['inv'] == 'exec_time <= 250'
+
+
+def test_scale_component_by_quantum():
+    # upper bounds round up, lower bounds down
+    scaled, error = scale_component(COMPONENT, 100)
+    assert scaled['locations'][0]['inv'] == 'exec_time <= 3'
+    assert scaled['edges'][0]['guard'] == 'exec_time >= 1'
+    assert error == 50
+
+
+def test_scale_model():
+    scaled, error = scale_model(MODEL, 300)
+    assert scaled['Sensor']['ports']['clock']['period'] == 3
+    assert scaled['Estimator']['ports']['wakeup']['period'] == 0
+    assert scaled['Sensor']['ports']['ready'] is MODEL['Sensor']['ports']['ready']
+    assert error == 100
@@ -0,0 +1,93 @@
+import io
+import os
+import pytest
+import parser
+from modelstats import ModelStats
+from xtawriter import XtaWriter, get_environment
+from demo import translator
+
+
+class Failure(Exception):
+    pass
+
+
+def test_failure_leaves_no_partial_file(tmp_path):
+    target = str(tmp_path.joinpath('Demo.xta'))
+    with pytest.raises(Failure):
+        with XtaWriter(target) as writer:
+            writer.write('// half a network\n')
+            raise Failure()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_failure_keeps_the_previous_file(tmp_path):
+    target = tmp_path.joinpath('Demo.xta')
+    target.write_text('// the last good network\n')
+    with pytest.raises(Failure):
+        with XtaWriter(str(target)) as writer:
+            writer.write('// half a network\n')
+            raise Failure()
+    assert os.listdir(str(tmp_path)) == ['Demo.xta']
+    assert target.read_text() == '// the last good network\n'
+
+
+def test_failure_in_generate(tmp_path, monkeypatch):
+    obj = translator(tmp_path)
+    obj.merge_xta()
+    before = open(obj.xtaFile).read()
+    names = sorted(os.listdir(str(tmp_path)))
+
+    def fail(*args):
+        raise Failure()
+
+    def write_xta():
+        obj.xtaWriter.write('// half a network\n')
+        fail()
+    monkeypatch.setattr(obj, 'write_xta', write_xta)
+    with pytest.raises(Failure):
+        obj.merge_xta()
+    assert sorted(os.listdir(str(tmp_path))) == names
+    assert open(obj.xtaFile).read() == before
+    # a template that fails while it is being generated
+    template = get_environment().from_string('{{ fail() }}')
+    with pytest.raises(Failure):
+        with XtaWriter(obj.xtaFile) as writer:
+            writer.render(template, {'fail': fail})
+    assert sorted(os.listdir(str(tmp_path))) == names
+
+
+def test_tee_matches_the_file(tmp_path):
+    target = str(tmp_path.joinpath('Demo.xta'))
+    tee = io.StringIO()
+    with XtaWriter(target, tee=tee) as writer:
+        writer.render(get_environment().get_template('urgentEdge.jinja'))
+        writer.write('// caf\u00e9 \u2264 10\n')
+        writer.write('system TransitionHelper;\n')
+    with open(target, 'rb') as f:
+        assert f.read() == tee.getvalue().encode('utf-8')
+
+
+class Recorder(ModelStats):
+    """
+    Statistics that keep everything they are sent.
+    """
+    def __init__(self):
+        super().__init__()
+        self.text = io.StringIO()
+
+    def write(self, text):
+        self.text.write(text)
+        super().write(text)
+
+
+def test_tee_of_a_network_matches_the_file(tmp_path, monkeypatch):
+    recorders = []
+    monkeypatch.setattr(parser, 'ModelStats', lambda: recorders.append(Recorder()) or recorders[-1])
+    obj = translator(tmp_path, collectStats=True)
+    obj.merge_xta()
+    with open(obj.xtaFile, 'rb') as f:
+        assert f.read() == recorders[0].text.getvalue().encode('utf-8')
+    out = io.StringIO()
+    obj.merge_xta(out)
+    assert out.getvalue() == recorders[1].text.getvalue()
+    assert obj.modelStats['totals']['processes'] == 14
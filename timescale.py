@@ -0,0 +1,114 @@
+"""
+Normalisation of the timing constants of the network.
+
+The clock constants of the network are the bounds on exec_time in the
+invariants and guards of the components, the delays they give their timers,
+and the timer periods. All of them are divided by a common time unit: their
+greatest common divisor, which changes no behaviour, or a time quantum the
+user chooses. Constants a quantum does not divide are rounded so the scaled
+network can only do more: upper bounds up, lower bounds down. Periods and
+delays are rounded to the nearest multiple, but never to zero. No constant
+moves by a quantum or more.
+"""
+
+import copy
+import math
+import re
+from functools import reduce
+
+_bound = re.compile(r'(\bexec_time\s*(<=|<|>=|>|==)\s*)(\d+)')
+_delay = re.compile(r'(\b\w+_delay\s*=\s*)(\d+)')
+# rounding of the bound of each comparison
+ROUNDING = {'<=': 'up', '<': 'up', '>=': 'down', '>': 'down', '==': 'nearest'}
+
+
+def scale_value(value, unit, rounding='nearest'):
+    if rounding == 'up':
+        return -(-value // unit)
+    if rounding == 'down':
+        return value // unit
+    if value == 0:
+        return 0
+    return max(1, (2*value + unit) // (2*unit))
+
+
+def component_constants(codeMetadata):
+    constants = []
+    for loc in codeMetadata['locations']:
+        constants += [int(match[2]) for match in _bound.findall(loc.get('inv', ''))]
+    for edge in codeMetadata['edges']:
+        constants += [int(match[2]) for match in _bound.findall(str(edge.get('guard', '')))]
+        constants += [int(match[1]) for match in _delay.findall(str(edge.get('assign', '')))]
+    constants += [item['value'] for item in codeMetadata.get('local_variables', []) if item['name'] == 'period' and isinstance(item.get('value'), int)]
+    return constants
+
+
+def model_constants(modelData):
+    return [portAttr['period'] for compData in modelData.values() for portAttr in compData['ports'].values()
+            if portAttr['type'] == 'tim' and isinstance(portAttr.get('period'), int)]
+
+
+def time_unit(constants, quantum=None):
+    """
+    The time unit of the scaled network: quantum when given, otherwise the
+    greatest common divisor of the constants.
+    """
+    if quantum is not None:
+        assert quantum > 0, "the time quantum must be positive"
+        return quantum
+    return reduce(math.gcd, constants, 0) or 1
+
+
+class _Scaler:
+    def __init__(self, unit):
+        self.unit = unit
+        self.error = 0
+
+    def value(self, value, rounding='nearest'):
+        scaled = scale_value(value, self.unit, rounding)
+        self.error = max(self.error, abs(scaled*self.unit - value))
+        return scaled
+
+    def bound(self, match):
+        return '%s%d' % (match.group(1), self.value(int(match.group(3)), ROUNDING[match.group(2)]))
+
+    def delay(self, match):
+        return '%s%d' % (match.group(1), self.value(int(match.group(2))))
+
+
+def scale_component(codeMetadata, unit):
+    """
+    Copy of a component's code_metadata with its timing constants in the
+    given unit, and the largest rounding error in the original unit.
+    """
+    scaler = _Scaler(unit)
+    scaled = copy.deepcopy(codeMetadata)
+    for loc in scaled['locations']:
+        if 'inv' in loc:
+            loc['inv'] = _bound.sub(scaler.bound, loc['inv'])
+    for edge in scaled['edges']:
+        if isinstance(edge.get('guard'), str):
+            edge['guard'] = _bound.sub(scaler.bound, edge['guard'])
+        if isinstance(edge.get('assign'), str):
+            edge['assign'] = _delay.sub(scaler.delay, edge['assign'])
+    for item in scaled.get('local_variables', []):
+        if item['name'] == 'period' and isinstance(item.get('value'), int):
+            item['value'] = scaler.value(item['value'])
+    return scaled, scaler.error
+
+
+def scale_model(modelData, unit):
+    """
+    Copy of modelData with its timer periods in the given unit, and the
+    largest rounding error in the original unit.
+    """
+    scaler = _Scaler(unit)
+    scaled = {}
+    for compName, compData in modelData.items():
+        ports = {}
+        for portName, portAttr in compData['ports'].items():
+            if portAttr['type'] == 'tim' and isinstance(portAttr.get('period'), int):
+                portAttr = dict(portAttr, period=scaler.value(portAttr['period']))
+            ports[portName] = portAttr
+        scaled[compName] = dict(compData, ports=ports)
+    return scaled, scaler.error
@@ -0,0 +1,100 @@
+"""
+Buffered writer for generated .xta files.
+
+Templates are rendered chunk by chunk into a single open stream. When the
+target is a path the output goes to a temporary file in the same directory
+which replaces the target only once everything has been written, so a
+failed translation never leaves a half written model behind.
+"""
+
+import os
+import sys
+import tempfile
+from profiling import phase
+
+BUFFER_SIZE = 1 << 16
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+# compiled templates are kept here between runs
+BYTECODE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'riaps2uppaal', 'jinja')
+
+_environment = None
+
+
+def get_environment():
+    """
+    The jinja environment of the xta templates, built on first use. Compiled
+    templates are stored in a bytecode cache so later runs skip compilation.
+    """
+    global _environment
+    if _environment is None:
+        from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+        try:
+            os.makedirs(BYTECODE_DIR, exist_ok=True)
+            bytecodeCache = FileSystemBytecodeCache(BYTECODE_DIR)
+        except OSError:
+            bytecodeCache = None
+        _environment = Environment(loader=FileSystemLoader(TEMPLATE_DIR), bytecode_cache=bytecodeCache)
+    return _environment
+
+
+def precompile_templates():
+    """
+    Compile every template into the bytecode cache ahead of time.
+    """
+    env = get_environment()
+    for name in env.list_templates(extensions=['jinja']):
+        env.get_template(name)
+
+
+class XtaWriter:
+    def __init__(self, target, tee=None):
+        """
+        target is a file name, '-' for stdout or an open text stream such as
+        an io.StringIO. Streams are written to but never closed. Everything
+        written is also passed to tee, an object with a write method, if given.
+        """
+        self.target = target
+        self.tee = tee
+        self.stream = None
+        self.tmpName = None
+
+    def __enter__(self):
+        if self.target == '-':
+            self.stream = sys.stdout
+        elif isinstance(self.target, str):
+            directory = os.path.dirname(os.path.abspath(self.target))
+            fd, self.tmpName = tempfile.mkstemp(dir=directory, prefix='.%s.' % os.path.basename(self.target), suffix='.tmp')
+            self.stream = os.fdopen(fd, 'w', buffering=BUFFER_SIZE)
+        else:
+            self.stream = self.target
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if self.tmpName is None:
+            self.stream.flush()
+            return False
+        self.stream.close()
+        if excType is None:
+            mode = os.stat(self.target).st_mode & 0o777 if os.path.exists(self.target) else 0o644
+            os.chmod(self.tmpName, mode)
+            os.replace(self.tmpName, self.target)
+        else:
+            os.remove(self.tmpName)
+        self.tmpName = None
+        return False
+
+    def write(self, text):
+        self.stream.write(text)
+        if self.tee is not None:
+            self.tee.write(text)
+
+    def render(self, template, args={}):
+        """
+        Stream a jinja template into the output followed by a newline.
+        """
+        write = self.stream.write if self.tee is None else self.write
+        with phase('jinja', template=template.name):
+            for chunk in template.generate(args):
+                write(chunk)
+            write("\n")